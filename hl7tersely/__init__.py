@@ -5,8 +5,10 @@
 """
 
 
-__all__ = ["HL7Parser", "HL7Dict"]
+__all__ = ["HL7Parser", "HL7Dict", "LazyHL7Dict", "CompactHL7Dict"]
 
 from hl7tersely.hl7parser import HL7Parser
 
-from hl7tersely.hl7dict import HL7Dict
\ No newline at end of file
+from hl7tersely.hl7dict import HL7Dict, LazyHL7Dict
+
+from hl7tersely.hl7compact import CompactHL7Dict
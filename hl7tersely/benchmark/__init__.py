@@ -0,0 +1,12 @@
+"""
+Benchmarks of the HL7 parser, on messages built by a seeded generator.
+
+Run all the benchmarks and write the results as JSON :
+    python -m hl7tersely.benchmark --output results.json
+"""
+
+__all__ = ["MessageGenerator", "runBenchmarks", "PROFILES"]
+
+from hl7tersely.benchmark.generator import MessageGenerator
+
+from hl7tersely.benchmark.bench import runBenchmarks, PROFILES
@@ -0,0 +1,4 @@
+from hl7tersely.benchmark.bench import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+r"""Benchmarks of the parser.
+
+For each profile, messages are built by the seeded generator and measured :
+    parse   : throughput of each parse mode (split and fast engines, lazy, compact)
+    instrumentation : parse time with the statistics never enabled, disabled after use, enabled
+    threads : throughput of parseConcurrent, one parser shared by 1 to N threads. The threads scale
+              on a free-threaded Python only (gil_enabled False)
+    lookup  : latency of get and in, of partial tersers, of getSegmentKeys, duration of toJSON
+    memory  : peak of the memory allocated while parsing a message, memory retained by the result
+
+The best time of several runs is kept. The results are a dict, written as JSON by main.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from hl7tersely.benchmark.generator import MessageGenerator
+from hl7tersely.hl7parser import HL7Parser
+
+__version__ = "1.3"
+__all__ = ["runBenchmarks", "PROFILES", "main"]
+
+# shape of the messages, and count of messages measured
+PROFILES = {
+    "adt": {"count": 2000, "shape": dict(segments=6, obx=0, repetitions=2, components=5, subcomponents=2)},
+    "oru": {"count": 200, "shape": dict(segments=60, obx=50, repetitions=3, components=6, subcomponents=2)},
+    "oru_large": {"count": 10, "shape": dict(segments=2500, obx=2000, repetitions=5, components=7, subcomponents=3)},
+    "embedded": {"count": 3, "shape": dict(segments=12, obx=4, embedded_size=4 * 1024 * 1024)},
+}
+
+PARTIAL_TERSERS = ("PID-3", "PID[1]-5", "OBX[1]-3", "OBX", "NTE")
+
+
+def bestTime(function, repeat):
+    """
+        :return: the shortest duration of repeat calls of function, in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        # the garbage of the previous run is not collected during this one
+        gc.collect()
+        begin = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def latency(function, items, repeat):
+    """
+        :return: the duration of one call of function, in nanoseconds, for the items given in turn
+    """
+    def run():
+        for item in items:
+            function(item)
+    return bestTime(run, repeat) * 1e9 / max(len(items), 1)
+
+
+def throughput(elapsed, count, size):
+    return {"seconds": elapsed,
+            "messages_per_second": count / elapsed if elapsed else None,
+            "mb_per_second": size / elapsed / 1e6 if elapsed else None}
+
+
+def benchParse(messages, size, repeat):
+    split_parser = HL7Parser(engine="split")
+    fast_parser = HL7Parser(engine="fast")
+    modes = {
+        "split": lambda: [split_parser.parse(msg) for msg in messages],
+        "fast": lambda: [fast_parser.parse(msg) for msg in messages],
+        "lazy": lambda: [fast_parser.parse(msg, lazy=True).get("MSH-10") for msg in messages],
+        "compact": lambda: [fast_parser.parseCompact(msg) for msg in messages],
+    }
+    return {mode: throughput(bestTime(function, repeat), len(messages), size) for mode, function in modes.items()}
+
+
+def benchInstrumentation(messages, repeat):
+    """
+        The statistics must cost nothing once disabled : disabled_overhead must be within the noise,
+        the difference measured between two parsers running the same code
+    """
+    parsers = {"baseline": HL7Parser(engine="fast"), "control": HL7Parser(engine="fast"),
+               "disabled": HL7Parser(engine="fast"), "enabled": HL7Parser(engine="fast")}
+    parsers["disabled"].enableStats()
+    parsers["disabled"].disableStats()
+    parsers["enabled"].enableStats()
+
+    def run(parse):
+        for msg in messages:
+            parse(msg)
+
+    times = {}
+    names = list(parsers)
+    # runs interleaved, in a different order each time, not to favor a parser
+    for turn in range(max(repeat, len(names))):
+        for name in names[turn % len(names):] + names[:turn % len(names)]:
+            elapsed = bestTime(lambda: run(parsers[name].parse), 1)
+            times[name] = min(times.get(name, elapsed), elapsed)
+    return {"baseline_seconds": times["baseline"],
+            "disabled_seconds": times["disabled"],
+            "enabled_seconds": times["enabled"],
+            "disabled_runs_plain_parse": parsers["disabled"].parse.__func__ is HL7Parser.parse,
+            "noise": abs(times["control"] / times["baseline"] - 1),
+            "disabled_overhead": times["disabled"] / times["baseline"] - 1,
+            "enabled_overhead": times["enabled"] / times["baseline"] - 1}
+
+
+def benchThreads(messages, size, repeat):
+    parser = HL7Parser(engine="fast")
+    counts = sorted(set([1, 2, min(os.cpu_count() or 1, 8)]))
+    results = {"gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)()}
+    for count in counts:
+        elapsed = bestTime(lambda: list(parser.parseConcurrent(messages, workers=count)), repeat)
+        results[str(count)] = throughput(elapsed, len(messages), size)
+    results["speedup"] = results[str(counts[0])]["seconds"] / results[str(counts[-1])]["seconds"]
+    return results
+
+
+def benchLookup(message, repeat):
+    hl7dict = HL7Parser(engine="fast").parse(message)
+    # a sample of the keys, alias and qualified forms
+    keys = hl7dict.orderedKeys[::max(len(hl7dict.orderedKeys) // 500, 1)]
+    aliases = [hl7dict.aliasKeys[key] for key in keys]
+    missing = ["ZZZ-%d" % index for index in range(100)]
+    return {
+        "values": len(hl7dict),
+        "get_ns": latency(hl7dict.get, aliases, repeat),
+        "getitem_ns": latency(hl7dict.__getitem__, keys, repeat),
+        "in_ns": latency(hl7dict.__contains__, aliases, repeat),
+        "in_missing_ns": latency(hl7dict.__contains__, missing, repeat),
+        "partial_ns": latency(hl7dict.get, PARTIAL_TERSERS, repeat),
+        "segment_keys_ns": latency(hl7dict.getSegmentKeys, ("OBX", "PID", "NTE"), repeat),
+        "to_json_seconds": bestTime(hl7dict.toJSON, repeat),
+        "to_json_nested_seconds": bestTime(lambda: hl7dict.toJSON(nested=True), repeat),
+    }
+
+
+def benchMemory(message):
+    results = {}
+    parsers = {"split": (HL7Parser(engine="split"), "parse"),
+               "fast": (HL7Parser(engine="fast"), "parse"),
+               "compact": (HL7Parser(engine="fast"), "parseCompact")}
+    for mode, (parser, method) in parsers.items():
+        tracemalloc.start()
+        try:
+            result = getattr(parser, method)(message)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[mode] = {"peak_bytes": peak, "retained_bytes": current}
+        del result
+    return results
+
+
+def runBenchmarks(profiles=None, seed=0, repeat=3, scale=1.0):
+    """ Run the benchmarks.
+
+    :param profiles: names of the profiles to run, all if None
+    :param seed: seed of the generator, the same seed measures the same messages
+    :param repeat: count of runs of each measure, the best one is kept
+    :param scale: factor of the count of messages of each profile
+    :return: a dict with the results, by profile
+    """
+    results = {"python": sys.version.split()[0],
+               "implementation": platform.python_implementation(),
+               "platform": platform.platform(),
+               "seed": seed,
+               "repeat": repeat,
+               "profiles": {}}
+
+    for name in (profiles or PROFILES):
+        if name not in PROFILES:
+            raise ValueError("Unknown profile %s, expected one of %s" % (name, ", ".join(PROFILES)))
+        profile = PROFILES[name]
+        generator = MessageGenerator(seed)
+        messages = list(generator.messages(max(int(profile["count"] * scale), 1), **profile["shape"]))
+        size = sum(len(msg.encode("utf-8")) for msg in messages)
+        results["profiles"][name] = {
+            "shape": profile["shape"],
+            "messages": len(messages),
+            "bytes": size,
+            "parse": benchParse(messages, size, repeat),
+            "instrumentation": benchInstrumentation(messages, repeat),
+            "threads": benchThreads(messages, size, repeat),
+            "lookup": benchLookup(messages[0], repeat),
+            "memory": benchMemory(messages[0]),
+        }
+    return results
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog="python -m hl7tersely.benchmark",
+                                        description="Benchmarks of the hl7tersely parser")
+    argparser.add_argument("--profile", action="append", choices=list(PROFILES),
+                           help="profile to run, may be repeated (default : all)")
+    argparser.add_argument("--seed", type=int, default=0, help="seed of the message generator")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs of each measure, the best is kept")
+    argparser.add_argument("--scale", type=float, default=1.0, help="factor of the count of messages")
+    argparser.add_argument("--output", help="JSON file of the results (default : standard output)")
+    args = argparser.parse_args(argv)
+
+    results = runBenchmarks(args.profile, args.seed, args.repeat, args.scale)
+    if args.output:
+        with open(args.output, "w") as outf:
+            json.dump(results, outf, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return results
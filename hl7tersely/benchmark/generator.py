@@ -0,0 +1,113 @@
+r"""Seeded generator of HL7 messages.
+
+The same seed gives the same messages. The shape of a message is controlled by
+the count of segments and OBX segments, the repetitions of the repeating fields,
+the components of the coded fields and the subcomponents of the assigning authorities.
+An OBX segment can embed a base64 payload (ED data type) of a given size.
+
+>>> generator = MessageGenerator(seed=42)
+>>> hl7message = generator.message(segments=40, obx=20)
+"""
+
+import base64
+import random
+import string
+
+__version__ = "1.3"
+__all__ = ["MessageGenerator"]
+
+SEPARATORS = "|^~\\&"
+WORDS = ("GLUCOSE", "SODIUM", "POTASSIUM", "CHLORIDE", "CREATININE", "UREA", "ALBUMIN", "CALCIUM",
+         "HEMOGLOBIN", "PLATELETS", "FERRITIN", "TROPONIN", "LACTATE", "BILIRUBIN", "LIPASE", "AMYLASE")
+UNITS = ("mmol/l", "umol/l", "g/l", "mg/dl", "UI/l", "%", "10*9/l", "ng/ml")
+NAMES = ("EVERYMAN", "NUCLEAR", "MARTIN", "BERNARD", "DUBOIS", "THOMAS", "ROBERT", "RICHARD", "PETIT")
+FIRST_NAMES = ("ADAM", "NELDA", "MARTHA", "JEAN", "MARIE", "PIERRE", "ANNE", "LOUIS", "CLAIRE")
+
+
+class MessageGenerator:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def word(self, length=8):
+        return "".join(self.random.choice(string.ascii_uppercase) for _ in range(length))
+
+    def number(self, digits=6):
+        return "".join(self.random.choice(string.digits) for _ in range(digits))
+
+    def timestamp(self):
+        return "20%02d%02d%02d%02d%02d" % (self.random.randint(0, 25), self.random.randint(1, 12),
+                                          self.random.randint(1, 28), self.random.randint(0, 23),
+                                          self.random.randint(0, 59))
+
+    def authority(self, subcomponents):
+        # HD data type : namespace&universal id&universal id type
+        parts = [self.word(4), "1.2.250.1.%s" % self.number(3), "ISO"]
+        return "&".join((parts * subcomponents)[:subcomponents]) if subcomponents > 1 else parts[0]
+
+    def coded(self, components, text=None):
+        # CWE data type : identifier^text^coding system^alternate identifier^...
+        parts = ["%s-%s" % (self.number(5), self.number(1)), text or self.random.choice(WORDS), "LN",
+                 self.number(4), self.word(6), "L", "2.%d" % self.random.randint(0, 9)]
+        return "^".join((parts * components)[:components])
+
+    def identifier(self, components, subcomponents):
+        # CX data type : id^check digit^scheme^assigning authority^identifier type
+        parts = [self.number(9), "", "", self.authority(subcomponents), self.random.choice(("PI", "MR", "INS"))]
+        return "^".join(parts[:max(components, 1)])
+
+    def repeated(self, repetitions, build):
+        return "~".join(build() for _ in range(max(repetitions, 1)))
+
+    def message(self, segments=20, obx=10, repetitions=2, components=5, subcomponents=2, embedded_size=0):
+        """ Build a message.
+
+        :param segments: total count of segments, NTE segments are added after the OBX segments to reach it
+        :param obx: count of OBX segments
+        :param repetitions: count of repetitions of the repeating fields (PID-3, PID-5, PID-11, PID-13)
+        :param components: count of components of the coded and identifier fields
+        :param subcomponents: count of subcomponents of the assigning authorities
+        :param embedded_size: size in bytes of a payload embedded in base64 in an OBX-5 (0 : none)
+        :return: the message, segments separated by \r
+        """
+        rnd = self.random
+        self.count += 1
+        lines = [
+            "MSH|%s|LAB|%s|HIS|%s|%s||ORU^R01^ORU_R01|MSG%08d|P|2.5|||AL|NE||UNICODE UTF-8" % (
+                SEPARATORS[1:], self.word(6), self.word(6), self.timestamp(), self.count),
+            "PID|1||%s||%s||%s|%s|||%s||%s" % (
+                self.repeated(repetitions, lambda: self.identifier(components, subcomponents)),
+                self.repeated(repetitions, lambda: "%s^%s^^^^^L" % (rnd.choice(NAMES), rnd.choice(FIRST_NAMES))),
+                self.timestamp()[:8], rnd.choice("MF"),
+                self.repeated(repetitions,
+                              lambda: "%s STREET^^%s^^%s" % (self.number(3), self.word(7), self.number(5))),
+                self.repeated(repetitions, lambda: "^PRN^PH^^33^%s" % self.number(9))),
+            "PV1|1|%s|%s^%s^%s||||%s^%s^%s|||||||||||%s" % (
+                rnd.choice("IOE"), self.word(4), self.number(3), self.number(2),
+                self.number(6), rnd.choice(NAMES), rnd.choice(FIRST_NAMES), self.number(8)),
+            "ORC|RE|%s^%s|%s^%s||CM||||%s" % (self.number(8), self.word(5), self.number(8), self.word(5),
+                                              self.timestamp()),
+            "OBR|1|%s^%s|%s^%s|%s|||%s" % (self.number(8), self.word(5), self.number(8), self.word(5),
+                                           self.coded(components), self.timestamp()),
+        ]
+
+        for index in range(1, obx + 1):
+            lines.append("OBX|%d|NM|%s||%s|%s|%d-%d|N|||F|||%s" % (
+                index, self.coded(components), rnd.randint(1, 9999), rnd.choice(UNITS),
+                rnd.randint(1, 100), rnd.randint(100, 1000), self.timestamp()))
+
+        if embedded_size:
+            payload = base64.b64encode(rnd.randbytes(embedded_size * 3 // 4)).decode("ascii")
+            lines.append("OBX|%d|ED|PDF^Report^L||^application^pdf^Base64^%s||||||F" % (obx + 1, payload))
+
+        while len(lines) < segments:
+            lines.append("NTE|%d|L|%s" % (len(lines), " ".join(rnd.choice(WORDS) for _ in range(6))))
+
+        return "\r".join(lines)
+
+    def messages(self, count, **shape):
+        """
+            Generate count messages with the same shape, see message
+        """
+        for _ in range(count):
+            yield self.message(**shape)
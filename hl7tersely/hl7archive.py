@@ -0,0 +1,337 @@
+r"""HL7 archive index. Random access to the messages of a large file of concatenated messages.
+
+The archive is scanned once : the messages are found by their header segment, and only
+their MSH line and their PID line are read, the messages are not parsed. The offsets and
+a few header fields are written in a sidecar index file (archive.hl7.idx by default).
+A lookup maps the archive in memory and parses only the message found.
+
+>>> with HL7ArchiveIndex("archive.hl7") as archive:
+...     archive.update()
+...     hl7dict = archive.parseControlId("msgOF105")
+...     numbers = archive.find(patient_id="123456789", since="20030906")
+
+Fields of an entry :
+    number      : number of the message in the archive, from 0
+    offset      : position of the message in the archive, in bytes
+    length      : length of the message, in bytes
+    time        : MSH-7, the date and time of the message
+    type        : MSH-9, ex. ORU^R01^ORU_R01
+    control_id  : MSH-10
+    patient_id  : PID-3-1, of the first repetition of PID-3, None if the message has no PID segment
+
+update scans only the data added to the archive since the previous scan, and appends the new
+entries to the index file. The last message is scanned again : it may have been written partially.
+The index file holds the CRC-32 of the beginning of the archive : an index of another archive, or of
+an archive replaced or truncated since the scan, is not used, the index is built again by update.
+Batch envelopes (FHS, BHS, BTS, FTS segments) are not part of the messages.
+
+The index is built and searched from the command line :
+    python -m hl7tersely.hl7archive archive.hl7 --control-id msgOF105
+"""
+
+import argparse
+from collections import namedtuple
+import json
+import mmap
+import os
+import re
+import sys
+import zlib
+
+from hl7tersely.hl7charset import LINE_END
+from hl7tersely.hl7parser import HL7Parser
+from hl7tersely.hl7stream import ENVELOPE_SEGMENTS
+
+__version__ = "1.3"
+__all__ = ["HL7ArchiveIndex", "ArchiveEntry", "main"]
+
+ArchiveEntry = namedtuple("ArchiveEntry", ("number", "offset", "length", "time", "type", "control_id", "patient_id"))
+
+INDEX_SUFFIX = ".idx"
+# size of the beginning of the archive checked by the index
+FINGERPRINT_SIZE = 4096
+BLANKS = b"\r\n \t"
+
+
+class HL7ArchiveIndex:
+    """
+    Offset index of an archive of HL7 messages, see the module documentation
+    """
+    def __init__(self, path, index_path=None, parser=None):
+        """
+            :param path: the archive
+            :param index_path: the index file, path + ".idx" by default
+            :param parser: the HL7Parser of the messages, a default HL7Parser if None
+        """
+        self.path = path
+        self.indexPath = index_path or path + INDEX_SUFFIX
+        self.parser = parser or HL7Parser()
+        self.entries = []
+        # position in the index file of the line of the last entry
+        self.lastLinePosition = None
+        # [size, CRC-32] of the beginning of the archive, see fingerprint
+        self.archiveFingerprint = None
+        self.lookups = None
+        self.file = None
+        self.map = None
+        # field separator -> pattern of the PID segment
+        self.pidPatterns = {}
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = self.file = None
+
+    def load(self):
+        """
+            Read the index file, if it exists
+        """
+        self.entries = []
+        self.lastLinePosition = None
+        self.archiveFingerprint = None
+        self.lookups = None
+        if not os.path.exists(self.indexPath):
+            return
+        with open(self.indexPath, "rb") as indexf:
+            header = json.loads(indexf.readline())
+            if header.get("header_segment") != self.parser.header_segment:
+                raise ValueError("%s : index of %s messages, the parser reads %s messages" % (
+                    self.indexPath, header.get("header_segment"), self.parser.header_segment))
+            while True:
+                position = indexf.tell()
+                line = indexf.readline()
+                if not line.strip():
+                    break
+                self.entries.append(ArchiveEntry(len(self.entries), *json.loads(line)))
+                self.lastLinePosition = position
+        self.archiveFingerprint = header.get("fingerprint")
+        if not self.indexesArchive():
+            # built again by update
+            self.entries = []
+            self.lastLinePosition = None
+
+    def fingerprint(self, size=FINGERPRINT_SIZE):
+        """
+            :return: [size, CRC-32] of the beginning of the archive, at most size bytes
+        """
+        with open(self.path, "rb") as archivef:
+            data = archivef.read(size)
+        return [len(data), zlib.crc32(data)]
+
+    def indexesArchive(self):
+        """
+            :return: True if the entries are messages of the archive : the archive holds the messages indexed,
+                its beginning and its last complete message indexed have not changed
+        """
+        if not self.entries:
+            return True
+        last = self.entries[-1]
+        if not os.path.exists(self.path) or last.offset + last.length > os.path.getsize(self.path):
+            return False
+        if self.archiveFingerprint is None or self.fingerprint(self.archiveFingerprint[0]) != self.archiveFingerprint:
+            return False
+        if len(self.entries) > 1:
+            # the last message may have been written partially
+            entry = self.entries[-2]
+            with open(self.path, "rb") as archivef:
+                archivef.seek(entry.offset)
+                data = archivef.read(entry.length)
+            if self.readEntry(data, 0, len(data))[1:] != tuple(entry[2:]):
+                return False
+        return True
+
+    def openMap(self):
+        """
+            :return: the archive mapped in memory, None if it is empty
+        """
+        if self.map is None:
+            self.file = open(self.path, "rb")
+            if os.fstat(self.file.fileno()).st_size == 0:
+                self.file.close()
+                self.file = None
+                return None
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def update(self):
+        """
+            Scan the data added to the archive and append the new entries to the index file.
+            The index is built again if the archive is not the archive indexed, see indexesArchive
+            :return: the count of entries added, all the entries if the index is built again
+        """
+        # the archive may have grown : it is mapped again
+        self.close()
+        size = os.path.getsize(self.path)
+        start = 0
+        if not self.indexesArchive():
+            self.entries = []
+            self.lastLinePosition = None
+        count = len(self.entries)
+        if self.entries:
+            # the last message may have been written partially
+            start = self.entries[-1].offset
+            del self.entries[-1]
+
+        new_entries = list(self.scan(start)) if size else []
+        self.entries.extend(ArchiveEntry(number, *entry)
+                            for number, entry in enumerate(new_entries, len(self.entries)))
+        self.lookups = None
+        self.writeEntries(new_entries)
+        return len(self.entries) - count
+
+    def writeEntries(self, new_entries):
+        """
+            Replace the last entry of the index file by the new entries
+        """
+        with open(self.indexPath, "wb" if self.lastLinePosition is None else "r+b") as indexf:
+            if self.lastLinePosition is None:
+                self.archiveFingerprint = self.fingerprint()
+                header = {"archive": os.path.basename(self.path), "header_segment": self.parser.header_segment,
+                          "fingerprint": self.archiveFingerprint, "fields": list(ArchiveEntry._fields[1:])}
+                indexf.write(json.dumps(header).encode("ascii") + b"\n")
+            else:
+                indexf.seek(self.lastLinePosition)
+                indexf.truncate()
+            position = indexf.tell()
+            for entry in new_entries:
+                position = indexf.tell()
+                indexf.write(json.dumps(entry).encode("ascii") + b"\n")
+            if new_entries:
+                self.lastLinePosition = position
+
+    def scan(self, start=0):
+        """
+            Find the messages of the archive from a position, read their header fields
+            :return: generator of (offset, length, time, type, control_id, patient_id) tuples
+        """
+        buffer = self.openMap()
+        header_segment = self.parser.header_segment.encode("latin-1")
+        starts = [header_segment] + [name.encode("latin-1") for name in ENVELOPE_SEGMENTS]
+        boundary = re.compile(b"[\r\n](%s)" % b"|".join(map(re.escape, starts)))
+
+        # the first message starts at the first non blank character
+        position = start
+        while position < len(buffer) and buffer[position:position + 1] in BLANKS:
+            position += 1
+        message_start = position if buffer[position:position + len(header_segment)] == header_segment else None
+        for match in boundary.finditer(buffer, position):
+            if message_start is not None:
+                yield self.readEntry(buffer, message_start, match.start())
+            message_start = match.start(1) if match.group(1) == header_segment else None
+        if message_start is not None:
+            yield self.readEntry(buffer, message_start, len(buffer))
+
+    def readEntry(self, buffer, start, end):
+        while end > start and buffer[end - 1:end] in BLANKS:
+            end -= 1
+        line_end = LINE_END.search(buffer, start, end)
+        header = buffer[start:line_end.start() if line_end else end].decode("latin-1")
+        separators = header[self.parser.segment_len:self.parser.segment_len + self.parser.separator_count]
+        # MSH-1 is the field separator : fields[n - 1] is MSH-n
+        fields = header.split(separators[0]) + [""] * 10
+        patient_id = None
+        pid_pattern = self.pidPatterns.get(separators[0])
+        if pid_pattern is None:
+            pid_pattern = self.pidPatterns[separators[0]] = re.compile(
+                b"[\r\n]PID" + re.escape(separators[0].encode("latin-1")))
+        pid = pid_pattern.search(buffer, start, end)
+        if pid is not None:
+            pid_end = LINE_END.search(buffer, pid.end(), end)
+            pid_fields = buffer[pid.start() + 1:pid_end.start() if pid_end else end].decode("latin-1").split(
+                separators[0])
+            if len(pid_fields) > 3:
+                patient_id = pid_fields[3].split(separators[2])[0].split(separators[1])[0] or None
+        return start, end - start, fields[6], fields[8], fields[9], patient_id
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, number):
+        return self.entries[number]
+
+    def buildLookups(self):
+        if self.lookups is None:
+            self.lookups = {"control_id": {}, "patient_id": {}, "type": {}}
+            for entry in self.entries:
+                for field, lookup in self.lookups.items():
+                    lookup.setdefault(getattr(entry, field), []).append(entry.number)
+        return self.lookups
+
+    def find(self, control_id=None, patient_id=None, message_type=None, since=None, until=None):
+        """
+            Find messages by their header fields, the conditions given are all checked
+            :param control_id: MSH-10
+            :param patient_id: PID-3-1
+            :param message_type: MSH-9, as written in the message. Ex : ORU^R01^ORU_R01
+            :param since: MSH-7 greater or equal, compared as text. Ex : 20030906
+            :param until: MSH-7 lower, compared as text
+            :return: the numbers of the messages, in the order of the archive
+        """
+        lookups = self.buildLookups()
+        numbers = None
+        for field, value in (("control_id", control_id), ("patient_id", patient_id), ("type", message_type)):
+            if value is not None:
+                found = lookups[field].get(value, [])
+                if numbers is None:
+                    numbers = found
+                else:
+                    found = set(found)
+                    numbers = [n for n in numbers if n in found]
+        if numbers is None:
+            numbers = range(len(self.entries))
+        return [n for n in numbers if (since is None or self.entries[n].time >= since) and
+                (until is None or self.entries[n].time < until)]
+
+    def message(self, number):
+        """
+            :return: the text of a message, as bytes
+        """
+        entry = self.entries[number]
+        return self.openMap()[entry.offset:entry.offset + entry.length]
+
+    def parse(self, number, **options):
+        """
+            Parse one message, see HL7Parser.parse for the options
+        """
+        return self.parser.parse(self.message(number), **options)
+
+    def parseControlId(self, control_id, **options):
+        """
+            Parse the last message with this control ID
+            :return: the HL7 dictionary, None if no message has this control ID
+        """
+        numbers = self.find(control_id=control_id)
+        return self.parse(numbers[-1], **options) if numbers else None
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog="python -m hl7tersely.hl7archive",
+                                        description="Index an HL7 archive, find its messages")
+    argparser.add_argument("archive", help="file of concatenated HL7 messages")
+    argparser.add_argument("--index", help="index file (default : the archive name + .idx)")
+    argparser.add_argument("--control-id", help="MSH-10 of the messages to find")
+    argparser.add_argument("--patient-id", help="PID-3-1 of the messages to find")
+    argparser.add_argument("--type", help="MSH-9 of the messages to find. Ex : ORU^R01^ORU_R01")
+    argparser.add_argument("--since", help="MSH-7 of the first messages to find. Ex : 20030906")
+    argparser.add_argument("--until", help="MSH-7 after the last messages to find")
+    args = argparser.parse_args(argv)
+
+    with HL7ArchiveIndex(args.archive, args.index) as archive:
+        added = archive.update()
+        sys.stderr.write("%d messages indexed, %d added\n" % (len(archive), added))
+        if any(value is not None for value in (args.control_id, args.patient_id, args.type, args.since, args.until)):
+            for number in archive.find(args.control_id, args.patient_id, args.type, args.since, args.until):
+                sys.stdout.write(archive.message(number).decode("latin-1").replace("\r", "\n") + "\n\n")
+        return archive.entries
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+r"""Segment cache. Keep the values of the segments already parsed, for the segments repeated from message to message.
+
+In a feed, many segments are the same in many messages (EVN, PV1, ORC, OBR of an order group, ...).
+Once the cache is enabled on a parser, a segment found in the cache is not tokenized again :
+its (key, value) couples are stored under the qualified name of the segment in the new message.
+
+>>> cache = hl7p.enableSegmentCache(max_entries=4096, max_bytes=4 << 20)
+>>> for msg in messages:
+...     hl7p.parse(msg)
+>>> cache.snapshot()
+{'entries': 812, 'bytes': 65310, 'hits': 9188, 'misses': 812, 'evictions': 0, 'hit_rate': 0.9188}
+
+The key of a segment is its text and the separators of its message. The cache belongs to
+its parser : it is cleared when the configuration of the parser changes (changeDefaultMessageConst).
+The least recently used segments are evicted once max_entries segments are cached, or once
+the text of the cached segments is longer than max_bytes characters.
+"""
+
+from collections import OrderedDict
+import threading
+
+__version__ = "1.3"
+__all__ = ["LRUCache", "SegmentCache"]
+
+
+class LRUCache:
+    """LRU cache bounded by a count of entries and by the total size of the entries, with hit and miss counters.
+    The cache may be shared by threads, it is pickled empty
+    """
+    def __init__(self, max_entries=4096, max_bytes=None):
+        """
+            :param max_entries: count of entries cached
+            :param max_bytes: total size of the entries cached, see entrySize, None for no bound
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.maxEntries = max_entries
+        self.maxBytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __reduce__(self):
+        return type(self), (self.maxEntries, self.maxBytes)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def emptyCopy(self):
+        """
+            :return: an empty cache with the same bounds
+        """
+        return type(self)(self.maxEntries, self.maxBytes)
+
+    def entrySize(self, key, value):
+        return 0
+
+    def get(self, key):
+        """
+            :return: the value of the key, None if not cached
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.entrySize(key, value)
+        if self.maxBytes is not None and size > self.maxBytes:
+            return
+        entries = self.entries
+        with self.lock:
+            if key in entries:
+                # put by another thread
+                return
+            entries[key] = value
+            self.size += size
+            while len(entries) > self.maxEntries or (self.maxBytes is not None and self.size > self.maxBytes):
+                evicted, evicted_value = entries.popitem(last=False)
+                self.size -= self.entrySize(evicted, evicted_value)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def snapshot(self):
+        """
+            :return: a dict with the counters
+        """
+        return {"entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hitRate()}
+
+
+class SegmentCache(LRUCache):
+    """LRU cache of the values of the segments, see HL7Parser.enableSegmentCache.
+    The keys are (segment text, separators), the values the tuples of (key, value) couples of the segments.
+    The size of an entry is the length of the text of its segment
+    """
+    def entrySize(self, key, value):
+        return len(key[0])
@@ -0,0 +1,77 @@
+r"""HL7 character sets.
+
+A binary message is decoded with the character set declared in MSH-18
+(see HL7 Chapter 2, table 0211), or with a codec given by the caller.
+"""
+
+import re
+
+__version__ = "1.3"
+__all__ = ["HL7_CHARSETS", "DEFAULT_ENCODING", "messageEncoding", "decodeMessage"]
+
+# ASCII is decoded as UTF-8 : the same for valid messages, tolerant for the others
+DEFAULT_ENCODING = "utf-8"
+
+HL7_CHARSETS = {
+    "ASCII": "utf-8",
+    "8859/1": "iso8859-1",
+    "8859/2": "iso8859-2",
+    "8859/3": "iso8859-3",
+    "8859/4": "iso8859-4",
+    "8859/5": "iso8859-5",
+    "8859/6": "iso8859-6",
+    "8859/7": "iso8859-7",
+    "8859/8": "iso8859-8",
+    "8859/9": "iso8859-9",
+    "8859/15": "iso8859-15",
+    "UNICODE UTF-8": "utf-8",
+    "UNICODE UTF-16": "utf-16",
+    "UNICODE UTF-32": "utf-32",
+    "ISO IR6": "ascii",
+    "ISO IR14": "iso2022_jp",
+    "ISO IR87": "iso2022_jp",
+    "ISO IR159": "iso2022_jp_2",
+    "GB 18030-2000": "gb18030",
+    "KS X 1001": "euc_kr",
+    "BIG-5": "big5",
+}
+
+LINE_END = re.compile(rb"[\r\n]")
+NOT_BLANK = re.compile(rb"[^\r\n ]")
+
+
+def messageEncoding(buffer, encoding=None, header_segment="MSH"):
+    """ Get the codec of a binary message.
+
+    :param buffer: the message, bytes, bytearray, memoryview or mmap
+    :param encoding: codec given by the caller, returned if not None
+    :param header_segment: name of the header segment
+    :return: the codec of the character set of MSH-18, DEFAULT_ENCODING if MSH-18 is empty or unknown
+    """
+    if encoding is not None:
+        return encoding
+    first = NOT_BLANK.search(buffer)
+    start = first.start() if first else 0
+    end = LINE_END.search(buffer, start)
+    header = bytes(buffer[start:end.start() if end else len(buffer)]).decode("latin-1")
+    if not header.startswith(header_segment) or len(header) < len(header_segment) + 5:
+        return DEFAULT_ENCODING
+
+    separators = header[len(header_segment):len(header_segment) + 5]
+    fields = header.split(separators[0])
+    if len(fields) < 18:
+        return DEFAULT_ENCODING
+    # MSH-18 is the 17th field after the segment name, MSH-1 being the separator itself
+    charset = fields[17].split(separators[2])[0].split(separators[1])[0].strip()
+    return HL7_CHARSETS.get(charset.upper(), DEFAULT_ENCODING)
+
+
+def decodeMessage(msg, encoding=None, header_segment="MSH"):
+    """ Decode a binary message, a str is returned as is
+
+    :param msg: the message, str, bytes, bytearray, memoryview or mmap
+    :param encoding: codec given by the caller, otherwise the character set of MSH-18
+    """
+    if isinstance(msg, str):
+        return msg
+    return str(msg, messageEncoding(msg, encoding, header_segment))
@@ -0,0 +1,290 @@
+r"""Command line converter. Parse the HL7 messages of files, directories or the standard input,
+and write them as NDJSON, CSV or text.
+
+    hl7tersely archive.hl7 inbox/ --output messages.ndjson
+    hl7tersely archive.hl7 --format csv --terser MSH-10 --terser PID-3-1 --terser PID-5-1 --output patients.csv
+    cat feed.hl7 | hl7tersely --where MSH-9-1 equals ORU --format text
+
+The inputs are read in the order of the command line, the files of a directory in the order of their
+paths. A file may hold several messages (see hl7stream.iterMessages for the framings). The messages are
+parsed by a pool of processes (see HL7Parser.parseMany), the output is in the order of the inputs.
+
+Formats :
+    ndjson  : one JSON object per message, {terser: value} (see HL7Dict.toJSON)
+    csv     : one row per message, one column per terser given with --terser
+    text    : the toString view of each message, the messages are separated by a blank line
+
+The throughput (messages/s, MB/s) is written on the standard error while the messages are parsed
+(--progress, by default if the standard error is a terminal), and a summary at the end.
+--profile parses the messages in the process, and writes where the time went : the stages of the
+parse (see hl7stats), the slowest segment types and the functions of the profiler.
+
+A message which can not be parsed is skipped, its file and offset are written on the standard error
+with the error. The exit status is 1 if a message was skipped.
+"""
+
+from array import array
+from bisect import bisect_right
+import argparse
+import cProfile
+import csv
+import io
+import os
+import pstats
+import sys
+import time
+
+from hl7tersely.hl7filter import OPERATORS
+from hl7tersely.hl7parser import HL7Parser, parseResults
+from hl7tersely.hl7stream import FRAMINGS, HL7StreamError, iterMessages
+
+__version__ = "1.3"
+__all__ = ["main", "convert", "Throughput"]
+
+FORMATS = ("ndjson", "csv", "text")
+
+
+class Throughput:
+    """
+    Counters of the messages read, written and skipped, reported on a text stream.
+    The position of each message read is kept to report the errors
+    """
+    def __init__(self, stream=sys.stderr, progress=False, interval=0.5):
+        """
+            :param stream: stream of the reports
+            :param progress: if True, the throughput is reported every interval seconds
+        """
+        self.stream = stream
+        self.progress = progress
+        self.interval = interval
+        self.messagesRead = 0
+        self.bytesRead = 0
+        self.messagesWritten = 0
+        self.errors = 0
+        # number of the first message and path of each input, offset of each message in its input
+        self.inputStarts = []
+        self.inputPaths = []
+        self.offsets = array("Q")
+        self.start = time.perf_counter()
+        self.lastReport = self.start
+
+    def read(self, message, path="-", offset=0):
+        if not self.inputPaths or self.inputPaths[-1] != path:
+            self.inputStarts.append(self.messagesRead)
+            self.inputPaths.append(path)
+        self.offsets.append(offset)
+        self.messagesRead += 1
+        self.bytesRead += len(message)
+
+    def location(self, number):
+        """
+            :param number: number of a message read, from 0
+            :return: (path, offset) of the message
+        """
+        return self.inputPaths[bisect_right(self.inputStarts, number) - 1], self.offsets[number]
+
+    def failed(self, error):
+        """
+            Report a message skipped
+            :param error: the HL7StreamError of the message, its offset is the number of the message
+        """
+        self.errors += 1
+        path, offset = self.location(error.offset)
+        self.stream.write("%s%s : message at offset %d skipped : %s\n"
+                          % ("\n" if self.progress else "", path, offset, error.error))
+
+    def written(self):
+        self.messagesWritten += 1
+        if self.progress:
+            now = time.perf_counter()
+            if now - self.lastReport >= self.interval:
+                self.lastReport = now
+                self.stream.write("\r" + self.line(now))
+                self.stream.flush()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def line(self, now=None):
+        elapsed = max((now or time.perf_counter()) - self.start, 1e-9)
+        # the messages rejected by --where are read, not written
+        details = ["%d read" % self.messagesRead] if self.messagesRead != self.messagesWritten else []
+        if self.errors:
+            details.append("%d errors" % self.errors)
+        skipped = " (%s)" % ", ".join(details) if details else ""
+        return "%d messages%s, %.1f MB in %.1f s : %.0f messages/s, %.2f MB/s" % (
+            self.messagesWritten, skipped, self.bytesRead / 1e6, elapsed, self.messagesWritten / elapsed,
+            self.bytesRead / 1e6 / elapsed)
+
+    def summary(self):
+        if self.progress:
+            self.stream.write("\r")
+        self.stream.write(self.line() + "\n")
+
+
+def inputFiles(paths):
+    """
+        :param paths: files and directories, - for the standard input
+        :return: generator of the files, the files of a directory in the order of their paths
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+                found.extend(os.path.join(directory, name) for name in files if not name.startswith("."))
+            yield from sorted(found)
+        else:
+            yield path
+
+
+def readMessages(paths, framing, header_segment, throughput):
+    """
+        :return: generator of the messages of the inputs, as bytes
+    """
+    for path in inputFiles(paths):
+        if path == "-":
+            messages = iterMessages(sys.stdin.buffer, framing, header_segment=header_segment)
+            for offset, message in messages:
+                throughput.read(message, path, offset)
+                yield message
+            continue
+        with open(path, "rb") as inf:
+            for offset, message in iterMessages(inf, framing, header_segment=header_segment):
+                throughput.read(message, path, offset)
+                yield message
+
+
+def writeResults(results, fmt, tersers, outf, throughput):
+    """
+        Write the results of the parse, see HL7Parser.formatResult. The errors are reported by throughput
+    """
+    if fmt == "csv":
+        writer = csv.writer(outf)
+        writer.writerow(tersers)
+        for values in results:
+            if values.__class__ is HL7StreamError:
+                throughput.failed(values)
+                continue
+            # a partial terser gives the list of its keys, not a value
+            writer.writerow(["" if value is None or isinstance(value, list) else value
+                             for value in (values[terser] for terser in tersers)])
+            throughput.written()
+        return
+    separator = "\n" if fmt == "ndjson" else "\n\n"
+    for result in results:
+        if result.__class__ is HL7StreamError:
+            throughput.failed(result)
+            continue
+        outf.write(result)
+        outf.write(separator)
+        throughput.written()
+
+
+def profileReport(stats, profiler, stream, limit=20):
+    """
+        Write the statistics of the parser and the functions where the time went
+    """
+    snapshot = stats.snapshot()
+    total = sum(snapshot["times"].values()) or 1e-9
+    stream.write("\nParse stages (%d messages, %d errors)\n" % (snapshot["messages"], snapshot["errors"]))
+    for stage, seconds in snapshot["times"].items():
+        stream.write("  %-12s %8.3f s  %5.1f %%\n" % (stage, seconds, 100 * seconds / total))
+    stream.write("Slowest segment types : count, total, mean and max extraction time\n")
+    for name, mean, count, longest in snapshot["slowest_segments"]:
+        stream.write("  %-12s %8d %8.3f s %8.1f us %8.1f us\n"
+                     % (name, count, mean * count, mean * 1e6, longest * 1e6))
+    stream.write("Functions\n")
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+
+
+def main(argv=None):
+    """
+        :return: the exit status, 1 if a message was skipped
+    """
+    return 1 if convert(argv).errors else 0
+
+
+def convert(argv=None):
+    """
+        Convert the messages, see main
+        :return: the Throughput of the conversion
+    """
+    argparser = argparse.ArgumentParser(prog="hl7tersely",
+                                        description="Convert HL7 messages to NDJSON, CSV or text")
+    argparser.add_argument("inputs", nargs="*", default=["-"],
+                           help="files or directories of HL7 messages, - for the standard input (default)")
+    argparser.add_argument("-o", "--output", help="output file (default : standard output)")
+    argparser.add_argument("-f", "--format", choices=FORMATS, default="ndjson",
+                           help="output format (default : ndjson)")
+    argparser.add_argument("-t", "--terser", action="append", dest="tersers", default=[],
+                           help="column of the CSV format, may be repeated. Ex : PID-3-1")
+    argparser.add_argument("--where", nargs=3, action="append", default=[], metavar=("TERSER", "OPERATOR", "VALUE"),
+                           help="convert only the messages where the predicate is true, may be repeated. "
+                                "Operators : %s, the values of in are separated by commas" % ", ".join(OPERATORS))
+    argparser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                           help="count of processes (default : count of CPUs), 1 to parse in this process")
+    argparser.add_argument("--chunksize", type=int, default=64, help="messages sent to a process at a time")
+    argparser.add_argument("--framing", choices=FRAMINGS, default="auto", help="framing of the inputs")
+    argparser.add_argument("--engine", choices=HL7Parser.ENGINES, default="fast", help="parse engine")
+    argparser.add_argument("--progress", action="store_true", default=None,
+                           help="report the throughput while parsing (default : if the standard error is a terminal)")
+    argparser.add_argument("-q", "--quiet", action="store_true", help="no report, no summary")
+    argparser.add_argument("--profile", action="store_true",
+                           help="parse in this process and write where the time went on the standard error")
+    args = argparser.parse_args(argv)
+
+    if args.format == "csv" and not args.tersers:
+        argparser.error("the csv format needs the columns : --terser")
+    output = {"ndjson": "json", "csv": args.tersers, "text": "text"}[args.format]
+
+    hl7p = HL7Parser(engine=args.engine)
+    accept = None
+    if args.where:
+        try:
+            accept = hl7p.compileFilter([(terser, operator, value.split(",") if operator == "in" else value)
+                                         for terser, operator, value in args.where])
+        except ValueError as error:
+            argparser.error(str(error))
+
+    progress = sys.stderr.isatty() if args.progress is None else args.progress
+    throughput = Throughput(sys.stderr, progress and not args.quiet)
+    messages = readMessages(args.inputs, args.framing, hl7p.header_segment, throughput)
+
+    stats = profiler = None
+    if args.profile:
+        stats = hl7p.enableStats()
+        profiler = cProfile.Profile()
+    if args.profile or args.workers == 1:
+        results = parseResults(hl7p, output, messages, accept=accept, errors="yield")
+    else:
+        results = hl7p.parseMany(messages, workers=args.workers, chunksize=args.chunksize, output=output,
+                                 accept=accept, errors="yield")
+
+    if args.output:
+        outf = open(args.output, "w", encoding="utf-8", newline="" if args.format == "csv" else None)
+    else:
+        outf = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="" if args.format == "csv" else None,
+                                line_buffering=False, write_through=False)
+    try:
+        if profiler is not None:
+            profiler.enable()
+        writeResults(results, args.format, args.tersers, outf, throughput)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if args.output:
+            outf.close()
+        else:
+            outf.flush()
+            outf.detach()
+
+    if not args.quiet:
+        throughput.summary()
+    if profiler is not None:
+        profileReport(stats, profiler, sys.stderr)
+    return throughput
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+r"""Compact HL7 dictionary.
+
+A CompactHL7Dict holds the same values as an HL7Dict, but it stores the message
+text once and each value as integers in parallel arrays :
+line number, field, repetition, component, subcomponent, start and length of
+the value in the text. The terser keys are built only when they are requested.
+
+>>> hl7p = HL7Parser()
+>>> myhl7dict = hl7p.parseCompact(hl7message)
+>>> myhl7dict["PID-3-1"]
+'12345'
+
+Memory used per value, measured with tracemalloc once the messages are parsed :
+                    test samples x 50   640 KB ORU, 8000 OBX
+    HL7Dict         268 bytes           268 bytes
+    CompactHL7Dict   40 bytes            27 bytes
+The CompactHL7Dict keeps a copy of the message text, counted in these figures
+when the message has trailing line breaks (the text is stripped).
+
+A binary message (bytes, bytearray, memoryview or mmap) is kept as is, the
+values are decoded when they are read, with the character set of MSH-18.
+
+The integers are stored on 2 bytes (indexes) and 4 bytes (positions). The arrays are
+widened to 8 bytes when a value does not fit : a message larger than 4 GiB, or a field
+with more than 65535 repetitions.
+
+The lookups by terser are slower than with an HL7Dict : the line of the segment
+is found by its name, then the indexes of the values of the line are compared
+to the indexes of the terser. Iterating over the dictionary (keys, values, items)
+walks the arrays. The partial tersers build the keys of the matching segments on each call.
+"""
+
+from array import array
+from collections.abc import ItemsView, Mapping, ValuesView
+from functools import reduce
+
+from hl7tersely.hl7dict import HL7Dict
+from hl7tersely.hl7json import nestedRepr, splitField, splitSegment, toJSON
+from hl7tersely.hl7select import SelectPattern
+
+__version__ = "1.3"
+__all__ = ["CompactHL7Dict"]
+
+# the arrays of the values, widened together, see CompactHL7Dict.widen
+VALUE_ARRAYS = ("lines", "fields", "occurrences", "components", "subcomponents", "starts", "lengths")
+
+
+class CompactItemsView(ItemsView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping.qualifiedItems()
+
+
+class CompactValuesView(ValuesView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return map(self._mapping.value, range(len(self._mapping)))
+
+
+class CompactHL7Dict(Mapping):
+    __slots__ = ("parser", "text", "encoding", "separators", "segmentNameCount", "lineMap", "segmentLines",
+                 "lineFirst", "lines", "fields", "occurrences", "components", "subcomponents", "starts", "lengths")
+
+    def __init__(self, parser):
+        """
+            :param parser: the HL7Parser, used to format the keys
+        """
+        self.parser = parser
+        self.text = ""
+        # codec of a binary text, None for a str
+        self.encoding = None
+        self.separators = None
+        self.segmentNameCount = None
+        self.lineMap = None
+        # segment name -> line numbers of its segments
+        self.segmentLines = {}
+        # index of the first value of each line, lineFirst[n + 1] is the end of the line n
+        self.lineFirst = array('I', [0, 0])
+        self.lines = array('I')
+        self.fields = array('H')
+        self.occurrences = array('H')
+        self.components = array('H')
+        self.subcomponents = array('H')
+        self.starts = array('I')
+        self.lengths = array('I')
+
+    def setSegmentsMap(self, segmentNameCount, lineMap):
+        """
+            Set the segments map, see HL7Dict.setSegmentsMap
+        """
+        self.segmentNameCount = segmentNameCount
+        self.lineMap = lineMap
+        self.segmentLines = {}
+        for line_number in range(1, len(lineMap)):
+            seg_name = lineMap[line_number]
+            self.segmentLines.setdefault(seg_name[:seg_name.rindex('[')], []).append(line_number)
+
+    def addSegment(self, line_number, tokens):
+        """
+            Store the values of a line, the lines are added in the order of the message
+            :param line_number: number of the line, starting at 1
+            :param tokens: the list returned by tokenizeSegment, the starts are positions in the text
+        """
+        first = len(self.lines)
+        try:
+            for field, occu, compo, sub, start, value in tokens:
+                self.lines.append(line_number)
+                self.fields.append(field)
+                self.occurrences.append(occu)
+                self.components.append(compo)
+                self.subcomponents.append(sub)
+                self.starts.append(start)
+                self.lengths.append(len(value))
+            self.lineFirst.append(len(self.lines))
+        except OverflowError:
+            if self.lines.typecode == 'Q':
+                raise
+            # the values of the line are added again to the widened arrays
+            for name in VALUE_ARRAYS:
+                del getattr(self, name)[first:]
+            self.widen()
+            self.addSegment(line_number, tokens)
+
+    def widen(self):
+        """
+            Store the integers on 8 bytes
+        """
+        for name in VALUE_ARRAYS + ("lineFirst",):
+            setattr(self, name, array('Q', getattr(self, name)))
+
+    def segmentAlias(self, seg_name):
+        # PID[1] is aliased PID if only 1 PID segment is present
+        name = seg_name[:seg_name.rindex('[')]
+        return name if self.segmentNameCount[name] == 1 else seg_name
+
+    def value(self, index):
+        start = self.starts[index]
+        value = self.text[start:start + self.lengths[index]]
+        return value if self.encoding is None else str(value, self.encoding)
+
+    def fieldKey(self, index):
+        return self.parser.fieldKey(self.fields[index], self.occurrences[index],
+                                    self.components[index], self.subcomponents[index])
+
+    def qualifiedKey(self, index):
+        return f"{self.lineMap[self.lines[index]]}{self.parser.tersersep}{self.fieldKey(index)}"
+
+    def aliasKey(self, index):
+        key = self.fieldKey(index)
+        trail = HL7Dict.reZeroLeft.sub('\\1', key) if '0' in key else key
+        return f"{self.segmentAlias(self.lineMap[self.lines[index]])}{self.parser.tersersep}{trail}"
+
+    def find(self, terser):
+        """
+            Find the value of a terser
+            :param terser: qualified or aliased terser. Ex : OBR[1]-10-01 or OBR-10-1
+            :return: the index of the value in the arrays, -1 if not found
+        """
+        sep = self.parser.tersersep
+        seg_part, _, rest = terser.partition(sep)
+        try:
+            name, occurrence = splitSegment(seg_part)
+            field, occu, compo, sub = splitField(rest, sep)
+        except (IndexError, ValueError):
+            return -1
+        count = self.segmentNameCount.get(name, 0)
+        if seg_part.endswith(']'):
+            # PID[1]-03-01, or the alias PID[2]-3-1 if several PID segments are present
+            if seg_part != "%s[%d]" % (name, occurrence) or not 1 <= occurrence <= count:
+                return -1
+            key = self.parser.fieldKey(field, occu, compo, sub)
+            if rest != key and (count == 1 or rest != (HL7Dict.reZeroLeft.sub('\\1', key) if '0' in key else key)):
+                return -1
+        else:
+            # PID-3-1, if only 1 PID segment is present
+            key = self.parser.fieldKey(field, occu, compo, sub)
+            if count != 1 or rest != (HL7Dict.reZeroLeft.sub('\\1', key) if '0' in key else key):
+                return -1
+
+        # a single index after the field is a component, or a subcomponent of a field without components
+        levels = ((compo, sub),) if sub or not compo else ((compo, 0), (0, compo))
+        line_number = self.segmentLines[name][occurrence - 1]
+        fields = self.fields
+        for index in range(self.lineFirst[line_number], self.lineFirst[line_number + 1]):
+            if fields[index] == field and self.occurrences[index] == occu and \
+                    (self.components[index], self.subcomponents[index]) in levels:
+                return index
+        return -1
+
+    def lineNumbersFor(self, terser):
+        # lines of the segments which may own a terser starting with the given expression
+        for line_number in range(1, len(self.lineMap)):
+            seg_name = self.lineMap[line_number]
+            name = seg_name[:seg_name.rindex('[')]
+            if name.startswith(terser) or terser.startswith(name):
+                yield line_number
+
+    def keysStartingWith(self, prefix):
+        """
+            Get the qualified and aliased keys starting with prefix, in the order of the message
+            :param prefix: partial terser. Ex : PID-3[2]-4
+        """
+        keys = {}
+        for line_number in self.lineNumbersFor(prefix):
+            for index in range(self.lineFirst[line_number], self.lineFirst[line_number + 1]):
+                keys[self.aliasKey(index)] = None
+                keys[self.qualifiedKey(index)] = None
+        return [k for k in keys if k.startswith(prefix)]
+
+    def get(self, terser, default=None):
+        """
+            Get a value, see HL7Dict.get
+            :return : the value or a list of keys for a partial terser. Otherwise None.
+        """
+        index = self.find(terser)
+        if index >= 0:
+            return self.value(index)
+        values = self.keysStartingWith(terser)
+        return values if values else default
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    def __iter__(self):
+        field_key = self.parser.fieldKey
+        sep = self.parser.tersersep
+        line_map = self.lineMap
+        for line_number, field, occu, compo, sub in zip(self.lines, self.fields, self.occurrences, self.components,
+                                                        self.subcomponents):
+            yield f"{line_map[line_number]}{sep}{field_key(field, occu, compo, sub)}"
+
+    def items(self):
+        return CompactItemsView(self)
+
+    def values(self):
+        return CompactValuesView(self)
+
+    def qualifiedItems(self):
+        """
+            The (qualified key, value) couples, in the order of the message
+        """
+        return zip(self, map(self.value, range(len(self.lines))))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def getAliasedKeys(self):
+        return list(map(self.aliasKey, range(len(self.lines))))
+
+    def getSegmentKeys(self, segment):
+        """
+            Get the different keys for 1 defined segment
+            :param segment: Segment to find. Ex : PV1, PID
+        """
+        keys = []
+        for line_number in self.lineNumbersFor(segment):
+            indexes = range(self.lineFirst[line_number], self.lineFirst[line_number + 1])
+            keys.extend(filter(lambda k: k.startswith(segment), map(self.aliasKey, indexes)))
+        return keys
+
+    def select(self, pattern):
+        """
+            Get the values selected by a pattern, see HL7Dict.select
+            :return: a list of (alias, value) couples, in the order of the message
+        """
+        query = SelectPattern(pattern, self.parser.tersersep)
+        count = self.segmentNameCount.get(query.name, 0)
+        selected = []
+        for line_number in range(1, len(self.lineMap)):
+            name, occurrence = splitSegment(self.lineMap[line_number])
+            if name != query.name:
+                continue
+            for index in range(self.lineFirst[line_number], self.lineFirst[line_number + 1]):
+                if self.fields[index] == query.field and query.matches(occurrence, count, self.occurrences[index],
+                                                                       self.components[index],
+                                                                       self.subcomponents[index]):
+                    selected.append((self.aliasKey(index), self.value(index)))
+        return selected
+
+    def getSegmentsList(self):
+        """
+            Get the list of the segments in the HL7 message
+        """
+        return list(self.segmentNameCount.keys())
+
+    def aliasedItems(self):
+        """
+            The (alias, value) couples, in the order of the message
+        """
+        indexes = range(len(self.lines))
+        return zip(map(self.aliasKey, indexes), map(self.value, indexes))
+
+    def structuredItems(self):
+        """
+            The values with the indexes of their keys, in the order of the message, see HL7Dict.structuredItems
+        """
+        for index in range(len(self.lines)):
+            seg_name = self.lineMap[self.lines[index]]
+            bracket = seg_name.rindex('[')
+            yield (seg_name[:bracket], int(seg_name[bracket + 1:-1]), self.fields[index], self.occurrences[index],
+                   self.components[index], self.subcomponents[index], self.value(index))
+
+    def nestedRepr(self):
+        return nestedRepr(self)
+
+    def toJSON(self, nested=False):
+        return toJSON(self, nested)
+
+    def optimalRepr(self):
+        indexes = range(len(self.lines))
+        return list(map(self.aliasKey, indexes)), list(map(self.value, indexes))
+
+    def __repr__(self):
+        k, v = self.optimalRepr()
+        return "{%s}" % ", ".join("'%s': '%s'" % (k[ind], v[ind]) for ind in range(len(k)))
+
+    def toString(self):
+        """
+            Return a printable view of the dictionary
+        """
+        k, v = self.optimalRepr()
+        longest = reduce(lambda x, y: x if x > len(y) else len(y), k, 0)
+        return "\n".join("%s : %s" % (k[ind].ljust(longest), v[ind]) for ind in range(len(k)))
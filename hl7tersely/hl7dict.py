@@ -37,18 +37,70 @@ SPM[3]-17 200309060815
 False
 
 """
+from bisect import bisect_left
 from functools import reduce
-import json
+from itertools import chain
 import re
 
 __author__ = 'Frederic Laurent'
 __version__ = "1.3"
-__all__ = ["HL7Dict"]
+__all__ = ["HL7Dict", "LazyHL7Dict"]
 
 from collections import UserDict
 
+from hl7tersely.hl7diff import diffDicts
+from hl7tersely.hl7encoder import encodeSegment, levelSeparators, replaceValue
+from hl7tersely.hl7json import nestedRepr, splitField, splitSegment, toJSON
+from hl7tersely.hl7payload import expandReferences
+from hl7tersely.hl7scanner import segmentField, terserLevels
+from hl7tersely.hl7select import SelectPattern, StructuredIndex
+
+
+class PrefixIndex:
+    """
+    Sorted array of keys answering prefix queries in O(log n + k) instead of scanning all the keys.
+    New keys are appended, and merged in the sorted array by the next query.
+    The keys found are returned in their insertion order.
+    """
+    def __init__(self, unique=True):
+        self.unique = unique
+        self.sortedKeys = []
+        self.newKeys = []
+        self.count = 0
+
+    def add(self, key):
+        self.newKeys.append((key, self.count))
+        self.count += 1
+
+    def startingWith(self, prefix):
+        """
+            Get the keys starting with prefix
+            :param prefix: Ex : PID-3
+            :return: a list of keys, in their insertion order. If the index is unique, a key added several times
+            is returned once, at its first position.
+        """
+        if self.newKeys:
+            # both lists are sorted, the sort only merges them
+            self.newKeys.sort()
+            self.sortedKeys.extend(self.newKeys)
+            self.sortedKeys.sort()
+            self.newKeys = []
+
+        keys = self.sortedKeys
+        end = start = bisect_left(keys, (prefix,))
+        while end < len(keys) and keys[end][0].startswith(prefix):
+            end += 1
+
+        found = sorted(keys[start:end], key=lambda k: k[1])
+        if self.unique:
+            return list(dict.fromkeys(k[0] for k in found))
+        return [k[0] for k in found]
+
 
 class HL7Dict(UserDict):
+    # shared by all the dictionaries
+    reZeroLeft = re.compile("0+([1-9]+)")
+
     def __init__(self, terser_separator="-"):
         UserDict.__init__(self)
         self.lineMap = None
@@ -57,10 +109,28 @@ class HL7Dict(UserDict):
         self.orderedKeys = []
         self.aliasKeys = {}
         self.aliasSegmentName = {}
-        self.currentLineNumber = 0
-        self.reZeroLeft = re.compile("0+([1-9]+)")
+        # qualified key -> (field, repetition, component, subcomponent), the indexes of tokenizeSegment.
+        # The text of a key is ambiguous : PID[1]-2-3 is a component, or a subcomponent of a field
+        # without components
+        self.keyParts = {}
+        # line of the values stored by __setitem__ and addSegmentValues, only while a line is extracted
+        self.currentLineNumber = None
+        # indexes of the value given to __setitem__ by the "split" engine
+        self.currentParts = None
+        # set by HL7Parser.parse : the parser and the text of the segments, for setValue and toHL7
+        self.parser = None
+        self.lines = None
+        self.segmentLineNumber = {}
+        # placeholder -> FieldReference, the large fields of the message, see hl7payload
+        self.largeFields = None
+        self.resetIndexes()
 
     def __setitem__(self, key, item):
+        if self.currentLineNumber is None:
+            # not called by the parser : the key is a terser
+            self.setValue(key, item)
+            return
+
         # get the qualified name of the segment of current line
         # eg. PID[1] or MSH[1]
         seg_name = self.lineMap[self.currentLineNumber]
@@ -69,18 +139,83 @@ class HL7Dict(UserDict):
         qual_name = f"{seg_name}{self.sep}{key}"
         self.orderedKeys.append(qual_name)
         self.data[qual_name] = item
+        # a key emitted without its indexes (a subclass of the parser) is split
+        self.keyParts[qual_name] = self.currentParts or splitField(key, self.sep)
 
         # build alias
         # MSH[1]-09-01 is aliased MSH-9-1
         # SPM[2]-01 is aliased SPM[2]-1
 
-        seg = self.aliasSegmentName[seg_name] if seg_name in self.aliasSegmentName else seg_name
-        trail = self.reZeroLeft.sub('\\1', key)
+        seg = self.aliasSegmentName.get(seg_name, seg_name)
+        # no zero, nothing to strip
+        trail = self.reZeroLeft.sub('\\1', key) if '0' in key else key
         alias_name = f"{seg}{self.sep}{trail}"
 
         self.aliasKeys[alias_name] = qual_name
         self.aliasKeys[qual_name] = alias_name
 
+    def addSegmentValues(self, values):
+        """
+            Store the values of the current line, like __setitem__ does for one value.
+            :param values: iterable of (key, indexes, value), the keys are relative to the segment. Ex : 09-01.
+                The indexes are (field, repetition, component, subcomponent), see HL7Parser.keyedEntries
+        """
+        seg_name = self.lineMap[self.currentLineNumber]
+        qual_prefix = seg_name + self.sep
+        alias_prefix = self.aliasSegmentName.get(seg_name, seg_name) + self.sep
+        zero_left = self.reZeroLeft.sub
+        data = self.data
+        key_parts = self.keyParts
+        alias_keys = self.aliasKeys
+        ordered_append = self.orderedKeys.append
+
+        for key, parts, item in values:
+            qual_name = qual_prefix + key
+            ordered_append(qual_name)
+            data[qual_name] = item
+            key_parts[qual_name] = parts
+
+            alias_name = alias_prefix + (zero_left('\\1', key) if '0' in key else key)
+            alias_keys[alias_name] = qual_name
+            alias_keys[qual_name] = alias_name
+
+    def addQualifiedValues(self, values):
+        """
+            Store values with their keys already built, see hl7template
+            :param values: iterable of (qualified key, alias, indexes, value)
+        """
+        data = self.data
+        key_parts = self.keyParts
+        alias_keys = self.aliasKeys
+        ordered_append = self.orderedKeys.append
+        for qual_name, alias_name, parts, item in values:
+            ordered_append(qual_name)
+            data[qual_name] = item
+            key_parts[qual_name] = parts
+            alias_keys[alias_name] = qual_name
+            alias_keys[qual_name] = alias_name
+
+    def extractLine(self, extract, line_number):
+        """
+            Store the values of a line. The keys given to __setitem__ and addSegmentValues
+            during the extraction are relative to the segment of this line
+            :param extract: function (dictionary, line), see HL7Parser.lineExtractor
+            :param line_number: number of the line, from 1
+        """
+        self.currentLineNumber = line_number
+        start = len(self.orderedKeys)
+        try:
+            extract(self, self.lines[line_number - 1])
+        finally:
+            self.currentLineNumber = None
+            self.currentParts = None
+        if self.largeFields:
+            data = self.data
+            for qual_name in self.orderedKeys[start:]:
+                reference = self.largeFields.get(data[qual_name])
+                if reference is not None:
+                    data[qual_name] = reference
+
     def __contains__(self, key):
         return key in self.aliasKeys
 
@@ -111,7 +246,7 @@ class HL7Dict(UserDict):
             return value
         else:
             # find the values : simple startswith : should it be a regexp ? (more powerful, more slower)
-            values = list(filter(lambda k: k.startswith(key), self.aliasKeys))
+            values = self.keysStartingWith(key)
             if len(values) > 0:
                 return values
             else:
@@ -122,7 +257,54 @@ class HL7Dict(UserDict):
             Get the different keys for 1 defined segment
             :param segment: Segment to find. Ex : PV1, PID
         """
-        return list(filter(lambda x: x.startswith(segment), self.getAliasedKeys()))
+        self.updateIndexes()
+        return self.segmentIndex.startingWith(segment)
+
+    def keysStartingWith(self, prefix):
+        """
+            Get the qualified and aliased keys starting with prefix, in the order of the message
+            :param prefix: partial terser. Ex : PID-3[2]-4
+        """
+        self.updateIndexes()
+        return self.aliasIndex.startingWith(prefix)
+
+    def resetIndexes(self):
+        # aliasIndex : aliased and qualified keys, as in aliasKeys
+        # segmentIndex : aliased keys of the values
+        # structuredIndex : qualified keys by segment name and field, see select
+        self.aliasIndex = PrefixIndex()
+        self.segmentIndex = PrefixIndex(unique=False)
+        self.structuredIndex = StructuredIndex()
+        self.indexedCount = 0
+
+    def updateIndexes(self):
+        """
+            Add the keys stored since the last prefix query to the indexes
+        """
+        ordered_keys = self.orderedKeys
+        if self.indexedCount == len(ordered_keys):
+            return
+        alias_add = self.aliasIndex.add
+        segment_add = self.segmentIndex.add
+        for qual_name in ordered_keys[self.indexedCount:]:
+            alias_name = self.aliasKeys[qual_name]
+            alias_add(alias_name)
+            alias_add(qual_name)
+            segment_add(alias_name)
+        self.indexedCount = len(ordered_keys)
+
+    def select(self, pattern):
+        """
+            Get the values selected by a pattern, see hl7select
+            :param pattern: terser with * for the indexes. Ex : OBX[*]-3-2, PID-3[*]-1
+            :return: a list of (alias, value) couples, in the order of the message
+        """
+        query = SelectPattern(pattern, self.sep)
+        self.structuredIndex.update(self.orderedKeys, self.structuredKeys)
+        data = self.data
+        alias_keys = self.aliasKeys
+        return [(alias_keys[key], data[key])
+                for key in self.structuredIndex.select(query, self.segmentNameCount.get(query.name, 0))]
 
     def getSegmentsList(self):
         """
@@ -130,9 +312,61 @@ class HL7Dict(UserDict):
         """
         return list(self.segmentNameCount.keys())
 
-    def toJSON(self):
-        k, v = self.optimalRepr()
-        return json.dumps(dict(zip(k, v)))
+    def aliasedItems(self):
+        """
+            The (alias, value) couples, in the order of the message
+        """
+        return zip(map(self.aliasKeys.__getitem__, self.orderedKeys), map(self.data.__getitem__, self.orderedKeys))
+
+    def qualifiedItems(self):
+        """
+            The (qualified key, value) couples, in the order of the message
+        """
+        return zip(self.orderedKeys, map(self.data.__getitem__, self.orderedKeys))
+
+    def diff(self, other, ignore=()):
+        """
+            Compare the values with the values of another version of the message, see hl7diff
+            :param other: the other HL7 dictionary
+            :param ignore: select patterns of the fields ignored. Ex : ("MSH-7", "MSH-10"), hl7diff.VOLATILE_FIELDS
+            :return: an HL7Diff : the qualified tersers added by other, removed, and changed
+        """
+        return diffDicts(self, other, ignore)
+
+    def structuredKeys(self, keys):
+        """
+            The indexes of qualified keys : (segment name, occurrence of the segment, field, repetition,
+            component, subcomponent), see hl7json.splitTerser. The indexes are the indexes of the parser
+        """
+        sep = self.sep
+        key_parts = self.keyParts
+        segments = {}
+        for key in keys:
+            segment = key[:key.index(sep)]
+            seg_parts = segments.get(segment)
+            if seg_parts is None:
+                seg_parts = segments[segment] = splitSegment(segment)
+            yield seg_parts + key_parts[key]
+
+    def structuredItems(self):
+        """
+            The values with the indexes of their keys, in the order of the message, see structuredKeys
+        """
+        data = self.data
+        keys = self.orderedKeys
+        return ((*parts, data[key]) for parts, key in zip(self.structuredKeys(keys), keys))
+
+    def nestedRepr(self):
+        """
+            The values as nested dicts and lists : segment, occurrence, field, repetition, component, subcomponent
+        """
+        return nestedRepr(self)
+
+    def toJSON(self, nested=False):
+        """
+            :param nested: nested shape (see nestedRepr) if True, {alias: value} otherwise
+        """
+        return toJSON(self, nested)
 
     def optimalRepr(self):
         keys = list(map(lambda k: self.aliasKeys[k], self.orderedKeys))
@@ -158,6 +392,216 @@ class HL7Dict(UserDict):
             result.append("%s : %s" % (k[ind].ljust(longest), v[ind]))
         return "\n".join(result)
 
+    def lineNumberOf(self, seg_name):
+        """
+            :param seg_name: qualified segment name. Ex : OBX[2]
+            :return: the line number of the segment, from 1
+        """
+        if len(self.segmentLineNumber) != len(self.lineMap) - 1:
+            self.segmentLineNumber = {name: line_number
+                                      for line_number, name in enumerate(self.lineMap) if line_number}
+        return self.segmentLineNumber[seg_name]
+
+    def lineOf(self, key):
+        qual_name = key if key in self.data else self.aliasKeys[key]
+        return self.lineNumberOf(qual_name[:qual_name.index(']') + 1])
+
+    def keyRange(self, line_number):
+        """
+            :return: (start, end), the keys of a line are orderedKeys[start:end]
+        """
+        keys = self.orderedKeys
+        bounds = []
+        for after in (False, True):
+            low, high = 0, len(keys)
+            while low < high:
+                middle = (low + high) // 2
+                key = keys[middle]
+                found = self.lineNumberOf(key[:key.index(']') + 1])
+                if found < line_number or (after and found == line_number):
+                    low = middle + 1
+                else:
+                    high = middle
+            bounds.append(low)
+        return tuple(bounds)
+
+    def getLines(self):
+        """
+            The text of the segments. A dictionary without lines (unpickled) builds them from its values
+        """
+        if self.lines is None:
+            header_segment = self.parser.header_segment if self.parser is not None else "MSH"
+            lines = [seg_name[:seg_name.rindex('[')] for seg_name in self.lineMap[1:]]
+            values = {}
+            for name, occurrence, *indexes in self.structuredItems():
+                values.setdefault("%s[%d]" % (name, occurrence), []).append(indexes)
+            for seg_name, items in values.items():
+                line_number = self.lineNumberOf(seg_name)
+                lines[line_number - 1] = encodeSegment(lines[line_number - 1], items, self.separators, header_segment)
+            self.lines = lines
+        return self.lines
+
+    def toHL7(self, line_separator="\r"):
+        """
+            Write the message. The segments are written as they are parsed, or as they are rebuilt by setValue
+            :param line_separator: separator of the segments
+        """
+        text = line_separator.join(self.getLines())
+        return expandReferences(text, self.largeFields) if self.largeFields else text
+
+    def locate(self, terser):
+        """
+            :return: (segment name, occurrence, field, repetition, component, subcomponent) of a terser
+        """
+        qual_name = terser if terser in self.data else self.aliasKeys.get(terser)
+        if qual_name is not None and qual_name in self.data:
+            return splitSegment(qual_name[:qual_name.index(self.sep)]) + self.keyParts[qual_name]
+
+        seg_part, sep, rest = terser.partition(self.sep)
+        try:
+            name, occurrence = splitSegment(seg_part)
+            field, occu, compo, sub = splitField(rest, self.sep)
+        except (IndexError, ValueError):
+            raise ValueError("%s is not the terser of a value. Ex : PID-3-1, OBX[2]-5" % terser) from None
+        if '[' not in seg_part and self.segmentNameCount.get(name, 0) > 1:
+            raise ValueError("%s : %d %s segments, the occurrence is needed. Ex : %s[1]%s%s" % (
+                terser, self.segmentNameCount[name], name, name, sep, rest))
+        if 1 <= occurrence <= self.segmentNameCount.get(name, 0):
+            # a new value of an existing field : its text tells a component from a subcomponent
+            header_segment = self.parser.header_segment if self.parser is not None else "MSH"
+            line = self.getLines()[self.lineNumberOf("%s[%d]" % (name, occurrence)) - 1]
+            occu, compo, sub = terserLevels(segmentField(line, self.separators[0], header_segment, field),
+                                            self.separators, occu, compo, sub)
+        return name, occurrence, field, occu, compo, sub
+
+    def setValue(self, terser, value):
+        """ Set the value of a terser, existing or new. Only the text of its segment is rebuilt.
+        The terser of the next occurrence of a segment adds a segment after the last one. Ex : OBX[5]-3 with 4 OBX
+
+        :param terser: qualified or aliased terser. Ex : PID-3-1, OBX[2]-05
+        :param value: the value, written as is (escape sequences included). It may contain the separators
+            of the levels under the terser. Ex : "EVERYMAN^ADAM" for PID-5. None or "" clears the value
+        """
+        name, occurrence, field, occu, compo, sub = self.locate(terser)
+        value = value or ""
+        separators = self.separators
+        level_seps = levelSeparators(separators)
+        depth = 3 if sub else 2 if compo else 1 if occu else 0
+        forbidden = separators[0] + "".join(level_seps[:depth])
+        if any(sep in value for sep in forbidden):
+            raise ValueError("%s : the value must not contain the separators %s" % (terser, forbidden))
+
+        lines = self.getLines()
+        seg_name = "%s[%d]" % (name, occurrence)
+        count = self.segmentNameCount.get(name, 0)
+        if occurrence == count + 1:
+            self.insertSegment(name)
+        elif not 1 <= occurrence <= count:
+            raise ValueError("%s : segment %s not found" % (terser, seg_name))
+
+        line_number = self.lineNumberOf(seg_name)
+        header_segment = self.parser.header_segment if self.parser is not None else "MSH"
+        lines[line_number - 1] = replaceValue(lines[line_number - 1], separators, header_segment,
+                                              field, occu, compo, sub, value)
+
+        qual_name = terser if terser in self.data else self.aliasKeys.get(terser)
+        if value and qual_name in self.data and not any(sep in value for sep in level_seps):
+            # same keys, only the value changes
+            self.data[qual_name] = value
+        else:
+            self.parseLine(line_number)
+
+    def insertSegment(self, name):
+        """
+            Add an empty segment after the last segment with this name, or at the end of the message
+        """
+        if self.parser is None:
+            raise ValueError("Segments can only be added to a dictionary built by HL7Parser.parse")
+        lines = self.getLines()
+        count = self.segmentNameCount.get(name, 0)
+        position = self.lineNumberOf("%s[%d]" % (name, count)) if count else len(lines)
+        lines.insert(position, name)
+        self.rebuild()
+
+    def rebuild(self):
+        """
+            Parse again all the lines
+        """
+        self.data.clear()
+        self.orderedKeys = []
+        self.aliasKeys = {}
+        self.keyParts = {}
+        self.aliasSegmentName = {}
+        self.segmentLineNumber = {}
+        self.resetIndexes()
+        self.setSegmentsMap(*self.parser.buildSegmentMap(self.lines))
+        extract = self.parser.lineExtractor()
+        for line_number in range(1, len(self.lines) + 1):
+            self.extractLine(extract, line_number)
+
+    def parseLine(self, line_number):
+        """
+            Replace the values of a line by the values of its text
+        """
+        if self.parser is None:
+            raise ValueError("The keys of a segment can only be changed in a dictionary built by HL7Parser.parse")
+        start, end = self.keyRange(line_number)
+        alias_keys = self.aliasKeys
+        for qual_name in self.orderedKeys[start:end]:
+            del self.data[qual_name]
+            del self.keyParts[qual_name]
+            alias_name = alias_keys.pop(qual_name)
+            if alias_keys.get(alias_name) == qual_name:
+                del alias_keys[alias_name]
+
+        tail = self.orderedKeys[end:]
+        del self.orderedKeys[start:]
+        self.extractLine(self.parser.lineExtractor(), line_number)
+        self.orderedKeys.extend(tail)
+        if tail:
+            # keep the order of the message
+            self.data = {key: self.data[key] for key in self.orderedKeys}
+        self.resetIndexes()
+
+    def __reduce__(self):
+        """
+            Pickle the keys and values as flat lists instead of the dictionaries and the indexes,
+            the dictionary is rebuilt by fromState. The text of the segments is pickled for toHL7 :
+            the values do not keep the empty components and subcomponents
+        """
+        values = list(map(self.data.__getitem__, self.orderedKeys))
+        aliases = list(map(self.aliasKeys.__getitem__, self.orderedKeys))
+        parts = list(map(self.keyParts.__getitem__, self.orderedKeys))
+        lines = self.lines
+        if lines is not None and self.largeFields:
+            # the large fields are pickled as their text, see FieldReference
+            lines = [expandReferences(line, self.largeFields) for line in lines]
+        return HL7Dict.fromState, (self.sep, getattr(self, "separators", None), self.segmentNameCount,
+                                   self.lineMap, self.orderedKeys, values, aliases, parts, lines)
+
+    @classmethod
+    def fromState(cls, terser_separator, separators, segmentNameCount, lineMap, orderedKeys, values, aliases, parts,
+                  lines=None):
+        """
+            Build an HL7 dictionary from its keys and values
+            :param orderedKeys: the qualified keys, in the order of the message
+            :param values: the values of the keys
+            :param aliases: the aliases of the keys
+            :param parts: the indexes of the keys, see keyParts
+            :param lines: the text of the segments, None to build them from the values
+        """
+        hl7dict = cls(terser_separator)
+        hl7dict.separators = separators
+        if segmentNameCount is not None:
+            hl7dict.setSegmentsMap(segmentNameCount, lineMap)
+        hl7dict.orderedKeys = orderedKeys
+        hl7dict.data = dict(zip(orderedKeys, values))
+        hl7dict.keyParts = dict(zip(orderedKeys, parts))
+        hl7dict.lines = lines
+        # same order as __setitem__ : alias, then qualified name
+        hl7dict.aliasKeys = dict(chain.from_iterable(zip(zip(aliases, orderedKeys), zip(orderedKeys, aliases))))
+        return hl7dict
+
     def setSegmentsMap(self, segmentNameCount, lineMap):
         """
             Set the segments map
@@ -175,3 +619,150 @@ class HL7Dict(UserDict):
             if segmentNameCount[seg_name] == 1:
                 self.aliasSegmentName[seg_name] = seg_name + "[1]"
                 self.aliasSegmentName[seg_name + "[1]"] = seg_name
+
+
+class LazyHL7Dict(HL7Dict):
+    """
+    HL7 dictionary which keeps the lines of the message and tokenizes a segment
+    the first time one of its tersers is requested (get, [], in, getSegmentKeys).
+    Iterating over the whole dictionary (keys, items, toJSON, toString) tokenizes
+    all the segments, the result is the same as an HL7Dict.
+
+    >>> myhl7dict = hl7p.parse(hl7message, lazy=True)
+    >>> myhl7dict["PID-3-1"]   # only the PID segment is tokenized
+    """
+    def __init__(self, terser_separator="-"):
+        HL7Dict.__init__(self, terser_separator)
+        self.extract = None
+        self.segmentLines = {}
+        self.parsedLines = set()
+        self.lastParsedLine = 0
+        self.inOrder = True
+
+    def setLines(self, lines, extract):
+        """
+            Set the lines of the message, parsed later
+            :param lines: the segments of the message, the lineMap must be set
+            :param extract: function (dictionary, line) storing the values of a line in the dictionary.
+            Ex : HL7Parser.extractValues
+        """
+        self.lines = lines
+        self.extract = extract
+        # qualified segment name PID[1] -> line number
+        # segment name PID -> list of line numbers
+        for line_number in range(1, len(self.lineMap)):
+            seg_name = self.lineMap[line_number]
+            self.segmentLineNumber[seg_name] = line_number
+            self.segmentLines.setdefault(seg_name[:seg_name.rindex('[')], []).append(line_number)
+
+    def parseLines(self, line_numbers):
+        for line_number in line_numbers:
+            if line_number not in self.parsedLines:
+                if line_number < self.lastParsedLine:
+                    self.inOrder = False
+                self.lastParsedLine = max(line_number, self.lastParsedLine)
+                self.parsedLines.add(line_number)
+                self.extractLine(self.extract, line_number)
+
+    def parseSegmentsFor(self, terser):
+        """
+            Tokenize the segments which may own a terser starting with the given expression
+            :param terser: full or partial terser. Ex : PID-3-1, PID[1], OB
+        """
+        if len(self.parsedLines) == len(self.lines):
+            return
+        line_numbers = []
+        for name, numbers in self.segmentLines.items():
+            if name.startswith(terser) or terser.startswith(name):
+                line_numbers.extend(numbers)
+        line_numbers.sort()
+        self.parseLines(line_numbers)
+
+    def parseAll(self):
+        """
+            Tokenize all the segments. If they were tokenized out of order, the dictionary is rebuilt
+            to keep the order of the message
+        """
+        if self.inOrder and len(self.parsedLines) == len(self.lines):
+            return
+        if not self.inOrder or self.lastParsedLine != len(self.parsedLines):
+            self.data.clear()
+            self.orderedKeys = []
+            self.aliasKeys = {}
+            self.keyParts = {}
+            self.resetIndexes()
+            self.parsedLines = set()
+            self.lastParsedLine = 0
+            self.inOrder = True
+        self.parseLines(range(1, len(self.lines) + 1))
+
+    def __reduce__(self):
+        # pickled as an HL7Dict
+        self.parseAll()
+        return HL7Dict.__reduce__(self)
+
+    def setValue(self, terser, value):
+        self.parseAll()
+        HL7Dict.setValue(self, terser, value)
+
+    def rebuild(self):
+        HL7Dict.rebuild(self)
+        self.segmentLines = {}
+        self.setLines(self.lines, self.extract)
+        self.parsedLines = set(range(1, len(self.lines) + 1))
+        self.lastParsedLine = len(self.lines)
+        self.inOrder = True
+
+    def __contains__(self, key):
+        self.parseSegmentsFor(key)
+        return HL7Dict.__contains__(self, key)
+
+    def __iter__(self):
+        self.parseAll()
+        return HL7Dict.__iter__(self)
+
+    def __len__(self):
+        self.parseAll()
+        return HL7Dict.__len__(self)
+
+    def get(self, terser):
+        self.parseSegmentsFor(terser)
+        value = HL7Dict.get(self, terser)
+        if isinstance(value, list) and not self.inOrder:
+            value.sort(key=self.lineOf)
+        return value
+
+    def getAliasedKeys(self):
+        self.parseAll()
+        return HL7Dict.getAliasedKeys(self)
+
+    def getSegmentKeys(self, segment):
+        self.parseSegmentsFor(segment)
+        keys = HL7Dict.getSegmentKeys(self, segment)
+        if not self.inOrder:
+            keys.sort(key=self.lineOf)
+        return keys
+
+    def select(self, pattern):
+        query = SelectPattern(pattern, self.sep)
+        self.parseSegmentsFor(query.name)
+        selected = HL7Dict.select(self, pattern)
+        if not self.inOrder:
+            selected.sort(key=lambda item: self.lineOf(item[0]))
+        return selected
+
+    def optimalRepr(self):
+        self.parseAll()
+        return HL7Dict.optimalRepr(self)
+
+    def aliasedItems(self):
+        self.parseAll()
+        return HL7Dict.aliasedItems(self)
+
+    def qualifiedItems(self):
+        self.parseAll()
+        return HL7Dict.qualifiedItems(self)
+
+    def structuredItems(self):
+        self.parseAll()
+        return HL7Dict.structuredItems(self)
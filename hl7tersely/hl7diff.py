@@ -0,0 +1,174 @@
+r"""Message differences. Compare two versions of a message, value by value.
+
+The differences are given by qualified terser (OBX[2]-05, PID[1]-03[2]-04), the keys of the
+HL7 dictionaries : the values added to the second message, removed from the first one, and changed.
+
+>>> diff = hl7p.diff(previous, update, ignore=VOLATILE_FIELDS)
+>>> diff
+<HL7Diff 0 added, 0 removed, 1 changed>
+>>> diff.changed
+{'PID[1]-5-1': ('EVERYMAN', 'DOE')}
+>>> if not diff:
+...     print("same message")
+
+HL7Parser.diff compares the raw messages : the segments with the same qualified name and the same
+text are skipped, only the segments which differ are tokenized. HL7Dict.diff compares two
+dictionaries already parsed. Both give the same differences.
+
+The fields ignored are written as select patterns (see hl7select) : MSH-7 ignores MSH-7 and its
+components, OBX[*]-14 the field 14 of all the OBX segments.
+"""
+
+from hl7tersely.hl7charset import decodeMessage
+from hl7tersely.hl7json import splitSegment
+from hl7tersely.hl7select import SelectPattern
+
+__version__ = "1.3"
+__all__ = ["HL7Diff", "VOLATILE_FIELDS", "diffDicts", "diffMessages"]
+
+# date and control ID of the message, different in each version of a message
+VOLATILE_FIELDS = ("MSH-7", "MSH-10")
+
+
+class HL7Diff:
+    """
+    Differences between two messages, by qualified terser, in the order of the messages
+    """
+    def __init__(self):
+        # terser -> value of the second message
+        self.added = {}
+        # terser -> value of the first message
+        self.removed = {}
+        # terser -> (value of the first message, value of the second message)
+        self.changed = {}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def __repr__(self):
+        return "<HL7Diff %d added, %d removed, %d changed>" % (len(self.added), len(self.removed), len(self.changed))
+
+    def __eq__(self, other):
+        return isinstance(other, HL7Diff) and (self.added, self.removed, self.changed) == \
+            (other.added, other.removed, other.changed)
+
+    def tersers(self):
+        """
+            :return: the tersers of all the differences
+        """
+        return list(self.removed) + list(self.changed) + list(self.added)
+
+    def toDict(self):
+        """
+            :return: {"added": {...}, "removed": {...}, "changed": {terser: [first value, second value]}}
+        """
+        return {"added": dict(self.added), "removed": dict(self.removed),
+                "changed": {terser: list(values) for terser, values in self.changed.items()}}
+
+
+class IgnoredFields:
+    """The select patterns of the fields ignored, by (segment name, field)
+    """
+    def __init__(self, patterns, terser_separator):
+        self.patterns = {}
+        for pattern in patterns:
+            query = SelectPattern(pattern, terser_separator)
+            self.patterns.setdefault((query.name, query.field), []).append(query)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def ignored(self, indexes, counts):
+        """
+            :param indexes: the indexes of a value, see structuredEntries
+            :param counts: count of the segments by name, in the message of the value
+        """
+        name, occurrence, field, repetition, component, subcomponent = indexes
+        return any(query.matches(occurrence, counts.get(name, 0), repetition, component, subcomponent)
+                   for query in self.patterns.get((name, field), ()))
+
+
+def structuredEntries(hl7dict):
+    """
+        The (qualified terser, indexes, value) of a dictionary, the indexes are (segment name, occurrence,
+        field, repetition, component, subcomponent), see HL7Dict.structuredItems
+    """
+    return ((terser, parts[:-1], value)
+            for (terser, value), parts in zip(hl7dict.qualifiedItems(), hl7dict.structuredItems()))
+
+
+def addDifferences(diff, entries_a, entries_b, ignored, counts_a, counts_b):
+    """
+        Add the differences of two lists of (qualified terser, indexes, value), see structuredEntries
+    """
+    entries_b = {terser: (indexes, value) for terser, indexes, value in entries_b}
+    keys_a = set()
+    for terser, indexes, value in entries_a:
+        keys_a.add(terser)
+        entry_b = entries_b.get(terser)
+        if entry_b is None:
+            if not (ignored and ignored.ignored(indexes, counts_a)):
+                diff.removed[terser] = value
+        elif entry_b[1] != value and not (ignored and ignored.ignored(indexes, counts_a)):
+            diff.changed[terser] = (value, entry_b[1])
+    for terser, (indexes, value) in entries_b.items():
+        if terser not in keys_a and not (ignored and ignored.ignored(indexes, counts_b)):
+            diff.added[terser] = value
+
+
+def diffDicts(hl7dict_a, hl7dict_b, ignore=()):
+    """ Differences between two HL7 dictionaries, see HL7Dict.diff
+
+    :param ignore: select patterns of the fields ignored. Ex : VOLATILE_FIELDS
+    :return: an HL7Diff
+    """
+    diff = HL7Diff()
+    addDifferences(diff, structuredEntries(hl7dict_a), structuredEntries(hl7dict_b),
+                   IgnoredFields(ignore, hl7dict_a.sep), hl7dict_a.segmentNameCount, hl7dict_b.segmentNameCount)
+    return diff
+
+
+def diffMessages(parser, msg_a, msg_b, ignore=(), encoding=None):
+    """ Differences between two messages, see HL7Parser.diff. The segments with the same
+    qualified name and the same text are skipped, the others are tokenized
+
+    :param ignore: select patterns of the fields ignored. Ex : VOLATILE_FIELDS
+    :param encoding: codec of binary messages, the character set of MSH-18 by default
+    :return: an HL7Diff
+    """
+    diff = HL7Diff()
+    if msg_a == msg_b:
+        return diff
+
+    messages = []
+    for msg in (msg_a, msg_b):
+        msg_ = decodeMessage(msg, encoding, parser.header_segment).strip('\r\n ')
+        separators = parser.messageSeparators(msg_)
+        lines = msg_.replace('\r', '\n').split('\n')
+        counts, line_map = parser.buildSegmentMap(lines)
+        messages.append((separators, dict(zip(line_map[1:], lines)), counts))
+    (separators_a, segments_a, counts_a), (separators_b, segments_b, counts_b) = messages
+    ignored = IgnoredFields(ignore, parser.tersersep)
+    sep = parser.tersersep
+
+    def qualifiedEntries(separators, seg_name, line):
+        if line is None:
+            return ()
+        prefix = seg_name + sep
+        seg_parts = splitSegment(seg_name)
+        return [(prefix + key, seg_parts + parts, value)
+                for key, parts, value in parser.segmentEntries(separators, line)]
+
+    # the segments of the first message, then the segments added to the second message
+    names = list(segments_a) + [seg_name for seg_name in segments_b if seg_name not in segments_a]
+    for seg_name in names:
+        line_a = segments_a.get(seg_name)
+        line_b = segments_b.get(seg_name)
+        if line_a == line_b and separators_a == separators_b:
+            continue
+        addDifferences(diff, qualifiedEntries(separators_a, seg_name, line_a),
+                       qualifiedEntries(separators_b, seg_name, line_b), ignored, counts_a, counts_b)
+    return diff
@@ -0,0 +1,98 @@
+r"""HL7 encoder. Write values in the text of a segment, build a segment from its values.
+
+The values are written as they are stored in the HL7 dictionaries, the escape
+sequences (\F\, \S\, ...) are not decoded nor encoded.
+
+>>> replaceValue("PID|1||12345^5^M10", "|^~\\&", "MSH", 3, 0, 1, 0, "67890")
+'PID|1||67890^5^M10'
+>>> encodeSegment("PID", [(3, 0, 1, 0, "12345"), (3, 0, 3, 0, "M10"), (5, 0, 0, 0, "EVERYMAN")], "|^~\\&")
+'PID|||12345^^M10||EVERYMAN'
+"""
+
+__version__ = "1.3"
+__all__ = ["replaceValue", "encodeSegment", "levelSeparators"]
+
+
+def levelSeparators(separators):
+    # separators of the repetitions, components and subcomponents
+    return separators[2], separators[1], separators[4]
+
+
+def replaceIn(text, levels, value):
+    """ Replace a part of a text split by several separators.
+    :param levels: list of (index, separator) couples, from the upper level. The trailing 0 indexes
+        replace the whole part, a 0 index followed by another index is the first part
+    """
+    if not any(index for index, _ in levels):
+        return value
+    (index, sep), deeper = levels[0], levels[1:]
+    parts = text.split(sep)
+    position = max(index, 1) - 1
+    if position >= len(parts):
+        parts.extend([""] * (position + 1 - len(parts)))
+    parts[position] = replaceIn(parts[position], deeper, value) if any(i for i, _ in deeper) else value
+    return sep.join(parts)
+
+
+def replaceValue(line, separators, header_segment, field, occu, compo, sub, value):
+    """ Set a value in the text of a segment. The other values are kept as they are.
+
+    :param line: the text of the segment
+    :param separators: separators of the message
+    :param header_segment: name of the header segment : its first 2 fields are the separators
+    :param field: field number, from 1
+    :param occu: repetition, 0 for the whole field
+    :param compo: component, 0 for the whole repetition
+    :param sub: subcomponent, 0 for the whole component
+    :param value: the new text
+    :return: the text of the segment
+    """
+    field_sep = separators[0]
+    fields = line.split(field_sep)
+    index = field
+    if fields[0] == header_segment:
+        if field in (1, 2):
+            raise ValueError("%s-1 and %s-2 are the separators, they can not be set"
+                             % (header_segment, header_segment))
+        index = field - 1
+    if index < 1:
+        raise ValueError("Field %d does not exist" % field)
+    if index >= len(fields):
+        fields.extend([""] * (index + 1 - len(fields)))
+    fields[index] = replaceIn(fields[index], list(zip((occu, compo, sub), levelSeparators(separators))), value)
+    return field_sep.join(fields)
+
+
+def joinLevel(values, seps):
+    # values : dict {index: value or dict of the next level}, 0 when this level is not split
+    if 0 in values:
+        value = values[0]
+        return value if isinstance(value, str) else joinLevel(value, seps[1:])
+    sep = seps[0]
+    return sep.join(joinLevel(values[index], seps[1:]) if isinstance(values.get(index), dict) else
+                    values.get(index, "") for index in range(1, max(values) + 1))
+
+
+def encodeSegment(name, values, separators, header_segment="MSH"):
+    """ Build the text of a segment from its values.
+
+    :param name: the segment name. Ex : PID
+    :param values: iterable of (field, repetition, component, subcomponent, value), like hl7scanner.tokenizeSegment
+        without the positions. The indexes are 0 when the value is not split at this level
+    :param separators: separators of the message
+    :param header_segment: name of the header segment : its first 2 fields are the separators
+    :return: the text of the segment
+    """
+    fields = {}
+    for field, occu, compo, sub, value in values:
+        fields.setdefault(field, {}).setdefault(occu, {}).setdefault(compo, {})[sub] = value
+
+    parts = [name]
+    first = 1
+    if name == header_segment:
+        parts.append(separators[1:])
+        first = 3
+    seps = levelSeparators(separators)
+    for field in range(first, max(fields, default=0) + 1):
+        parts.append(joinLevel(fields[field], seps) if field in fields else "")
+    return separators[0].join(parts)
@@ -0,0 +1,173 @@
+r"""Message filters. Screen the messages of a feed on the raw text, before parsing them.
+
+The predicates are compiled once by HL7Parser.compileFilter. A predicate tests the value of an
+exact terser, the value returned by HL7Dict.get for the same terser :
+
+    equals  : the value is the operand
+    in      : the value is one of the operands
+    prefix  : the value starts with the operand
+    regex   : the operand (a pattern) is found in the value, see re.search
+
+A message is accepted if all the predicates are true. The predicates are checked on the raw text :
+    - the text of the operands (equals, in, prefix) is searched first in the whole message, a message
+      without it is rejected without reading its segments
+    - a header predicate (MSH-9-1) reads only the MSH line
+    - a segment predicate finds the lines of its segment, and splits them only up to its field
+
+>>> accept = hl7p.compileFilter([("MSH-9-1", "equals", "ORU"), ("MSH-9-2", "equals", "R01"),
+...                              ("MSH-4", "in", ["LAB1", "LAB2"]), ("OBX[*]-3-1", "in", codes)])
+>>> for offset, hl7dict in hl7p.iterParse(feed, accept=accept):
+...     print(hl7dict["MSH-10"])
+
+The messages rejected are not parsed by iterParse, parseMany, parseConcurrent and table.
+A terser of a segment written with [*] is true if the value of one of the segments is true.
+A binary message is decoded (MSH-18 or the encoding of the filter) only if its bytes hold the operands.
+"""
+
+import codecs
+import re
+
+from hl7tersely.hl7charset import decodeMessage, messageEncoding
+from hl7tersely.hl7projection import TerserPlan, lineValue
+
+__version__ = "1.3"
+__all__ = ["HL7Filter", "OPERATORS"]
+
+OPERATORS = ("equals", "in", "prefix", "regex")
+
+LINE_END = re.compile(r"[\r\n]")
+NOT_BLANK = re.compile(r"[^\r\n ]")
+
+
+class FilterPredicate:
+    """One predicate of a filter : a terser, an operator and its operand
+    """
+    def __init__(self, parser, terser, operator, operand):
+        self.plan = TerserPlan(terser, parser)
+        if self.plan.field is None or self.plan.occurrence == -1:
+            raise ValueError("%s : a filter tests the values of exact tersers. Ex : PID-3-1, OBX[*]-3-1" % terser)
+        if operator not in OPERATORS:
+            raise ValueError("Unknown operator %s, expected one of %s" % (operator, ", ".join(OPERATORS)))
+        self.operator = operator
+
+        # text which must be in the message for the predicate to be true
+        self.needles = None
+        if operator in ("equals", "prefix") and not isinstance(operand, str):
+            raise ValueError("%s %s : the operand must be a str, found %r" % (terser, operator, operand))
+        if operator == "in":
+            if isinstance(operand, str) or not all(isinstance(value, str) for value in operand):
+                raise ValueError("%s in : the operand must be a list of str, found %r" % (terser, operand))
+            self.operand = frozenset(operand)
+            self.needles = tuple(self.operand)
+        elif operator == "regex":
+            self.operand = re.compile(operand)
+        else:
+            self.operand = operand
+            self.needles = (operand,)
+        # the needles searched in a binary message, only the ASCII text has the same bytes in all the encodings
+        self.binaryNeedles = None
+        if self.needles is not None and all(needle.isascii() for needle in self.needles):
+            self.binaryNeedles = tuple(needle.encode("ascii") for needle in self.needles)
+
+    def test(self, value):
+        if value is None:
+            return False
+        if self.operator == "equals":
+            return value == self.operand
+        if self.operator == "in":
+            return value in self.operand
+        if self.operator == "prefix":
+            return value.startswith(self.operand)
+        return self.operand.search(value) is not None
+
+
+class HL7Filter:
+    """
+    Predicates on the values of HL7 messages, checked on their raw text. See HL7Parser.compileFilter
+    """
+    def __init__(self, parser, predicates, encoding=None):
+        """
+            :param parser: the HL7Parser of the messages
+            :param predicates: list of (terser, operator, operand) tuples, see OPERATORS
+            :param encoding: codec of the binary messages, the character set of MSH-18 by default
+        """
+        self.parser = parser
+        self.encoding = encoding
+        self.predicates = [FilterPredicate(parser, *predicate) for predicate in predicates]
+        # segment name -> pattern of the lines of the segment
+        self.linePatterns = {}
+
+    def __call__(self, msg):
+        """
+            :param msg: the message, str or bytes
+            :return: True if the message is accepted
+        """
+        if not isinstance(msg, str):
+            if isinstance(msg, (bytes, bytearray)):
+                codec = codecs.lookup(messageEncoding(msg, self.encoding, self.parser.header_segment)).name
+                # the ASCII characters are written on 2 or 4 bytes by UTF-16 and UTF-32
+                if not codec.startswith(("utf-16", "utf-32")) and \
+                        not all(self.contains(msg, predicate.binaryNeedles) for predicate in self.predicates):
+                    return False
+            msg = decodeMessage(msg, self.encoding, self.parser.header_segment)
+        elif not all(self.contains(msg, predicate.needles) for predicate in self.predicates):
+            return False
+        return self.check(msg)
+
+    def accepted(self, messages):
+        """
+            :return: generator of the messages accepted
+        """
+        return (msg for msg in messages if self(msg))
+
+    @staticmethod
+    def contains(msg, needles):
+        return needles is None or any(needle in msg for needle in needles)
+
+    def check(self, msg):
+        """
+            Check the predicates on the lines of their segments
+        """
+        parser = self.parser
+        first = NOT_BLANK.search(msg)
+        start = first.start() if first else 0
+        separators = parser.messageSeparators(msg[start:start + parser.segment_len + parser.separator_count])
+
+        segments = {}
+        for predicate in self.predicates:
+            plan = predicate.plan
+            lines = segments.get(plan.name)
+            if lines is None:
+                lines = segments[plan.name] = self.segmentLines(msg, start, plan.name)
+            if plan.wildcard:
+                candidates = lines
+            else:
+                occurrence = plan.occurrence
+                if occurrence is None:
+                    # alias form PID-3-1, only for a segment present once
+                    occurrence = 1 if len(lines) == 1 else 0
+                candidates = lines[occurrence - 1:occurrence] if occurrence > 0 else ()
+            if not (plan.namesSegment(len(lines)) and
+                    any(predicate.test(lineValue(parser, separators, line, plan)) for line in candidates)):
+                return False
+        return True
+
+    def segmentLines(self, msg, start, name):
+        """
+            :return: the lines of the segments of a name, the message is searched, not split.
+                The segments are named by their first characters, like HL7Parser.buildSegmentMap
+        """
+        if len(name) != self.parser.segment_len:
+            return []
+        pattern = self.linePatterns.get(name)
+        if pattern is None:
+            pattern = self.linePatterns[name] = re.compile("[\r\n]" + re.escape(name))
+
+        starts = [start] if msg.startswith(name, start) else []
+        starts.extend(match.start() + 1 for match in pattern.finditer(msg, start))
+        lines = []
+        for line_start in starts:
+            line_end = LINE_END.search(msg, line_start)
+            # the blanks at the end of the message are not part of its last line
+            lines.append(msg[line_start:line_end.start()] if line_end else msg[line_start:].rstrip(" "))
+        return lines
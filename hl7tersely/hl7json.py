@@ -0,0 +1,155 @@
+r"""JSON serialization of the HL7 dictionaries.
+
+The values are written in one pass, from the values stored by the dictionary,
+in the order of the message. Two shapes :
+    flat   : {terser: value}, the tersers are the aliases, like HL7Dict.optimalRepr
+    nested : {segment: [occurrence: {field: value}]}, a field is a list of its repetitions
+             when it repeats, a field or a repetition is a dict of its components when it
+             has components, a component is a dict of its subcomponents when it has subcomponents.
+             The subcomponents of a field without components are in its component 1
+
+>>> hl7dict.toJSON(nested=True)
+'{"MSH": [{"1": "|", "2": "^~\\\\&", ..., "9": {"1": "ORU", "2": "R01"}, ...}], "PID": [...]}'
+
+Many messages are written as NDJSON, one message per line :
+    >> with open("messages.ndjson", "w") as outf:
+    ..     dumpNDJSON(map(hl7p.parse, messages), outf)
+
+The output is ASCII, like json.dumps.
+"""
+
+import io
+import json
+from json.encoder import encode_basestring_ascii
+
+__version__ = "1.3"
+__all__ = ["toJSON", "nestedRepr", "dumpNDJSON", "splitTerser", "splitTersers"]
+
+
+def encodeValue(value):
+    # the values of a parsed message are strings (FieldReference for a large field), others values are set by the user
+    return encode_basestring_ascii(value) if value.__class__ is str else json.dumps(value, default=str)
+
+
+def splitTerser(key, terser_separator="-"):
+    """ Split a qualified terser
+
+    :param key: qualified terser. Ex : PID[1]-03[2]-04-01
+    :return: (segment name, occurrence of the segment, field, repetition, component, subcomponent),
+        the indexes are 0 when the value is not split at this level. Ex : ("PID", 1, 3, 2, 4, 1)
+        A single index after the field is read as a component : the subcomponent of a field without
+        components has the same terser (see hl7scanner), the dictionaries keep the indexes of their values
+    """
+    segment, _, rest = key.partition(terser_separator)
+    return splitSegment(segment) + splitField(rest, terser_separator)
+
+
+def splitSegment(segment):
+    name, _, occurrence = segment.partition('[')
+    return name, int(occurrence[:-1]) if occurrence else 1
+
+
+def splitField(key, terser_separator):
+    parts = key.split(terser_separator)
+    field, _, repetition = parts[0].partition('[')
+    return (int(field), int(repetition[:-1]) if repetition else 0,
+            int(parts[1]) if len(parts) > 1 else 0, int(parts[2]) if len(parts) > 2 else 0)
+
+
+def splitTersers(keys, terser_separator="-"):
+    """
+        Split qualified tersers, see splitTerser. The segment and field parts are split once
+    """
+    segments = {}
+    fields = {}
+    for key in keys:
+        segment, _, rest = key.partition(terser_separator)
+        seg_parts = segments.get(segment)
+        if seg_parts is None:
+            seg_parts = segments[segment] = splitSegment(segment)
+        field_parts = fields.get(rest)
+        if field_parts is None:
+            field_parts = fields[rest] = splitField(rest, terser_separator)
+        yield seg_parts + field_parts
+
+
+def flatPairs(hl7dict):
+    try:
+        return [f"{encode_basestring_ascii(key)}: {encode_basestring_ascii(value)}"
+                for key, value in hl7dict.aliasedItems()]
+    except TypeError:
+        # a value which is not a string
+        return [f"{encode_basestring_ascii(key)}: {encodeValue(value)}" for key, value in hl7dict.aliasedItems()]
+
+
+def nestedRepr(hl7dict):
+    """
+        :return: the values of the dictionary as nested dicts and lists, see the nested shape
+    """
+    result = {}
+    names = {}
+    for name, occurrence, field, repetition, component, subcomponent, value in hl7dict.structuredItems():
+        occurrences = result.get(name)
+        if occurrences is None:
+            occurrences = result[name] = []
+        while len(occurrences) < occurrence:
+            occurrences.append({})
+        node = occurrences[occurrence - 1]
+        key = names.get(field) or names.setdefault(field, str(field))
+        if repetition:
+            repetitions = node.get(key)
+            if repetitions.__class__ is not list:
+                repetitions = node[key] = []
+            while len(repetitions) < repetition:
+                repetitions.append(None)
+            node, key = repetitions, repetition - 1
+        if component or subcomponent:
+            # PID|1|&&x : the subcomponent 3 of a field without components is in its component 1
+            component = component or 1
+            child = node.get(key) if node.__class__ is dict else node[key]
+            if child.__class__ is not dict:
+                child = node[key] = {}
+            node, key = child, names.get(component) or names.setdefault(component, str(component))
+            if subcomponent:
+                child = node.get(key)
+                if child.__class__ is not dict:
+                    child = node[key] = {}
+                node, key = child, names.get(subcomponent) or names.setdefault(subcomponent, str(subcomponent))
+        node[key] = value
+    return result
+
+
+def toJSON(hl7dict, nested=False):
+    """
+        :param hl7dict: HL7Dict, LazyHL7Dict or CompactHL7Dict
+        :param nested: nested shape if True, flat shape otherwise
+        :return: the JSON string
+    """
+    if nested:
+        return json.dumps(nestedRepr(hl7dict), default=str)
+    return "{%s}" % ", ".join(flatPairs(hl7dict))
+
+
+def dumpNDJSON(messages, fileobj, nested=False):
+    """ Write messages as NDJSON, one JSON object per line.
+    The messages are encoded one at a time, the JSON of the whole batch is not built in memory.
+
+    :param messages: iterable of HL7Dict, LazyHL7Dict or CompactHL7Dict
+    :param fileobj: file object opened in text or binary mode
+    :param nested: nested shape if True, flat shape otherwise
+    :return: the count of messages written
+    """
+    binary = isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase))
+    stream = io.TextIOWrapper(fileobj, encoding="ascii", newline="\n") if binary else fileobj
+    write = stream.write
+    count = 0
+    try:
+        for hl7dict in messages:
+            write(toJSON(hl7dict, nested))
+            write("\n")
+            count += 1
+    finally:
+        if binary:
+            stream.flush()
+            stream.detach()
+    return count
@@ -0,0 +1,250 @@
+r"""MLLP server. Receive HL7 messages over MLLP with asyncio, parse them and send the ACKs.
+
+Each message is framed by the 0x0B and 0x1C 0x0D characters (Minimal Lower Layer Protocol).
+The messages of a connection are handled one at a time : the next message is read
+once the ACK of the previous one is sent, a slow handler slows down its sender only.
+
+Usage:
+    >> async def handler(hl7dict):
+    ..     print(hl7dict["MSH-10"])
+    >> server = MLLPServer(handler=handler)
+    >> await server.start("0.0.0.0", 2575)
+    >> await server.serveForever()
+
+Send messages (the ACKs are returned) :
+    >> acks = await sendMessages("localhost", 2575, [hl7message])
+"""
+
+import asyncio
+from functools import partial
+import time
+
+from hl7tersely.hl7charset import DEFAULT_ENCODING, messageEncoding
+from hl7tersely.hl7parser import HL7Parser
+from hl7tersely.hl7scanner import segmentField
+
+__version__ = "1.3"
+__all__ = ["MLLPServer", "MLLPStats", "sendMessages", "frame"]
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+DEFAULT_SEPARATORS = "|^~\\&"
+
+
+def frame(message, encoding="utf-8"):
+    """Frame a message with the MLLP start and end blocks
+    """
+    if isinstance(message, str):
+        message = message.encode(encoding)
+    return START_BLOCK + message + END_BLOCK
+
+
+async def readMessage(reader, limit):
+    """Read the next MLLP block of a stream. Return None at the end of the stream
+    """
+    try:
+        block = await reader.readuntil(END_BLOCK)
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Message larger than %d bytes" % limit)
+    start = block.find(START_BLOCK)
+    return block[start + 1:-len(END_BLOCK)]
+
+
+class MLLPStats:
+    """Counters of an MLLP server
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.activeConnections = 0
+        self.messages = 0
+        self.errors = 0
+        self.parseTime = 0.0
+        self.parseTimeMax = 0.0
+
+    def messagesPerSecond(self):
+        elapsed = time.monotonic() - self.started
+        return self.messages / elapsed if elapsed > 0 else 0.0
+
+    def meanParseTime(self):
+        return self.parseTime / self.messages if self.messages else 0.0
+
+    def snapshot(self):
+        """
+            :return: a dict with the counters, the parse times are in seconds
+        """
+        return {"connections": self.connections,
+                "active_connections": self.activeConnections,
+                "messages": self.messages,
+                "errors": self.errors,
+                "messages_per_second": self.messagesPerSecond(),
+                "parse_time_mean": self.meanParseTime(),
+                "parse_time_max": self.parseTimeMax}
+
+
+class MLLPServer:
+    """
+    parser : the HL7Parser, a default one if None
+    handler : function or coroutine function called with each HL7 dictionary before the ACK is sent.
+        If it raises an exception, the ACK is an application error (AE)
+    executor_threshold : messages larger than this size (in bytes) are parsed in the executor,
+        not to block the event loop
+    executor : concurrent.futures executor, the default executor of the loop if None
+    encoding : codec of the messages and of their ACKs, the character set of MSH-18 of each message if None
+    max_message_size : size of the largest accepted message, in bytes
+    """
+    def __init__(self, parser=None, handler=None, executor_threshold=64 * 1024, executor=None,
+                 encoding=None, max_message_size=16 * 1024 * 1024):
+        self.parser = parser if parser is not None else HL7Parser()
+        self.handler = handler
+        self.executorThreshold = executor_threshold
+        self.executor = executor
+        self.encoding = encoding
+        self.maxMessageSize = max_message_size
+        self.stats = MLLPStats()
+        self.server = None
+        self.ackCount = 0
+
+    async def start(self, host="127.0.0.1", port=2575):
+        """
+            Start listening. port 0 chooses a free port, see sockets()
+            :return: the asyncio server
+        """
+        self.server = await asyncio.start_server(self.handleConnection, host, port, limit=self.maxMessageSize)
+        return self.server
+
+    def sockets(self):
+        return self.server.sockets
+
+    async def serveForever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handleConnection(self, reader, writer):
+        self.stats.connections += 1
+        self.stats.activeConnections += 1
+        try:
+            while True:
+                try:
+                    message = await readMessage(reader, self.maxMessageSize)
+                except ValueError as error:
+                    # rejected, not to be sent again
+                    self.stats.errors += 1
+                    writer.write(frame(self.buildAck(None, "AR", str(error)), self.encoding or DEFAULT_ENCODING))
+                    await writer.drain()
+                    break
+                if message is None:
+                    break
+                # the ACK is written with the character set of the message
+                encoding = messageEncoding(message, self.encoding, self.parser.header_segment)
+                ack = await self.handleMessage(message, encoding)
+                writer.write(frame(ack, encoding))
+                # backpressure : the next message is read once the ACK is sent
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.stats.activeConnections -= 1
+            writer.close()
+
+    async def handleMessage(self, message, encoding=None):
+        """
+            Decode and parse a message, call the handler
+            :param message: the message, bytes
+            :param encoding: codec of the message, the encoding of the server or the character set of MSH-18 if None
+            :return: the ACK message, str
+        """
+        hl7dict = None
+        encoding = encoding or self.encoding
+        try:
+            begin = time.perf_counter()
+            if len(message) > self.executorThreshold:
+                # the message is decoded in the executor too
+                loop = asyncio.get_running_loop()
+                hl7dict = await loop.run_in_executor(self.executor, partial(self.parser.parse, encoding=encoding),
+                                                     message)
+            else:
+                hl7dict = self.parser.parse(message, encoding=encoding)
+            elapsed = time.perf_counter() - begin
+            self.stats.messages += 1
+            self.stats.parseTime += elapsed
+            self.stats.parseTimeMax = max(self.stats.parseTimeMax, elapsed)
+        except (AssertionError, ValueError, IndexError) as error:
+            self.stats.errors += 1
+            return self.buildAck(hl7dict, "AR", str(error))
+
+        if self.handler is not None:
+            try:
+                result = self.handler(hl7dict)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as error:
+                self.stats.errors += 1
+                return self.buildAck(hl7dict, "AE", str(error))
+
+        return self.buildAck(hl7dict, "AA")
+
+    def buildAck(self, hl7dict, code="AA", text=None):
+        """ Build the ACK of a message. The sender and the receiver are swapped,
+        MSA-2 is the control ID (MSH-10) of the message. The header fields are copied as is,
+        with their components, and MSH-18 : the ACK is encoded with the character set of the message.
+
+        :param hl7dict: the parsed message, None if it can not be parsed
+        :param code: acknowledgment code, AA (accept), AE (error) or AR (reject)
+        :param text: text message, MSA-3
+        :return: the ACK message
+        """
+        header_segment = self.parser.header_segment
+        separators = getattr(hl7dict, "separators", None) or DEFAULT_SEPARATORS
+        field_sep = separators[0]
+        header = hl7dict.getLines()[0] if hl7dict is not None else ""
+        if header.split(field_sep, 1)[0] != header_segment:
+            header = header_segment
+
+        def get(field):
+            # the text of the field : MSH-3 may be APP^1.2^ISO
+            return segmentField(header, field_sep, header_segment, field) or ""
+
+        self.ackCount += 1
+        # MSH-9-2 of the first repetition
+        message_type = get(9).split(separators[2])[0].split(separators[1])
+        trigger = message_type[1].split(separators[4])[0] if len(message_type) > 1 else ""
+        msh = [header_segment, separators[1:], get(5), get(6), get(3), get(4),
+               time.strftime("%Y%m%d%H%M%S"), "",
+               separators[1].join(["ACK", trigger, "ACK"]) if trigger else "ACK",
+               "ACK%d" % self.ackCount, get(11) or "P", get(12) or "2.5"]
+        charset = get(18)
+        if charset:
+            msh.extend([""] * 5 + [charset])
+        msa = ["MSA", code, get(10)]
+        if text:
+            # the separators must not appear in the text
+            msa.append("".join(" " if c in separators else c for c in text))
+        return field_sep.join(msh) + "\r" + field_sep.join(msa)
+
+
+async def sendMessages(host, port, messages, encoding="utf-8"):
+    """ Send messages to an MLLP server, one at a time
+
+    :param messages: iterable of messages, str or bytes
+    :return: the list of the ACKs, str
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    acks = []
+    try:
+        for message in messages:
+            writer.write(frame(message, encoding))
+            await writer.drain()
+            ack = await readMessage(reader, None)
+            if ack is None:
+                break
+            acks.append(ack.decode(encoding))
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return acks
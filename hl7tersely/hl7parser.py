@@ -13,21 +13,208 @@ __version__ = "1.3"
 __copyright__ = 'Copyright 2013, Frederic Laurent'
 __all__ = ["HL7Parser"]
 
-from hl7tersely.hl7dict import HL7Dict
+from collections import deque
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+import os
+import time
+
+from hl7tersely.hl7cache import SegmentCache
+from hl7tersely.hl7charset import LINE_END, NOT_BLANK, decodeMessage, messageEncoding
+from hl7tersely.hl7compact import CompactHL7Dict
+from hl7tersely.hl7dict import HL7Dict, LazyHL7Dict
+from hl7tersely.hl7diff import diffMessages
+from hl7tersely.hl7filter import HL7Filter
+from hl7tersely.hl7payload import MIN_SIZE, reduceMessage
+from hl7tersely.hl7projection import HL7Extractor
+from hl7tersely.hl7scanner import tokenizeSegment
+from hl7tersely.hl7stats import MessageStats, ParseStats
+from hl7tersely.hl7stream import CHUNK_SIZE, HL7StreamError, iterMessages
+from hl7tersely.hl7table import HL7Table
+from hl7tersely.hl7template import TemplateCache
+from hl7tersely.hl7visitor import HL7DictBuilder
+
+
+def parseResults(parser, output, messages, first=0, accept=None, errors="raise"):
+    """Generate the results of the messages, see HL7Parser.parseMany
+
+    :param first: number of the first message, the offset of the HL7StreamError of a message
+    """
+    if errors == "raise":
+        if accept is not None:
+            messages = filter(accept, messages)
+        for msg in messages:
+            yield parser.formatResult(parser.parse(msg), output)
+        return
+    for number, msg in enumerate(messages, first):
+        try:
+            if accept is not None and not accept(msg):
+                continue
+            result = parser.formatResult(parser.parse(msg), output)
+        except (AssertionError, ValueError, IndexError) as error:
+            result = HL7StreamError(number, error)
+        yield result
+
+
+def parseBatch(parser, output, messages, first=0, accept=None, errors="raise"):
+    """Parse a batch of messages in a worker process, see HL7Parser.parseMany
+    """
+    return list(parseResults(parser, output, messages, first, accept, errors))
+
+
+def mapBatches(executor, function, messages, chunksize, max_pending, ordered):
+    """ Call function on batches of messages with an executor, a bounded number of batches is sent in advance
+
+    :param function: called with a batch and the number of its first message
+    :return: generator of the results of function, flattened
+    """
+    messages = iter(messages)
+    pending = deque()
+    submitted = 0
+
+    def submit():
+        nonlocal submitted
+        batch = list(islice(messages, chunksize))
+        if batch:
+            pending.append(executor.submit(function, batch, submitted))
+            submitted += len(batch)
+        return bool(batch)
+
+    while len(pending) < max_pending and submit():
+        pass
+
+    while pending:
+        if ordered:
+            done = pending.popleft()
+        else:
+            done = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+            pending.remove(done)
+        yield from done.result()
+        submit()
 
 
 class HL7Parser:
     """
     indexformat : None (default) or "%02d" style for index in 01,02,etc. style
+    engine : "split" (default) or "fast".
+        "split" extracts the values level by level and calls emit for each value.
+        "fast" walks each segment once with tokenizeSegment and stores the values
+        directly in the HL7 dictionary, without calling emit : the message is visited
+        with an HL7DictBuilder. Both engines produce the same tersers and values.
+    A parser may be shared by threads (see parseConcurrent) : a parse keeps its state in the dictionary
+    it builds, the caches and the statistics of the parser are locked. The configuration (the arguments,
+    changeDefaultMessageConst) must be set before the parser is shared.
+    A subclass may override emit to receive the values of the "split" engine.
+    See visit to receive the values with their structured indexes, without building an HL7 dictionary.
     """
     TERSER_SEP = '-'
+    ENGINES = ("split", "fast")
+    # count of (key, indexes) entries kept by fieldEntry
+    MAX_FIELD_ENTRIES = 1 << 16
 
-    def __init__(self, terser_separator=TERSER_SEP, indexformat=None):
+    def __init__(self, terser_separator=TERSER_SEP, indexformat=None, engine="split"):
+        if engine not in self.ENGINES:
+            raise ValueError("Unknown engine %s, expected one of %s" % (engine, ", ".join(self.ENGINES)))
         self.tersersep = terser_separator
         self.indexformat = indexformat
+        self.engine = engine
         self.segment_len = 3
         self.separator_count = 5
         self.header_segment = 'MSH'
+        self.indexStrings = ['']
+        # (field, repetition, component, subcomponent) -> (key, indexes), shared by the dictionaries
+        self.fieldEntries = {}
+        self.stats = None
+        self.segmentCache = None
+        self.templateCache = None
+        self.largeFieldSize = None
+
+    def __getstate__(self):
+        # the statistics and their callback stay in this process
+        state = self.__dict__.copy()
+        state["stats"] = None
+        state["fieldEntries"] = {}
+        # each process fills its own cache
+        for cache in ("segmentCache", "templateCache"):
+            if state[cache] is not None:
+                state[cache] = state[cache].emptyCopy()
+        return state
+
+    def enableStats(self, on_message_parsed=None):
+        """ Record statistics of the messages parsed by parse, see hl7stats.
+        The statistics are not recorded by the worker processes of parseMany
+
+        :param on_message_parsed: function called with the MessageStats of each message
+        :return: the ParseStats
+        """
+        self.stats = ParseStats(on_message_parsed)
+        return self.stats
+
+    def disableStats(self):
+        """
+            Stop recording statistics
+            :return: the ParseStats recorded
+        """
+        stats, self.stats = self.stats, None
+        return stats
+
+    def enableSegmentCache(self, max_entries=4096, max_bytes=None):
+        """ Keep the values of the segments parsed, a segment already cached is not tokenized again.
+        See hl7cache. Only for the "fast" engine : the cached values are not emitted
+
+        :param max_entries: count of segments cached
+        :param max_bytes: length of the text of the segments cached, None for no bound
+        :return: the SegmentCache
+        """
+        if self.engine != "fast":
+            raise ValueError("The segment cache needs the fast engine")
+        self.segmentCache = SegmentCache(max_entries, max_bytes)
+        return self.segmentCache
+
+    def disableSegmentCache(self):
+        """
+            Stop caching the segments
+            :return: the SegmentCache
+        """
+        cache, self.segmentCache = self.segmentCache, None
+        return cache
+
+    def enableTemplateCache(self, max_templates=256):
+        """ Keep the segments map and the keys of the messages by shape, a message with the same segments
+        as a message already parsed reuses its keys. See hl7template.
+        Only for the parse of the "fast" engine, not lazy, without segment cache
+
+        :param max_templates: count of templates cached
+        :return: the TemplateCache
+        """
+        if self.engine != "fast":
+            raise ValueError("The template cache needs the fast engine")
+        self.templateCache = TemplateCache(max_templates)
+        return self.templateCache
+
+    def disableTemplateCache(self):
+        """
+            Stop caching the templates
+            :return: the TemplateCache
+        """
+        cache, self.templateCache = self.templateCache, None
+        return cache
+
+    def enableLargeFields(self, min_size=64 << 10):
+        """ Keep the fields longer than min_size as references to the message, they are neither copied
+        nor split : the value of such a field is a FieldReference. See hl7payload.
+        Only for parse (not for visit nor parseCompact). The fields of the header segment are never references
+
+        :param min_size: length of the smallest large field, in characters (in bytes for a binary message),
+            at least hl7payload.MIN_SIZE
+        """
+        if min_size < MIN_SIZE:
+            raise ValueError("min_size must be at least %d" % MIN_SIZE)
+        self.largeFieldSize = min_size
+
+    def disableLargeFields(self):
+        self.largeFieldSize = None
 
     def changeDefaultMessageConst(self, header_segment, segment_len, separator_count):
         """
@@ -40,6 +227,9 @@ class HL7Parser:
         self.header_segment = header_segment
         self.segment_len = segment_len
         self.separator_count = separator_count
+        for cache in (self.segmentCache, self.templateCache):
+            if cache is not None:
+                cache.clear()
 
     def extractSeparators(self, hl7dict, msg):
         """ Read from the MSH (Message Header) the separators used to separate the pieces
@@ -51,24 +241,35 @@ class HL7Parser:
 
         See HL7 Chapter 2
 
+        """
+        hl7dict.separators = self.messageSeparators(msg)
+
+    def messageSeparators(self, msg):
+        """
+            :return: the separators of the message, read from its header segment. Ex : |^~\\&
         """
         assert msg[:self.segment_len] == self.header_segment, \
             "Message MUST start with the %s segment : Here %s" % (self.header_segment, msg[:self.segment_len])
-        hl7dict.separators = msg[self.segment_len:self.segment_len+self.separator_count]
         # ['|', '^', '~', '\\', '&']
+        return msg[self.segment_len:self.segment_len+self.separator_count]
 
-    def extractSubComponents(self, dictValues, terser, field):
+    def extractSubComponents(self, dictValues, terser, field, parts=(0, 0, 0)):
         # extract sub components
         subcomponents = field.split(dictValues.separators[4])
+        entries = self.fieldEntries
 
         if len(subcomponents) == 1:
+            parts += (0,)
+            dictValues.currentParts = (entries.get(parts) or self.fieldEntry(parts))[1]
             self.emit(dictValues, terser, subcomponents[0])
         else:
             for index in range(len(subcomponents)):
                 idx = str(self.indexformat % (index + 1) if self.indexformat is not None else (index + 1))
+                sub_parts = parts + (index + 1,)
+                dictValues.currentParts = (entries.get(sub_parts) or self.fieldEntry(sub_parts))[1]
                 self.emit(dictValues, terser + self.tersersep + idx, subcomponents[index])
 
-    def extractComponents(self, dictValues, terser, field):
+    def extractComponents(self, dictValues, terser, field, parts=(0, 0)):
         # extract components
         components = field.split(dictValues.separators[1])
 
@@ -76,14 +277,15 @@ class HL7Parser:
             # only 1 component : don't generate index
             # NK1[2]-6[1] instead of NK1[2]-6[1]-1
             # PID-1 instead of PID-1-1
-            self.extractSubComponents(dictValues, terser, components[0])
+            self.extractSubComponents(dictValues, terser, components[0], parts + (0,))
         else:
             for index_compo in range(len(components)):
                 # extract sub components
                 idx = str(self.indexformat % (index_compo + 1) if self.indexformat is not None else (index_compo + 1))
-                self.extractSubComponents(dictValues, terser + self.tersersep + idx, components[index_compo])
+                self.extractSubComponents(dictValues, terser + self.tersersep + idx, components[index_compo],
+                                          parts + (index_compo + 1,))
 
-    def extractOccurrences(self, dictValues, terser, field):
+    def extractOccurrences(self, dictValues, terser, field, field_number=0):
         # extract occurrences separated by ~ character by default
         occurrences = field.split(dictValues.separators[2])
 
@@ -93,9 +295,12 @@ class HL7Parser:
                 idx = str(self.indexformat % (index_occu + 1) if self.indexformat is not None else (index_occu+1))
                 parent += f'[{idx}]'
             # get the components inside
-            self.extractComponents(dictValues, parent, occurrences[index_occu])
+            self.extractComponents(dictValues, parent, occurrences[index_occu],
+                                   (field_number, index_occu + 1 if len(occurrences) > 1 else 0))
 
     def extractValues(self, dictValues, line):
+        # the indexes (field, repetition, component, subcomponent) of each value are given
+        # to the dictionary with its key, see HL7Dict.currentParts
         # fields | separated by default
         fields = line.split(dictValues.separators[0])
 
@@ -106,12 +311,103 @@ class HL7Parser:
             idx = str(self.indexformat % index if self.indexformat is not None else index)
 
             if len(fields) > 1 and fields[0] == self.header_segment and index in (1, 2):
+                dictValues.currentParts = (index, 0, 0, 0)
                 self.emit(dictValues,  idx, fields[index])
             else:
-                self.extractOccurrences(dictValues,  idx, fields[index])
+                self.extractOccurrences(dictValues,  idx, fields[index], index)
+        dictValues.currentParts = None
+
+    def formatIndex(self, index):
+        """Return the index as it appears in the tersers, ie "3" or "03" with indexformat "%02d".
+        The formatted indexes are cached
+        """
+        strings = self.indexStrings
+        if len(strings) <= index:
+            # a longer list replaces the list read by the other threads, twice longer at least :
+            # the indexes of a long field are formatted one by one
+            strings = strings + [str(self.indexformat % n if self.indexformat is not None else n)
+                                 for n in range(len(strings), max(index + 1, 2 * len(strings)))]
+            self.indexStrings = strings
+        return strings[index]
+
+    def fieldKey(self, field, occu, compo, sub):
+        """Build the terser of a value (without the segment name) from its structured indexes.
+        (3, 2, 4, 0) gives 3[2]-4
+        """
+        key = self.formatIndex(field)
+        if occu:
+            key = f"{key}[{self.formatIndex(occu)}]"
+        if compo:
+            key = f"{key}{self.tersersep}{self.formatIndex(compo)}"
+        if sub:
+            key = f"{key}{self.tersersep}{self.formatIndex(sub)}"
+        return key
+
+    def extractValuesFast(self, dictValues, line):
+        """Single pass equivalent of extractValues : the values are stored without calling emit
+        """
+        dictValues.addSegmentValues(self.segmentEntries(dictValues.separators, line))
+
+    def extractValuesCached(self, dictValues, line):
+        """extractValuesFast reading the values of the segments already parsed from the segment cache
+        """
+        cache = self.segmentCache
+        key = (line, dictValues.separators)
+        values = cache.get(key)
+        if values is None:
+            values = tuple(self.segmentEntries(dictValues.separators, line))
+            cache.put(key, values)
+        dictValues.addSegmentValues(values)
+
+    def segmentValues(self, separators, line):
+        """Generate the couples (key, value) of a segment, the key is relative to the segment. Ex : 3[2]-4
+        """
+        return self.keyedValues(tokenizeSegment(line, separators, self.header_segment))
+
+    def segmentEntries(self, separators, line):
+        """Generate the (key, indexes, value) of a segment, see keyedEntries
+        """
+        return self.keyedEntries(tokenizeSegment(line, separators, self.header_segment))
+
+    def keyedValues(self, tokens):
+        """Generate the couples (key, value) of the tuples of tokenizeSegment
+        """
+        return ((key, value) for key, _, value in self.keyedEntries(tokens))
+
+    def keyedEntries(self, tokens):
+        """Generate the (key, indexes, value) of the tuples of tokenizeSegment, the indexes are
+        (field, repetition, component, subcomponent). The keys and the indexes are shared by the messages
+        """
+        entries = self.fieldEntries
+        for field, occu, compo, sub, _, value in tokens:
+            parts = (field, occu, compo, sub)
+            entry = entries.get(parts) or self.fieldEntry(parts)
+            yield entry[0], entry[1], value
+
+    def fieldEntry(self, parts):
+        """
+            :param parts: the indexes of a value (field, repetition, component, subcomponent)
+            :return: (key, indexes), the key of the value without the segment name and the shared indexes
+        """
+        entry = self.fieldEntries.get(parts)
+        if entry is None:
+            entry = (self.fieldKey(*parts), parts)
+            if len(self.fieldEntries) < self.MAX_FIELD_ENTRIES:
+                self.fieldEntries[parts] = entry
+        return entry
+
+    def lineExtractor(self):
+        """
+            :return: the function (dictionary, line) storing the values of a line, according to the engine
+        """
+        if self.engine != "fast":
+            return self.extractValues
+        return self.extractValuesFast if self.segmentCache is None else self.extractValuesCached
 
     def emit(self, dictValues, key, value):
         """A new value has been found. This couple : key,value is emitted, and store in the HL7 dictionary.
+        Called by the "split" engine only, the key is relative to the segment of the line extracted
+        (see HL7Dict.extractLine). Ex : 09-01
         """
         if key and value:
             dictValues[key] = value
@@ -146,30 +442,344 @@ class HL7Parser:
         # ['', 'MSH[1]', 'PID[1]', 'PV1[1]', 'ORC[1]', 'OBR[1]', 'TQ1[1]', 'OBX[1]', 'SPM[1]', ...
         return segment_name_count, line_map
 
-    def parse(self, msg):
+    def parse(self, msg, lazy=False, encoding=None):
         """ Parse an HL7 message and return an HL7 dictionary.
 
-        :param msg: HL7 message to parse
+        :param msg: HL7 message to parse, str or binary (bytes, bytearray, memoryview, mmap)
+        :param lazy: if True, return a LazyHL7Dict : the segments are tokenized
+            the first time one of their tersers is requested
+        :param encoding: codec of a binary message, the character set of MSH-18 by default.
+            See parseCompact to keep the values of a binary message undecoded
         :return: An HL7 dictionary
         """
+        if self.stats is not None:
+            return self.parseInstrumented(msg, lazy, encoding)
+        if self.engine == "fast" and not lazy and self.segmentCache is None and self.largeFieldSize is None:
+            return self.visit(msg, HL7DictBuilder(self), encoding)
+
         #init
-        dictValues = HL7Dict(self.tersersep)
-        msg_ = msg.strip('\r\n ')
+        dictValues = LazyHL7Dict(self.tersersep) if lazy else HL7Dict(self.tersersep)
+        msg_ = self.messageText(dictValues, msg, encoding).strip('\r\n ')
 
         # extracts separator defined in the message itself
         self.extractSeparators(dictValues, msg_)
         msg_ = msg_.replace('\r', '\n')
         lines = msg_.split('\n')
-        line_number = 1
 
         # build the map of segments
         segment_name_count, line_map = self.buildSegmentMap(lines)
         dictValues.setSegmentsMap(segment_name_count, line_map)
 
         # Parse each line of the message : 1 line = 1 segment
+        extract = self.lineExtractor()
+        dictValues.parser = self
+        dictValues.lines = lines
+        if lazy:
+            dictValues.setLines(lines, extract)
+            return dictValues
+
+        for line_number in range(1, len(lines) + 1):
+            dictValues.extractLine(extract, line_number)
+
+        return dictValues
+
+    def messageText(self, dictValues, msg, encoding):
+        """ Decode a message for parse. With the large fields enabled, the large fields are replaced
+        by placeholders, and their references are given to the dictionary
+        """
+        if self.largeFieldSize is None:
+            return decodeMessage(msg, encoding, self.header_segment)
+        msg_, references = reduceMessage(self, msg, self.largeFieldSize, encoding)
+        if references:
+            dictValues.largeFields = references
+        return msg_
+
+    def visit(self, msg, visitor, encoding=None):
+        """ Walk a message and call the methods of the visitor for each segment and each value,
+        see hl7visitor. No HL7 dictionary is built
+
+        :param msg: HL7 message, str or binary
+        :param visitor: an HL7Visitor
+        :param encoding: codec of a binary message, the character set of MSH-18 by default
+        :return: the result of visitor.endMessage()
+        """
+        msg_ = decodeMessage(msg, encoding, self.header_segment).strip('\r\n ')
+        separators = self.messageSeparators(msg_)
+        lines = msg_.replace('\r', '\n').split('\n')
+        visitor.startMessage(separators, lines)
+
+        header_segment = self.header_segment
+        segment_len = self.segment_len
+        start_segment = visitor.startSegment
+        segment_tokens = visitor.segmentTokens
+        end_segment = visitor.endSegment
+        occurrences = {}
         for line in lines:
-            dictValues.currentLineNumber = line_number
-            self.extractValues(dictValues, line)
-            line_number += 1
+            name = line[:segment_len]
+            occurrence = occurrences[name] = occurrences.get(name, 0) + 1
+            if start_segment(name, occurrence) is False:
+                continue
+            segment_tokens(tokenizeSegment(line, separators, header_segment))
+            end_segment()
+        return visitor.endMessage()
+
+    def parseInstrumented(self, msg, lazy=False, encoding=None):
+        """ parse, recording the statistics of the message, see enableStats
+        """
+        stats = self.stats
+        message_stats = MessageStats()
+        times = message_stats.times
+        try:
+            begin = time.perf_counter()
+            dictValues = LazyHL7Dict(self.tersersep) if lazy else HL7Dict(self.tersersep)
+            msg_ = self.messageText(dictValues, msg, encoding).strip('\r\n ')
+            message_stats.size = len(msg)
+            step = time.perf_counter()
+            times["decode"] = step - begin
+
+            self.extractSeparators(dictValues, msg_)
+            lines = msg_.replace('\r', '\n').split('\n')
+            begin, step = step, time.perf_counter()
+            times["separators"] = step - begin
+
+            segment_name_count, line_map = self.buildSegmentMap(lines)
+            dictValues.setSegmentsMap(segment_name_count, line_map)
+            begin, step = step, time.perf_counter()
+            times["segment_map"] = step - begin
+
+            separators = dictValues.separators
+            message_stats.segments = len(lines)
+            message_stats.setHeader(lines[0], separators)
+            extract = self.lineExtractor()
+            dictValues.parser = self
+            dictValues.lines = lines
+            if lazy:
+                dictValues.setLines(lines, extract)
+            else:
+                segment_len = self.segment_len
+                for line_number, line in enumerate(lines, 1):
+                    begin = time.perf_counter()
+                    dictValues.extractLine(extract, line_number)
+                    stats.addSegment(message_stats, line[:segment_len], time.perf_counter() - begin)
+                    message_stats.countFields(line, separators, self.header_segment)
+                message_stats.values = len(dictValues.orderedKeys)
+                times["extraction"] = time.perf_counter() - step
+        except Exception:
+            stats.addError()
+            raise
+
+        stats.add(message_stats)
+        return dictValues
+
+    def parseCompact(self, msg, encoding=None):
+        """ Parse an HL7 message and return a compact HL7 dictionary.
+        The values are stored as positions in the message, see CompactHL7Dict.
+        A binary message (bytes, bytearray, memoryview, mmap) is not copied nor decoded :
+        the values are decoded when they are read
+
+        :param msg: HL7 message to parse
+        :param encoding: codec of a binary message, the character set of MSH-18 by default
+        :return: A CompactHL7Dict
+        """
+        if not isinstance(msg, str):
+            return self.parseCompactBuffer(msg, encoding)
+
+        dictValues = CompactHL7Dict(self)
+        msg_ = msg.strip('\r\n ')
+        self.extractSeparators(dictValues, msg_)
+        dictValues.text = msg_
+        lines = msg_.replace('\r', '\n').split('\n')
+
+        segment_name_count, line_map = self.buildSegmentMap(lines)
+        dictValues.setSegmentsMap(segment_name_count, line_map)
+
+        offset = 0
+        for line_number, line in enumerate(lines, 1):
+            dictValues.addSegment(line_number,
+                                  tokenizeSegment(line, dictValues.separators, self.header_segment, offset))
+            offset += len(line) + 1
 
         return dictValues
+
+    def parseCompactBuffer(self, buffer, encoding=None):
+        """ parseCompact for a binary message. The lines are read one by one from the buffer,
+        the positions of the values are positions in the buffer
+        """
+        dictValues = CompactHL7Dict(self)
+        first = NOT_BLANK.search(buffer)
+        start = first.start() if first else 0
+        end = len(buffer)
+        while end > start and buffer[end - 1:end] in (b"\r", b"\n", b" "):
+            end -= 1
+
+        header = bytes(buffer[start:start + self.segment_len + self.separator_count]).decode("latin-1")
+        self.extractSeparators(dictValues, header)
+        dictValues.text = buffer
+        dictValues.encoding = messageEncoding(buffer, encoding, self.header_segment)
+
+        # separators and values are bytes, latin-1 maps each byte to the same character
+        separators = [sep.encode("latin-1") for sep in dictValues.separators]
+        header_segment = self.header_segment.encode("latin-1")
+
+        bounds = []
+        line_start = start
+        for match in LINE_END.finditer(buffer, start, end):
+            bounds.append((line_start, match.start()))
+            line_start = match.end()
+        bounds.append((line_start, end))
+
+        names = [bytes(buffer[a:min(a + self.segment_len, b)]).decode("latin-1") for a, b in bounds]
+        segment_name_count, line_map = self.buildSegmentMap(names)
+        dictValues.setSegmentsMap(segment_name_count, line_map)
+
+        for line_number, (a, b) in enumerate(bounds, 1):
+            dictValues.addSegment(line_number, tokenizeSegment(bytes(buffer[a:b]), separators, header_segment, a))
+
+        return dictValues
+
+    def iterParse(self, source, framing="auto", raw=False, encoding=None, chunk_size=CHUNK_SIZE,
+                  errors="raise", accept=None):
+        """ Parse the messages of a stream holding several messages, one at a time.
+        The stream is read by chunks, see hl7stream.iterMessages
+
+        :param source: a file object opened in binary or text mode, bytes or str
+        :param framing: auto, msh, batch or mllp
+        :param raw: if True, the text of the messages is returned instead of HL7 dictionaries
+        :param encoding: codec of a binary stream, the character set of MSH-18 of each message by default
+        :param chunk_size: size of the chunks read from the stream
+        :param errors: "raise" or "yield". A message which can not be parsed raises an HL7StreamError,
+            or the HL7StreamError is returned in place of the dictionary
+        :param accept: an HL7Filter (see compileFilter) or a function msg -> bool. The messages
+            rejected are skipped, they are not parsed
+        :return: generator of (offset, message) couples, offset is the position of the message in the stream
+        """
+        if errors not in ("raise", "yield"):
+            raise ValueError("Unknown errors mode %s, expected raise or yield" % errors)
+
+        for offset, message in iterMessages(source, framing, chunk_size, self.header_segment):
+            try:
+                if accept is not None and not accept(message):
+                    continue
+                result = decodeMessage(message, encoding, self.header_segment) if raw else \
+                    self.parse(message, encoding=encoding)
+            except (AssertionError, ValueError, IndexError) as error:
+                if errors == "raise":
+                    raise HL7StreamError(offset, error) from error
+                result = HL7StreamError(offset, error)
+            yield offset, result
+
+    def formatResult(self, hl7dict, output):
+        """ Convert an HL7 dictionary to the output of parseMany
+        """
+        if output == "dict":
+            return hl7dict
+        if output == "json":
+            return hl7dict.toJSON()
+        if output == "text":
+            return hl7dict.toString()
+        return {terser: hl7dict.get(terser) for terser in output}
+
+    def parseMany(self, messages, workers=None, chunksize=64, ordered=True, output="dict", accept=None,
+                  errors="raise"):
+        """ Parse many messages with a pool of processes.
+        The messages are sent to the workers by batches, the parser configuration (terser separator,
+        index format, engine, changeDefaultMessageConst) is sent with them.
+        The HL7 dictionaries are returned as flat lists of keys and values, see HL7Dict.__reduce__
+
+        :param messages: iterable of HL7 messages, read as the workers need them
+        :param workers: number of processes, os.cpu_count() by default
+        :param chunksize: number of messages in a batch
+        :param ordered: if True, the results are returned in the order of the messages, otherwise as
+            soon as a batch is parsed
+        :param output: "dict" for HL7 dictionaries, "json" for the JSON strings (toJSON), "text" for the
+            printable views (toString), or a list of tersers to get a dictionary {terser: value} for each message
+        :param accept: an HL7Filter (see compileFilter), checked by the workers before the parse.
+            The messages rejected are skipped
+        :param errors: "raise" or "yield". A message which can not be parsed raises its error, or an
+            HL7StreamError is returned in place of the result, its offset is the number of the message
+            in messages, from 0
+        :return: generator of the results
+        """
+        output = self.checkManyOptions(chunksize, output, errors)
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from mapBatches(executor, partial(parseBatch, self, output, accept=accept, errors=errors),
+                                  messages, chunksize, 2 * workers, ordered)
+
+    def checkManyOptions(self, chunksize, output, errors="raise"):
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+        if errors not in ("raise", "yield"):
+            raise ValueError("Unknown errors mode %s, expected raise or yield" % errors)
+        if isinstance(output, str) and output not in ("dict", "json", "text"):
+            raise ValueError("Unknown output %s, expected dict, json, text or a list of tersers" % output)
+        return output if isinstance(output, str) else list(output)
+
+    def parseConcurrent(self, messages, executor=ThreadPoolExecutor, workers=None, chunksize=16, ordered=True,
+                        output="dict", accept=None, errors="raise"):
+        """ Parse many messages with threads sharing this parser, see parseMany for the options.
+        The threads run in parallel on a free-threaded Python (3.13t), otherwise they share the GIL
+
+        :param messages: iterable of HL7 messages, read as the threads need them
+        :param executor: an Executor, used as is, or an Executor class, ThreadPoolExecutor by default,
+            created with workers workers and shut down at the end
+        :param workers: number of threads for an executor class, os.cpu_count() by default
+        :return: generator of the results
+        """
+        output = self.checkManyOptions(chunksize, output, errors)
+        workers = workers or os.cpu_count() or 1
+        function = partial(parseBatch, self, output, accept=accept, errors=errors)
+        if isinstance(executor, Executor):
+            yield from mapBatches(executor, function, messages, chunksize, 2 * workers, ordered)
+            return
+        with executor(max_workers=workers) as pool:
+            yield from mapBatches(pool, function, messages, chunksize, 2 * workers, ordered)
+
+    def compile(self, tersers):
+        """ Compile a set of tersers into a reusable extractor. The extractor reads only the segments
+        of the tersers, up to the wanted field. See hl7projection
+
+        :param tersers: list of tersers. Ex : ["MSH-9-1", "PID-3[1]-1", "OBX[*]-5"]
+            OBX[*]-5 returns the list of the values of each OBX segment
+        :return: an HL7Extractor, extractor(msg) returns a dict {terser: value},
+            extractor.values(msg) a tuple of the values
+        """
+        return HL7Extractor(self, tersers)
+
+    def diff(self, msg_a, msg_b, ignore=(), encoding=None):
+        """ Compare two versions of a message without parsing them : only the segments which
+        differ are tokenized. See hl7diff
+
+        :param msg_a: the first message, str or binary
+        :param msg_b: the second message
+        :param ignore: select patterns of the fields ignored. Ex : ("MSH-7", "MSH-10"), hl7diff.VOLATILE_FIELDS
+        :param encoding: codec of binary messages, the character set of MSH-18 by default
+        :return: an HL7Diff : the qualified tersers added by msg_b, removed, and changed.
+            The same as parse(msg_a).diff(parse(msg_b))
+        """
+        return diffMessages(self, msg_a, msg_b, ignore, encoding)
+
+    def compileFilter(self, predicates, encoding=None):
+        """ Compile predicates on tersers into a filter checked on the raw text of the messages.
+        Only the messages accepted need to be parsed, see hl7filter
+
+        :param predicates: list of (terser, operator, operand) tuples, the operators are equals, in,
+            prefix and regex. Ex : [("MSH-9-1", "equals", "ORU"), ("OBX[*]-3-1", "in", {"1554-5", "2345-7"})]
+        :param encoding: codec of the binary messages, the character set of MSH-18 by default
+        :return: an HL7Filter, accept(msg) returns True if all the predicates are true
+        """
+        return HL7Filter(self, predicates, encoding)
+
+    def table(self, messages, columns, message_id="MSH-10", accept=None):
+        """ Read columns of tersers from many messages into column buffers, see hl7table
+
+        :param messages: iterable of HL7 messages, str or bytes
+        :param columns: list of tersers or (terser, typecode) couples. Ex : ["PID-3[1]-1", ("OBX[*]-5", "d")]
+            A wildcard terser gives one row per occurrence of its segment
+        :param message_id: terser of the message_id column, None for no column
+        :param accept: an HL7Filter (see compileFilter), the rows of the messages rejected are not read
+        :return: an HL7Table
+        """
+        table = HL7Table(self, columns, message_id)
+        table.extend(messages if accept is None else filter(accept, messages))
+        return table
@@ -0,0 +1,248 @@
+r"""Large fields. Keep the fields of embedded documents (ED, base64 in OBX-5) as references to the message.
+
+Some messages carry PDF documents or images in a field, up to tens of megabytes. Once the large fields
+are enabled on a parser, a field longer than min_size characters is neither copied nor split : its value
+is a FieldReference, the position and the length of the field in the message given to parse.
+The other fields, and all the fields of the header segment, are parsed as usual.
+
+>>> hl7p.enableLargeFields(min_size=64 << 10)
+>>> hl7dict = hl7p.parse(hl7message)
+>>> document = hl7dict["OBX[2]-5"]
+>>> document
+<FieldReference 12582931 characters at 2270>
+>>> with open("report.pdf", "wb") as pdf:
+...     document.decodeBase64(pdf)       # the data of an ED field is its last component, OBX-5-5
+
+The terser of a large field is the terser of the field (OBX-5) : its repetitions and components are not
+split, see FieldReference.component. The message must not be modified while its dictionary is used,
+a binary message (bytes, bytearray, memoryview, mmap) is decoded by chunks when a large field is read.
+str(reference) is the text of the field, as written by toJSON and toHL7.
+"""
+
+import binascii
+import codecs
+import re
+
+from hl7tersely.hl7charset import LINE_END, NOT_BLANK, decodeMessage, messageEncoding
+
+__version__ = "1.3"
+__all__ = ["FieldReference", "reduceMessage"]
+
+# text of a large field in the segments of the dictionary, never in the text of a value
+PLACEHOLDER = "\x1a%d\x1a"
+PLACEHOLDER_PATTERN = re.compile("\x1a[0-9]+\x1a")
+
+TEXT_NOT_BLANK = re.compile(r"[^\r\n ]")
+
+# characters of a base64 payload which are not data : line breaks, spaces
+NOT_BASE64 = re.compile("[^A-Za-z0-9+/=]")
+
+CHUNK_SIZE = 1 << 20
+
+# smallest min_size : shorter fields are cheaper to split than to reference
+MIN_SIZE = 64
+
+
+class FieldReference:
+    """
+    A field of a message, kept as its position and its length in the message
+    """
+    def __init__(self, source, start, length, separators, encoding=None):
+        """
+            :param source: the message, str or binary
+            :param start: position of the field in the message
+            :param length: length of the field, in characters for a str, in bytes for a binary message
+            :param separators: the separators of the message
+            :param encoding: codec of a binary message
+        """
+        self.source = source
+        self.start = start
+        self.length = length
+        self.separators = separators
+        self.encoding = encoding
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "<FieldReference %d %s at %d>" % (self.length, "characters" if self.encoding is None else "bytes",
+                                                  self.start)
+
+    def __str__(self):
+        return self.text()
+
+    def __reduce__(self):
+        # a memoryview or a mmap can not be pickled : the field is pickled as its text
+        return str, (self.text(),)
+
+    def text(self):
+        """
+            :return: the text of the field, decoded
+        """
+        return "".join(self.chunks(self.length or 1))
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """
+            :return: generator of the text of the field, by chunks of chunk_size characters or bytes
+        """
+        end = self.start + self.length
+        if self.encoding is None:
+            for position in range(self.start, end, chunk_size):
+                yield self.source[position:min(position + chunk_size, end)]
+            return
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        for position in range(self.start, end, chunk_size):
+            yield decoder.decode(bytes(self.source[position:min(position + chunk_size, end)]))
+        yield decoder.decode(b"", final=True)
+
+    def component(self, number):
+        """
+            :param number: number of the component, from 1, -1 for the last component
+            :return: a FieldReference of a component of the field, None if the field has not this component.
+                Ex : the data of an ED field is its fifth (last) component
+        """
+        end = self.start + self.length
+        sep = self.separators[1] if self.encoding is None else self.separators[1].encode("latin-1")
+        bounds = [self.start]
+        for match in re.compile(re.escape(sep)).finditer(self.source, self.start, end):
+            bounds.append(match.end())
+            if number > 0 and len(bounds) > number:
+                break
+        ends = [position - 1 for position in bounds[1:]] + [end]
+        if number == -1:
+            number = len(bounds)
+        if not 1 <= number <= len(bounds):
+            return None
+        return FieldReference(self.source, bounds[number - 1], ends[number - 1] - bounds[number - 1],
+                              self.separators, self.encoding)
+
+    def decodeBase64(self, fileobj, component=-1, chunk_size=CHUNK_SIZE):
+        """
+            Decode the base64 data of the field by chunks, and write it to a file object
+            :param fileobj: file object opened in binary mode
+            :param component: component of the data, the last one by default (ED : OBX-5-5), None for the whole field
+            :param chunk_size: size of the chunks read from the message
+            :return: the count of bytes written
+        """
+        reference = self if component is None else self.component(component)
+        if reference is None:
+            raise ValueError("The field has no component %d" % component)
+        escape = self.separators[3] if len(self.separators) > 3 else ""
+        escapes = re.compile("%s[^%s]*%s" % ((re.escape(escape),) * 3)) if escape else None
+        written = 0
+        rest = ""
+        pending = ""
+        for chunk in reference.chunks(chunk_size):
+            chunk = pending + chunk
+            pending = ""
+            # the escape sequences (\.br\, \X0D0A\) are removed, not their letters
+            if escape:
+                if chunk.count(escape) % 2:
+                    cut = chunk.rindex(escape)
+                    chunk, pending = chunk[:cut], chunk[cut:]
+                chunk = escapes.sub("", chunk)
+            chunk = rest + NOT_BASE64.sub("", chunk)
+            # base64 is decoded by groups of 4 characters
+            cut = len(chunk) - len(chunk) % 4
+            rest = chunk[cut:]
+            if cut:
+                written += fileobj.write(binascii.a2b_base64(chunk[:cut]))
+        if rest:
+            written += fileobj.write(binascii.a2b_base64(rest))
+        return written
+
+
+def reduceMessage(parser, msg, min_size, encoding=None):
+    """ Replace the fields longer than min_size by placeholders. Only the long lines are searched,
+    the large fields are neither copied nor decoded. The header segment is kept : its first
+    fields are the separators of the message
+
+    :param parser: the HL7Parser
+    :param msg: the message, str or binary
+    :param min_size: length of the smallest large field, in characters or bytes
+    :param encoding: codec of a binary message, the character set of MSH-18 by default
+    :return: (text, references), the text of the message with the placeholders, decoded, and the dict
+        {placeholder: FieldReference}
+    """
+    binary = not isinstance(msg, str)
+    first = (NOT_BLANK if binary else TEXT_NOT_BLANK).search(msg)
+    start = first.start() if first else 0
+    header = msg[start:start + parser.segment_len + parser.separator_count]
+    codec = None
+    if binary:
+        header = bytes(header).decode("latin-1")
+        codec = messageEncoding(msg, encoding, parser.header_segment)
+    separators = parser.messageSeparators(header)
+    field_sep = separators[0].encode("latin-1") if binary else separators[0]
+    field_pattern = re.compile(re.escape(field_sep))
+    header_name = parser.header_segment + separators[0]
+    if binary:
+        header_name = header_name.encode("latin-1")
+
+    parts = []
+    references = {}
+    position = 0
+    for line_start, line_end in lineBounds(msg, start, binary):
+        if line_end - line_start < min_size or msg[line_start:line_start + len(header_name)] == header_name:
+            continue
+        # the text before the first separator is the segment name
+        field_start = None
+        for match in field_pattern.finditer(msg, line_start, line_end):
+            if field_start is not None and match.start() - field_start >= min_size:
+                position = addReference(parts, references, msg, position, field_start, match.start(), separators,
+                                        codec)
+            field_start = match.end()
+        if field_start is not None and line_end - field_start >= min_size:
+            position = addReference(parts, references, msg, position, field_start, line_end, separators, codec)
+
+    if not references:
+        return decodeMessage(msg, encoding, parser.header_segment), references
+    parts.append(msg[position:])
+    if binary:
+        return str(b"".join(parts), codec), references
+    return "".join(parts), references
+
+
+def lineBounds(msg, start, binary):
+    """
+        :return: generator of the (start, end) positions of the lines of a message
+    """
+    if not hasattr(msg, "find"):
+        # memoryview
+        line_start = start
+        for match in LINE_END.finditer(msg, start):
+            yield line_start, match.start()
+            line_start = match.end()
+        yield line_start, len(msg)
+        return
+
+    # find is faster than a regular expression on the long lines
+    line_ends = (b"\r", b"\n") if binary else ("\r", "\n")
+    size = len(msg)
+    nexts = [msg.find(line_end, start) for line_end in line_ends]
+    line_start = start
+    while True:
+        found = [position for position in nexts if position != -1]
+        if not found:
+            yield line_start, size
+            return
+        line_end = min(found)
+        yield line_start, line_end
+        line_start = line_end + 1
+        nexts = [msg.find(line_ends[index], line_start) if position != -1 and position < line_start else position
+                 for index, position in enumerate(nexts)]
+
+
+def addReference(parts, references, msg, position, start, end, separators, codec):
+    placeholder = PLACEHOLDER % len(references)
+    parts.append(msg[position:start])
+    parts.append(placeholder if codec is None else placeholder.encode("ascii"))
+    references[placeholder] = FieldReference(msg, start, end - start, separators, codec)
+    return end
+
+
+def expandReferences(text, references):
+    """
+        :return: the text with the text of the large fields in place of their placeholders
+    """
+    return PLACEHOLDER_PATTERN.sub(lambda match: references[match.group()].text(), text)
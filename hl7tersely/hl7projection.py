@@ -0,0 +1,195 @@
+r"""Projection parsing. Extract a fixed set of tersers from messages without parsing all the segments.
+
+The tersers are compiled once by HL7Parser.compile. For each message, only the
+segments of the wanted tersers are read, and they are split up to the wanted
+field. The values are the values returned by HL7Dict.get for the same tersers.
+
+>>> extractor = hl7p.compile(["MSH-9-1", "MSH-10", "PID-3[1]-1", "OBX[*]-5"])
+>>> extractor(hl7message)
+{'MSH-9-1': 'ORU', 'MSH-10': 'msgOF105', 'PID-3[1]-1': '123456789', 'OBX[*]-5': ['75', '4200', '6000', ' ']}
+>>> extractor.values(hl7message)
+('ORU', 'msgOF105', '123456789', ['75', '4200', '6000', ' '])
+
+A segment terser with [*] returns the list of the values of each occurrence of the segment.
+"""
+
+from hl7tersely.hl7charset import decodeMessage
+from hl7tersely.hl7dict import HL7Dict
+from hl7tersely.hl7json import splitField
+from hl7tersely.hl7scanner import fieldValue, segmentField, terserLevels
+
+__version__ = "1.3"
+__all__ = ["HL7Extractor", "WILDCARD"]
+
+WILDCARD = "[*]"
+
+
+class TerserPlan:
+    """What to read in a message for one terser
+    """
+    def __init__(self, terser, parser):
+        self.terser = terser
+        self.wildcard = False
+        self.occurrence = None      # None : alias form PID-3, n : PID[n]-3
+        self.field = None           # None : no exact value, partial terser only
+        self.indexes = None         # repetition, component, subcomponent of the terser, see terserLevels
+        self.qualifiedForm = False  # the field part is formatted like the qualified keys : 03-01
+        self.aliasForm = False      # the field part is formatted like the aliases : 3-1
+
+        sep = parser.tersersep
+        seg_part, _, rest = terser.partition(sep)
+        self.segPart = seg_part
+        if seg_part.endswith(WILDCARD):
+            self.wildcard = True
+            self.name = seg_part[:-len(WILDCARD)]
+        elif seg_part.endswith("]") and "[" in seg_part:
+            self.name, _, occurrence = seg_part[:-1].partition("[")
+            try:
+                self.occurrence = int(occurrence)
+            except ValueError:
+                self.occurrence = -1
+            # the segment names are always formatted with %d
+            if "%s[%d]" % (self.name, self.occurrence) != seg_part:
+                self.occurrence = -1
+        else:
+            self.name = seg_part
+
+        if rest:
+            try:
+                self.field, *self.indexes = splitField(rest, sep)
+            except (IndexError, ValueError):
+                self.field = None
+                return
+            qualified = parser.fieldKey(self.field, *self.indexes)
+            self.qualifiedForm = rest == qualified
+            self.aliasForm = rest == (HL7Dict.reZeroLeft.sub('\\1', qualified) if '0' in qualified else qualified)
+            if not (self.qualifiedForm or self.aliasForm):
+                self.field = None
+
+    def namesSegment(self, count):
+        """
+            True if the terser is written like the keys of its segment, when the message has count
+            segments of this name : a qualified key (PID[1]-03-01) or an alias (PID-3-1)
+        """
+        if self.occurrence is None and not self.wildcard:
+            return self.aliasForm and count == 1
+        return self.qualifiedForm or (self.aliasForm and count != 1)
+
+
+def isHeader(parser, field_sep, line):
+    header_segment = parser.header_segment
+    return line[:parser.segment_len] == header_segment and line.split(field_sep, 1)[0] == header_segment
+
+
+def lineValue(parser, separators, line, plan):
+    """Value of a terser in one line of its segment, like HL7Dict.get. Only the line is split, up to the field
+    """
+    text = segmentField(line, separators[0], parser.header_segment, plan.field)
+    if text is None:
+        return None
+    if plan.field in (1, 2) and isHeader(parser, separators[0], line):
+        # MSH-1 and MSH-2 are never split
+        return text if text and not any(plan.indexes) else None
+    # PID-2-3 is a component, or a subcomponent of a field without components
+    return fieldValue(text, separators, *terserLevels(text, separators, *plan.indexes))
+
+
+class HL7Extractor:
+    """
+    Extract a fixed set of tersers from HL7 messages, see HL7Parser.compile
+    """
+    def __init__(self, parser, tersers):
+        self.parser = parser
+        self.tersers = list(tersers)
+        self.plans = [TerserPlan(terser, parser) for terser in self.tersers]
+        self.names = set(plan.name for plan in self.plans if plan.field is not None)
+
+    def __call__(self, msg):
+        """
+            :return: a dict {terser: value}
+        """
+        return dict(zip(self.tersers, self.values(msg)))
+
+    def values(self, msg):
+        """
+            :return: a tuple with the values of the tersers, in the order of the compiled tersers
+        """
+        message = MessageSegments(self.parser, msg, self.names)
+        results = []
+        for plan in self.plans:
+            if plan.wildcard:
+                count = message.counts.get(plan.name, 0)
+                results.append([message.get(plan, occurrence) for occurrence in range(1, count + 1)])
+            else:
+                results.append(message.get(plan, plan.occurrence))
+        return tuple(results)
+
+
+class MessageSegments:
+    """The segments of a message, found by their names
+    """
+    def __init__(self, parser, msg, names):
+        self.parser = parser
+        msg_ = decodeMessage(msg, None, parser.header_segment).strip('\r\n ')
+        parser.extractSeparators(self, msg_)
+        self.lines = msg_.replace('\r', '\n').split('\n')
+
+        # lines of the wanted segments, by name. All the segments are counted
+        # for the alias rule : PID is an alias of PID[1] if only 1 PID segment is present
+        segment_len = parser.segment_len
+        self.counts = {}
+        self.segmentLines = {}
+        for line_number, line in enumerate(self.lines, 1):
+            name = line[:segment_len]
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if name in names:
+                self.segmentLines.setdefault(name, []).append(line_number)
+
+    def get(self, plan, occurrence):
+        """
+            Value of a terser, like HL7Dict.get
+            :param occurrence: occurrence of the segment for a [*] terser
+        """
+        terser = plan.terser
+        if plan.wildcard:
+            terser = "%s[%d]%s" % (plan.name, occurrence, terser[len(plan.segPart):])
+        elif plan.occurrence is not None:
+            occurrence = plan.occurrence
+        if plan.field is not None:
+            value = self.exactValue(plan, occurrence)
+            if value is not None:
+                return value
+        return self.partialKeys(terser)
+
+    def exactValue(self, plan, occurrence):
+        count = self.counts.get(plan.name, 0)
+        if occurrence is None:
+            # alias form PID-3-1, only for a segment present once
+            occurrence = 1 if count == 1 else 0
+        if not (1 <= occurrence <= count and plan.namesSegment(count)):
+            return None
+        line = self.lines[self.segmentLines[plan.name][occurrence - 1] - 1]
+        return lineValue(self.parser, self.separators, line, plan)
+
+    def partialKeys(self, terser):
+        """
+            Keys starting with the terser, in the order of HL7Dict.aliasKeys. None if no key is found
+        """
+        parser = self.parser
+        sep = parser.tersersep
+
+        keys = {}
+        occurrences = {}
+        for line in self.lines:
+            name = line[:parser.segment_len]
+            occurrences[name] = occurrences.get(name, 0) + 1
+            if not (name.startswith(terser) or terser.startswith(name)):
+                continue
+            seg_name = "%s[%d]" % (name, occurrences[name])
+            seg_alias = name if self.counts[name] == 1 else seg_name
+            for key, _ in parser.segmentValues(self.separators, line):
+                trail = HL7Dict.reZeroLeft.sub('\\1', key) if '0' in key else key
+                keys[f"{seg_alias}{sep}{trail}"] = None
+                keys[f"{seg_name}{sep}{key}"] = None
+        values = [key for key in keys if key.startswith(terser)]
+        return values if values else None
@@ -0,0 +1,221 @@
+r"""HL7 segment scanner.
+
+Walk a segment once and describe each value by its structured position instead
+of a formatted terser. For a segment PID
+PID|1||12345^5^M10&Memphis_Hosp~0411^^^INS-C
+
+tokenizeSegment returns theses tuples (field, repetition, component, subcomponent, start, value)
+    (1, 0, 0, 0, 4, '1')
+    (3, 1, 1, 0, 7, '12345')
+    (3, 1, 2, 0, 13, '5')
+    (3, 1, 3, 1, 15, 'M10')
+    (3, 1, 3, 2, 19, 'Memphis_Hosp')
+    (3, 2, 1, 0, 32, '0411')
+    (3, 2, 4, 0, 39, 'INS-C')
+
+An index is 0 when its level is not split in the message : 0 for the repetition
+means the field has only one occurrence, and the terser has no [n] part.
+start is the position of the value in the line.
+
+The terser of a value with a subcomponent in a field without components has a single
+index after the field, like the terser of a component : PID|1|&&x gives (2, 0, 0, 3)
+and PID-2-3. See terserLevels to read such a terser.
+"""
+
+__version__ = "1.3"
+__all__ = ["tokenizeSegment", "tokenizeField", "fieldValue", "segmentField", "terserLevels"]
+
+
+def tokenizeSegment(line, separators, header_segment, offset=0):
+    """ Tokenize a segment line and return the list of its non empty values.
+
+    The field separator of the header segment is returned as field 1 and the
+    encoding characters as field 2, without being split (see HL7 Chapter 2).
+
+    :param line: segment to tokenize
+    :param separators: separators of the message, in the MSH-2 order ['|', '^', '~', '\\', '&']
+    :param header_segment: name of the header segment, MSH for HL7
+    :param offset: added to the start positions, ie the position of the line in the message
+    :return: a list of (field, repetition, component, subcomponent, start, value) tuples
+    """
+    field_sep = separators[0]
+    compo_sep = separators[1]
+    occu_sep = separators[2]
+    subcompo_sep = separators[4]
+
+    values = []
+    append = values.append
+
+    fields = line.split(field_sep)
+    pos = offset + len(fields[0]) + 1
+    shift = 0
+    if fields[0] == header_segment:
+        # the field separator is the value of MSH-1
+        # the encoding characters are not split
+        append((1, 0, 0, 0, pos - 1, field_sep))
+        shift = 1
+        if len(fields) > 1:
+            if fields[1]:
+                append((2, 0, 0, 0, pos, fields[1]))
+            pos += len(fields[1]) + 1
+            fields[1] = None
+
+    index = 0
+    for field in fields:
+        if index == 0 or field is None:
+            index += 1
+            continue
+        field_index = index + shift
+        index += 1
+
+        if not field:
+            pos += 1
+            continue
+
+        if occu_sep in field:
+            occurrences = field.split(occu_sep)
+            occu_index = 1
+        else:
+            occurrences = (field,)
+            occu_index = 0
+
+        occu_pos = pos
+        for occurrence in occurrences:
+            if occurrence:
+                if compo_sep in occurrence:
+                    compo_index = 1
+                    compo_pos = occu_pos
+                    for component in occurrence.split(compo_sep):
+                        if component:
+                            if subcompo_sep in component:
+                                sub_index = 1
+                                sub_pos = compo_pos
+                                for sub in component.split(subcompo_sep):
+                                    if sub:
+                                        append((field_index, occu_index, compo_index, sub_index, sub_pos, sub))
+                                    sub_pos += len(sub) + 1
+                                    sub_index += 1
+                            else:
+                                append((field_index, occu_index, compo_index, 0, compo_pos, component))
+                        compo_pos += len(component) + 1
+                        compo_index += 1
+                elif subcompo_sep in occurrence:
+                    sub_index = 1
+                    sub_pos = occu_pos
+                    for sub in occurrence.split(subcompo_sep):
+                        if sub:
+                            append((field_index, occu_index, 0, sub_index, sub_pos, sub))
+                        sub_pos += len(sub) + 1
+                        sub_index += 1
+                else:
+                    append((field_index, occu_index, 0, 0, occu_pos, occurrence))
+            occu_pos += len(occurrence) + 1
+            if occu_index:
+                occu_index += 1
+
+        pos += len(field) + 1
+
+    return values
+
+
+def tokenizeField(field, separators, offset=0):
+    """ Tokenize one field, like tokenizeSegment does for each field of a segment.
+
+    :param field: the text of the field
+    :param separators: separators of the message
+    :param offset: added to the start positions
+    :return: a list of (repetition, component, subcomponent, start, value) tuples
+    """
+    compo_sep = separators[1]
+    occu_sep = separators[2]
+    subcompo_sep = separators[4]
+
+    values = []
+    if not field:
+        return values
+    occurrences = field.split(occu_sep)
+    multiple = len(occurrences) > 1
+
+    occu_pos = offset
+    for occu_index, occurrence in enumerate(occurrences, 1):
+        components = occurrence.split(compo_sep) if occurrence else ()
+        compo_pos = occu_pos
+        for compo_index, component in enumerate(components, 1):
+            subcomponents = component.split(subcompo_sep) if component else ()
+            sub_pos = compo_pos
+            for sub_index, sub in enumerate(subcomponents, 1):
+                if sub:
+                    values.append((occu_index if multiple else 0,
+                                   compo_index if len(components) > 1 else 0,
+                                   sub_index if len(subcomponents) > 1 else 0,
+                                   sub_pos, sub))
+                sub_pos += len(sub) + 1
+            compo_pos += len(component) + 1
+        occu_pos += len(occurrence) + 1
+    return values
+
+
+def fieldValue(field, separators, occu, compo, sub):
+    """ Get one value of a field, the value tokenizeField gives for these indexes.
+
+    :param field: the text of the field
+    :param separators: separators of the message
+    :param occu: repetition, 0 if the field does not repeat
+    :param compo: component, 0 if the field has no components
+    :param sub: subcomponent, 0 if the component has no subcomponents
+    :return: the value, None if it is empty or if the field is not split this way
+    """
+    for index, sep in ((occu, separators[2]), (compo, separators[1]), (sub, separators[4])):
+        if not index:
+            if sep in field:
+                return None
+            continue
+        parts = field.split(sep)
+        if len(parts) == 1 or index > len(parts):
+            return None
+        field = parts[index - 1]
+    return field or None
+
+
+def segmentField(line, field_sep, header_segment, field):
+    """ Get the text of one field of a segment, the line is split up to the field.
+
+    :param line: the text of the segment
+    :param field_sep: the field separator
+    :param header_segment: name of the header segment : MSH-1 is the field separator
+    :param field: field number, from 1
+    :return: the text of the field, None if the segment has not this field
+    """
+    index = field
+    if line.split(field_sep, 1)[0] == header_segment:
+        if field == 1:
+            return field_sep
+        index = field - 1
+    parts = line.split(field_sep, index + 1)
+    if len(parts) <= index:
+        return None
+    return parts[index]
+
+
+def terserLevels(field, separators, occu, compo, sub):
+    """ Get the indexes of the value a terser names in a field. A single index after the field (PID-2-3)
+    is a component, or a subcomponent if the repetition is not split in components, like the tuples
+    of tokenizeSegment.
+
+    :param field: the text of the field, None for a missing field
+    :param separators: separators of the message
+    :param occu: repetition of the terser
+    :param compo: first index after the field, 0 if none
+    :param sub: second index after the field, 0 if none
+    :return: (occu, compo, sub)
+    """
+    if not compo or sub or not field:
+        return occu, compo, sub
+    if occu:
+        occurrences = field.split(separators[2])
+        if occu > len(occurrences):
+            return occu, compo, sub
+        field = occurrences[occu - 1]
+    if separators[1] not in field and separators[4] in field:
+        return occu, 0, compo
+    return occu, compo, sub
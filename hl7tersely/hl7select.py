@@ -0,0 +1,134 @@
+r"""Structured queries. Find the values of a dictionary by their segment, field, repetition and component.
+
+The values are indexed by segment name and field, the index is built from the indexes of the
+keys of the dictionary by the first query. A query returns the (terser, value) couples in the order of
+the message, the tersers are the aliases.
+
+>>> hl7dict.select("OBX[*]-3-2")
+[('OBX[1]-3-2', 'Glucose'), ('OBX[2]-3-2', 'Leukocytes'), ...]
+>>> hl7dict.select("PID-3[*]-1")
+[('PID-3[1]-1', '123456789'), ('PID-3[2]-1', '0411886319605719371016')]
+
+Pattern : a terser where the segment occurrence, the repetition, the component and the
+subcomponent may be *. The segment name is matched as is : OBX does not select OBXZ.
+    OBX[*]-5      the values of OBX-5 of all the OBX segments, with their repetitions and components
+    OBX[2]-5      the values of OBX-5 of the second OBX segment
+    PID-5         the values of PID-5, if the message has only one PID segment
+    PID-3[*]-4-*  the subcomponents of the fourth component of all the repetitions of PID-3
+The levels not written after the last level of the pattern match any index, like a partial terser.
+A repetition not written before a written component means the field does not repeat : PID-3-1.
+A subcomponent of a field without components is in the first component : with PID|1|&&x,
+PID-2-1-* selects ('PID-2-3', 'x').
+"""
+
+from hl7tersely.hl7json import splitSegment
+
+__version__ = "1.3"
+__all__ = ["SelectPattern", "StructuredIndex", "ANY"]
+
+# an index of the pattern matching any index
+ANY = -1
+
+
+def patternIndex(text, pattern):
+    if text == "*":
+        return ANY
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError("%s : invalid index %s, expected a number or *" % (pattern, text)) from None
+
+
+class SelectPattern:
+    """
+    A parsed pattern. The indexes are ANY, a number, or None for the levels matching any index
+    """
+    def __init__(self, pattern, terser_separator="-"):
+        seg_part, _, rest = pattern.partition(terser_separator)
+        if not rest:
+            raise ValueError("%s : the field is needed. Ex : OBX[*]-5" % pattern)
+        if seg_part.endswith("[*]"):
+            self.name, self.occurrence = seg_part[:-3], ANY
+        elif seg_part.endswith("]"):
+            try:
+                self.name, self.occurrence = splitSegment(seg_part)
+            except ValueError:
+                raise ValueError("%s : invalid segment %s" % (pattern, seg_part)) from None
+        else:
+            # alias form : only if the message has one segment with this name
+            self.name, self.occurrence = seg_part, 0
+
+        parts = rest.split(terser_separator)
+        if len(parts) > 3:
+            raise ValueError("%s : too many levels" % pattern)
+        field, bracket, repetition = parts[0].partition("[")
+        if bracket and not repetition.endswith("]"):
+            raise ValueError("%s : invalid field %s" % (pattern, parts[0]))
+        self.field = patternIndex(field, pattern)
+        if self.field == ANY:
+            raise ValueError("%s : the field can not be *" % pattern)
+        if bracket:
+            self.repetition = patternIndex(repetition[:-1], pattern)
+        else:
+            self.repetition = 0 if len(parts) > 1 else None
+        self.component = patternIndex(parts[1], pattern) if len(parts) > 1 else None
+        self.subcomponent = patternIndex(parts[2], pattern) if len(parts) > 2 else None
+
+    def matches(self, occurrence, count, repetition, component, subcomponent):
+        """
+            :param occurrence: occurrence of the segment of the value
+            :param count: count of segments with this name in the message
+            :return: True if the value with these indexes is selected
+        """
+        if self.occurrence == 0:
+            if count != 1:
+                return False
+        elif self.occurrence != ANY and self.occurrence != occurrence:
+            return False
+        if subcomponent and not component:
+            # PID|1|&&x : the key PID-2-3 is the third subcomponent of the first component
+            component = 1
+        for wanted, index in ((self.repetition, repetition), (self.component, component),
+                              (self.subcomponent, subcomponent)):
+            if wanted is not None and wanted != ANY and wanted != index:
+                return False
+        return True
+
+
+class StructuredIndex:
+    """
+    The qualified keys of a dictionary, by (segment name, field), in the order of the message.
+    New keys are added by update
+    """
+    def __init__(self):
+        # (name, field) -> list of (occurrence, repetition, component, subcomponent, qualified key)
+        self.fields = {}
+        self.count = 0
+
+    def update(self, keys, splitted):
+        """
+            Index the keys added since the last update
+            :param keys: all the qualified keys, in the order of the message
+            :param splitted: function giving the indexes of keys, see HL7Dict.structuredKeys
+        """
+        if self.count == len(keys):
+            return
+        fields = self.fields
+        new_keys = keys[self.count:]
+        for (name, occurrence, field, repetition, component, subcomponent), key in zip(splitted(new_keys), new_keys):
+            entries = fields.get((name, field))
+            if entries is None:
+                entries = fields[(name, field)] = []
+            entries.append((occurrence, repetition, component, subcomponent, key))
+        self.count = len(keys)
+
+    def select(self, pattern, segment_count):
+        """
+            :param pattern: a SelectPattern
+            :param segment_count: count of segments with the name of the pattern
+            :return: the qualified keys selected, in the order of the message
+        """
+        matches = pattern.matches
+        return [key for occurrence, repetition, component, subcomponent, key in
+                self.fields.get((pattern.name, pattern.field), ())
+                if matches(occurrence, segment_count, repetition, component, subcomponent)]
@@ -0,0 +1,156 @@
+r"""Parse statistics. Timings of the parse stages, counts and the slowest segment types.
+
+The statistics are recorded once enabled on a parser. A disabled parser runs the plain parse
+method after one test, the instrumentation costs nothing (see the "instrumentation" benchmark).
+
+>>> stats = hl7p.enableStats(on_message_parsed=lambda message_stats: print(message_stats.sender))
+>>> hl7p.parse(hl7message)
+>>> stats.slowestSegments(3)
+[('OBX', 1.6e-05, 4, 2.1e-05), ('PID', 1.1e-05, 1, 1.1e-05), ...]
+>>> hl7p.disableStats()
+
+Stages of a parse :
+    decode      : decoding of a binary message, offload of its large fields (see enableLargeFields)
+    separators  : extractSeparators, split of the lines
+    segment_map : buildSegmentMap
+    extraction  : extraction of the values of the segments (none for a lazy parse)
+"""
+
+import threading
+
+__version__ = "1.3"
+__all__ = ["ParseStats", "MessageStats", "STAGES"]
+
+STAGES = ("decode", "separators", "segment_map", "extraction")
+
+
+class MessageStats:
+    """Statistics of one message, given to the on_message_parsed callback
+    """
+    def __init__(self):
+        # length of the message : bytes for a binary message, characters for a str
+        self.size = 0
+        self.segments = 0
+        self.fields = 0
+        self.repetitions = 0
+        self.values = 0
+        self.times = dict.fromkeys(STAGES, 0.0)
+        # segment name -> seconds spent in the extraction of its segments
+        self.segmentTimes = {}
+        # raw header fields : MSH-3 and MSH-4, MSH-9, MSH-10
+        self.sender = None
+        self.messageType = None
+        self.controlId = None
+
+    def total(self):
+        return sum(self.times.values())
+
+    def countFields(self, line, separators, header_segment):
+        """
+            Count the fields and the repetitions of a line
+        """
+        fields = line.split(separators[0])
+        # MSH-2 holds the repetition separator
+        first = 2 if fields[0] == header_segment else 1
+        rep_sep = separators[2]
+        for field in fields[first:]:
+            if field:
+                self.fields += 1
+                if rep_sep in field:
+                    self.repetitions += field.count(rep_sep) + 1
+        if first == 2:
+            self.fields += 2
+
+    def setHeader(self, line, separators):
+        fields = line.split(separators[0])
+        # fields[1] is MSH-2, MSH-1 is the field separator itself
+        header = fields + [""] * (10 - len(fields))
+        self.sender = separators[0].join(header[2:4])
+        self.messageType = header[8]
+        self.controlId = header[9]
+
+
+class ParseStats:
+    """Statistics of the messages parsed by a parser, see HL7Parser.enableStats.
+    The messages may be parsed by several threads, the callback is called by the thread of the message
+    """
+    def __init__(self, on_message_parsed=None):
+        self.onMessageParsed = on_message_parsed
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.messages = 0
+        self.errors = 0
+        self.size = 0
+        self.segments = 0
+        self.fields = 0
+        self.repetitions = 0
+        self.values = 0
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.maxTime = 0.0
+        # segment name -> [count, total seconds, max seconds]
+        self.segmentTypes = {}
+        self.last = None
+
+    def add(self, message_stats):
+        """
+            Add the statistics of a message, call the callback
+        """
+        with self.lock:
+            self.messages += 1
+            self.size += message_stats.size
+            self.segments += message_stats.segments
+            self.fields += message_stats.fields
+            self.repetitions += message_stats.repetitions
+            self.values += message_stats.values
+            for stage, elapsed in message_stats.times.items():
+                self.times[stage] += elapsed
+            self.maxTime = max(self.maxTime, message_stats.total())
+            self.last = message_stats
+        if self.onMessageParsed is not None:
+            self.onMessageParsed(message_stats)
+
+    def addError(self):
+        with self.lock:
+            self.errors += 1
+
+    def addSegment(self, message_stats, name, elapsed):
+        with self.lock:
+            segment_type = self.segmentTypes.get(name)
+            if segment_type is None:
+                segment_type = self.segmentTypes[name] = [0, 0.0, 0.0]
+            segment_type[0] += 1
+            segment_type[1] += elapsed
+            segment_type[2] = max(segment_type[2], elapsed)
+        message_stats.segmentTimes[name] = message_stats.segmentTimes.get(name, 0.0) + elapsed
+
+    def slowestSegments(self, count=10):
+        """
+            :return: the segment types with the longest mean extraction time,
+                a list of (name, mean seconds, count, max seconds)
+        """
+        ranking = sorted(((name, total / number, number, longest)
+                          for name, (number, total, longest) in self.segmentTypes.items()),
+                         key=lambda item: item[1], reverse=True)
+        return ranking[:count]
+
+    def total(self):
+        return sum(self.times.values())
+
+    def snapshot(self):
+        """
+            :return: a dict with the counters, the times are in seconds, the size is the length of the messages
+                (see MessageStats.size)
+        """
+        return {"messages": self.messages,
+                "errors": self.errors,
+                "size": self.size,
+                "segments": self.segments,
+                "fields": self.fields,
+                "repetitions": self.repetitions,
+                "values": self.values,
+                "times": dict(self.times),
+                "parse_time_mean": self.total() / self.messages if self.messages else 0.0,
+                "parse_time_max": self.maxTime,
+                "slowest_segments": self.slowestSegments()}
@@ -0,0 +1,184 @@
+r"""HL7 stream reader. Split a stream holding several HL7 messages.
+
+The stream is read by chunks, the messages are found without loading the
+whole stream in memory. Each message is returned with its offset in the
+stream, to locate a bad message in a large archive.
+
+Framings :
+    msh   : a message starts with a MSH segment, ex. a file of concatenated messages
+    batch : messages wrapped in a FHS/BHS batch envelope, the envelope segments
+            (FHS, BHS, BTS, FTS) are not part of the messages
+    mllp  : Minimal Lower Layer Protocol, each message is framed by the
+            0x0B and 0x1C 0x0D characters
+    auto  : guess the framing from the first characters of the stream
+
+Usage:
+    >> with open("archive.hl7", "rb") as hl7f:
+    ..     for offset, hl7dict in hl7parser.iterParse(hl7f):
+    ..         print(offset, hl7dict["MSH-10"])
+"""
+
+import io
+import re
+
+__version__ = "1.3"
+__all__ = ["iterMessages", "HL7StreamError", "FRAMINGS"]
+
+FRAMINGS = ("auto", "msh", "batch", "mllp")
+CHUNK_SIZE = 1 << 16
+
+MLLP_START = "\x0b"
+MLLP_END = "\x1c"
+ENVELOPE_SEGMENTS = ("FHS", "BHS", "BTS", "FTS")
+# 0x0B is a white space for str.strip
+BLANKS = "\r\n \t"
+
+
+class HL7StreamError(ValueError):
+    """A message of the stream can not be parsed. offset is the position of the message in the stream
+    """
+    def __init__(self, offset, error):
+        ValueError.__init__(self, "Message at offset %d : %s" % (offset, error))
+        self.offset = offset
+        self.error = error
+
+    def __reduce__(self):
+        # sent back by the worker processes, see HL7Parser.parseMany
+        return HL7StreamError, (self.offset, self.error)
+
+
+def openStream(source):
+    # file objects are read as is, bytes and str are wrapped
+    if hasattr(source, "read"):
+        return source
+    if isinstance(source, str):
+        return io.StringIO(source)
+    return io.BytesIO(source)
+
+
+def guessFraming(start):
+    start = start.lstrip(BLANKS)
+    if start[:1] == MLLP_START:
+        return "mllp"
+    if start[:len(ENVELOPE_SEGMENTS[0])] in ENVELOPE_SEGMENTS[:2]:
+        return "batch"
+    return "msh"
+
+
+def readChunk(stream, buffer, chunk_size):
+    # read at least as much as already buffered : a large message is read in O(n)
+    chunk = stream.read(max(chunk_size, len(buffer)))
+    return bytes(chunk) if isinstance(chunk, (bytearray, memoryview)) else chunk
+
+
+def iterMessages(source, framing="auto", chunk_size=CHUNK_SIZE, header_segment="MSH"):
+    """ Generate the messages of a stream.
+
+    :param source: a file object opened in binary or text mode, bytes or str
+    :param framing: auto, msh, batch or mllp
+    :param chunk_size: size of the chunks read from the stream
+    :param header_segment: name of the segment starting a message, MSH for HL7
+    :return: generator of (offset, message) couples. The message is bytes or str, like the stream.
+        The offset is in bytes for a binary stream, in characters for a text stream.
+    """
+    if framing not in FRAMINGS:
+        raise ValueError("Unknown framing %s, expected one of %s" % (framing, ", ".join(FRAMINGS)))
+
+    stream = openStream(source)
+    first = readChunk(stream, "", chunk_size)
+    if not first:
+        return iter(())
+
+    binary = not isinstance(first, str)
+
+    def encoded(text):
+        return text.encode("latin-1") if binary else text
+
+    if framing == "auto":
+        # enough characters to recognize the first segment
+        while len(first.lstrip(encoded(BLANKS))) < len(ENVELOPE_SEGMENTS[0]):
+            chunk = readChunk(stream, first, chunk_size)
+            if not chunk:
+                break
+            first += chunk
+        framing = guessFraming(first.decode("latin-1") if binary else first)
+
+    if framing == "mllp":
+        return iterMLLP(stream, first, chunk_size, encoded(MLLP_START), encoded(MLLP_END), encoded(BLANKS))
+
+    starts = [header_segment]
+    if framing == "batch":
+        starts.extend(ENVELOPE_SEGMENTS)
+    boundary = re.compile(encoded("[\r\n](%s)" % "|".join(map(re.escape, starts))))
+    return iterSegmented(stream, first, chunk_size, boundary, encoded(header_segment), encoded(BLANKS),
+                         max(map(len, starts)))
+
+
+def iterSegmented(stream, first, chunk_size, boundary, header_segment, blanks, marker_len):
+    """Messages starting with a header segment. The data found between a boundary which is not
+    a header segment (an envelope segment) and the next boundary is ignored.
+    """
+    # a line break is added before the stream : the first segment is found like the others
+    buffer = blanks[:1] + first
+    base = -1        # offset of buffer[0] in the stream
+    start = None     # position in the buffer of the current message, None outside a message
+    search = 0
+
+    while True:
+        for match in boundary.finditer(buffer, search):
+            if start is not None:
+                message = buffer[start:match.start()].rstrip(blanks)
+                if message:
+                    yield base + start, message
+            start = match.start(1) if match.group(1) == header_segment else None
+            search = match.end()
+
+        chunk = readChunk(stream, buffer, chunk_size)
+        if not chunk:
+            if start is not None:
+                message = buffer[start:].rstrip(blanks)
+                if message:
+                    yield base + start, message
+            return
+
+        # a boundary (line break and segment name) may be cut at the end of the buffer :
+        # search again its first characters
+        search = max(search, len(buffer) - marker_len)
+        # drop the data already handled
+        keep = start if start is not None else search
+        base += keep
+        buffer = buffer[keep:] + chunk
+        search -= keep
+        if start is not None:
+            start = 0
+
+
+def iterMLLP(stream, first, chunk_size, start_block, end_block, blanks):
+    """Messages framed by the start block (0x0B) and end block (0x1C) characters.
+    The data outside the blocks is ignored.
+    """
+    buffer = first
+    base = 0
+    while True:
+        pos = 0
+        while True:
+            start = buffer.find(start_block, pos)
+            if start < 0:
+                pos = len(buffer)
+                break
+            end = buffer.find(end_block, start + 1)
+            if end < 0:
+                pos = start
+                break
+            block = buffer[start + 1:end]
+            message = block.strip(blanks)
+            if message:
+                yield base + start + 1 + len(block) - len(block.lstrip(blanks)), message
+            pos = end + 1
+
+        base += pos
+        buffer = buffer[pos:]
+        chunk = readChunk(stream, buffer, chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
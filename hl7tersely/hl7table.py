@@ -0,0 +1,168 @@
+r"""Column-oriented tables of many messages, for analytics.
+
+The columns are tersers. The values are read by a compiled extractor (see hl7projection)
+and appended to one buffer per column, no HL7 dictionary is built.
+
+>>> table = hl7p.table(messages, ["MSH-9-1", "PID-3[1]-1"])
+>>> table["PID-3[1]-1"]
+['123456789', 'PATID1234']
+
+A wildcard terser (OBX[*]-5) gives one row per occurrence of its segment, the other
+columns are repeated on each row. A message without this segment gives no row.
+All the wildcard tersers of a table must use the same segment.
+
+>>> table = hl7p.table(messages, ["PID-3[1]-1", "OBX[*]-3-1", ("OBX[*]-5", "d")])
+>>> list(table.rows())[0]
+(0, 'msgOF105', 1, '123456789', None, 75.0)
+
+Columns added to the tersers :
+    message     : index of the message in the table, from 0
+    message_id  : value of the message_id terser (MSH-10 by default), if not None
+    repetition  : occurrence of the wildcard segment, from 1, for a table with wildcard tersers
+
+The buffers are lists, or arrays for the columns given as (terser, typecode) : the values
+are converted to numbers, a missing or invalid value is NaN for the float typecodes ("f", "d").
+toNumpy and toPandas need NumPy and pandas.
+"""
+
+from array import array
+import math
+
+__version__ = "1.3"
+__all__ = ["HL7Table"]
+
+FLOAT_TYPECODES = "fd"
+
+
+def numberConverter(terser, typecode):
+    if typecode in FLOAT_TYPECODES:
+        def convert(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return math.nan
+    else:
+        def convert(value):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise ValueError("%s : %r is not an integer" % (terser, value)) from None
+    return convert
+
+
+class HL7Table:
+    """
+    Column buffers filled from HL7 messages, see HL7Parser.table
+    """
+    def __init__(self, parser, columns, message_id="MSH-10"):
+        """
+            :param parser: the HL7Parser
+            :param columns: list of tersers or (terser, typecode) couples, see array.array for the typecodes
+            :param message_id: terser of the message_id column, None for no column
+        """
+        specs = [(column, None) if isinstance(column, str) else tuple(column) for column in columns]
+        tersers = [terser for terser, _ in specs]
+        if message_id is not None:
+            specs.insert(0, (message_id, None))
+        self.extractor = parser.compile(terser for terser, _ in specs)
+
+        wildcards = set(plan.name for plan in self.extractor.plans if plan.wildcard)
+        if len(wildcards) > 1:
+            raise ValueError("The wildcard tersers must use the same segment, found %s"
+                             % ", ".join(sorted(wildcards)))
+        self.segment = wildcards.pop() if wildcards else None
+
+        self.names = ["message"]
+        if message_id is not None:
+            self.names.append("message_id")
+        if self.segment is not None:
+            self.names.append("repetition")
+        self.names.extend(tersers)
+
+        self.messages = array('L')
+        self.repetitions = array('L')
+        self.columns = {"message": self.messages}
+        if self.segment is not None:
+            self.columns["repetition"] = self.repetitions
+
+        # for each value read by the extractor : append function, converter, wildcard
+        self.appenders = []
+        value_names = (["message_id"] if message_id is not None else []) + tersers
+        for name, (terser, typecode), plan in zip(value_names, specs, self.extractor.plans):
+            buffer = [] if typecode is None else array(typecode)
+            self.columns[name] = buffer
+            self.appenders.append((buffer.append, None if typecode is None else numberConverter(terser, typecode),
+                                   plan.wildcard))
+        self.wildcardIndex = next((index for index, plan in enumerate(self.extractor.plans) if plan.wildcard), None)
+        self.count = 0
+
+    def append(self, msg):
+        """
+            Add the rows of a message
+            :param msg: the message, str or bytes
+            :return: the count of rows added
+        """
+        values = self.extractor.values(msg)
+        index = self.count
+        self.count += 1
+
+        if self.wildcardIndex is None:
+            self.messages.append(index)
+            for (append, convert, _), value in zip(self.appenders, values):
+                append(value if convert is None else convert(value))
+            return 1
+
+        rows = len(values[self.wildcardIndex])
+        for occurrence in range(rows):
+            self.messages.append(index)
+            self.repetitions.append(occurrence + 1)
+            for (append, convert, wildcard), value in zip(self.appenders, values):
+                if wildcard:
+                    value = value[occurrence]
+                append(value if convert is None else convert(value))
+        return rows
+
+    def extend(self, messages):
+        """
+            Add the rows of many messages
+            :return: the count of rows added
+        """
+        return sum(map(self.append, messages))
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def rows(self):
+        """
+            The rows, as tuples in the order of names
+        """
+        return zip(*(self.columns[name] for name in self.names))
+
+    def toDict(self):
+        """
+            :return: a dict {name: column}, the columns are lists
+        """
+        return {name: list(self.columns[name]) for name in self.names}
+
+    def toNumpy(self):
+        """
+            :return: a dict {name: numpy array}. The array columns keep their typecode, the others are object arrays
+        """
+        import numpy
+
+        arrays = {}
+        for name in self.names:
+            column = self.columns[name]
+            arrays[name] = numpy.array(column, dtype=column.typecode if isinstance(column, array) else object)
+        return arrays
+
+    def toPandas(self):
+        """
+            :return: a pandas DataFrame, a column by name
+        """
+        import pandas
+
+        return pandas.DataFrame(self.toNumpy(), columns=self.names)
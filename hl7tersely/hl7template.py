@@ -0,0 +1,102 @@
+r"""Message templates. Share the keys of the messages with the same shape.
+
+The messages of a sender have almost always the same segments, in the same order. Once
+the template cache is enabled on a parser, the segment names of a message are its signature.
+The template of a signature holds the segments map (lineMap, segmentNameCount, aliases of
+the segment names) and the qualified and aliased keys of the values already seen, by line.
+A message with a known signature is parsed without formatting its keys : the dictionaries
+of these messages share the same key strings (interned).
+
+>>> cache = hl7p.enableTemplateCache(max_templates=256)
+>>> for msg in messages:
+...     hl7p.parse(msg)
+>>> cache.snapshot()
+{'entries': 3, 'bytes': 0, 'hits': 997, 'misses': 3, 'evictions': 0, 'hit_rate': 0.997}
+
+The keys of a template are added as the values are found : the messages with the same
+segments and other repetitions or components use the same template.
+The template cache is used by the parse of the "fast" engine, not lazy, without segment cache.
+The segments map of a template is shared by the dictionaries, it must not be modified.
+"""
+
+import sys
+
+from hl7tersely.hl7cache import LRUCache
+from hl7tersely.hl7dict import HL7Dict
+
+__version__ = "1.3"
+__all__ = ["MessageTemplate", "TemplateCache"]
+
+
+class MessageTemplate:
+    """
+    The segments map and the keys of the messages with the same segments
+    """
+    def __init__(self, parser, names):
+        """
+            :param parser: the HL7Parser, used to format the keys
+            :param names: the segment names of the message, in the order of the message
+        """
+        self.parser = parser
+        prototype = HL7Dict(parser.tersersep)
+        prototype.setSegmentsMap(*parser.buildSegmentMap(names))
+        self.segmentNameCount = prototype.segmentNameCount
+        self.lineMap = prototype.lineMap
+        self.aliasSegmentName = prototype.aliasSegmentName
+        # by line : (field, repetition, component, subcomponent) -> (qualified key, alias, indexes)
+        self.lineKeys = [{} for _ in self.lineMap]
+
+    def apply(self, hl7dict):
+        """
+            Set the segments map of a dictionary
+        """
+        hl7dict.segmentNameCount = self.segmentNameCount
+        hl7dict.lineMap = self.lineMap
+        hl7dict.aliasSegmentName = self.aliasSegmentName
+
+    def keys(self, line_number, parts):
+        """
+            :return: (qualified key, alias, indexes) of a value, like HL7Dict.__setitem__ builds them
+        """
+        seg_name = self.lineMap[line_number]
+        sep = self.parser.tersersep
+        key = self.parser.fieldKey(*parts)
+        trail = HL7Dict.reZeroLeft.sub('\\1', key) if '0' in key else key
+        names = (sys.intern(f"{seg_name}{sep}{key}"),
+                 sys.intern(f"{self.aliasSegmentName.get(seg_name, seg_name)}{sep}{trail}"), parts)
+        self.lineKeys[line_number][parts] = names
+        return names
+
+    def qualifiedValues(self, line_number, tokens):
+        """
+            Generate the (qualified key, alias, indexes, value) of the tuples of tokenizeSegment,
+            for HL7Dict.addQualifiedValues
+        """
+        line_keys = self.lineKeys[line_number]
+        for field, occu, compo, sub, _, value in tokens:
+            parts = (field, occu, compo, sub)
+            names = line_keys.get(parts)
+            if names is None:
+                names = self.keys(line_number, parts)
+            yield names[0], names[1], names[2], value
+
+
+class TemplateCache(LRUCache):
+    """LRU cache of the message templates, see HL7Parser.enableTemplateCache.
+    The keys are the tuples of the segment names of the messages
+    """
+    def __init__(self, max_entries=256, max_bytes=None):
+        LRUCache.__init__(self, max_entries, max_bytes)
+
+    def template(self, parser, lines):
+        """
+            :param lines: the segments of a message
+            :return: the MessageTemplate of the message, created if its signature is not cached
+        """
+        segment_len = parser.segment_len
+        signature = tuple([line[:segment_len] for line in lines])
+        template = self.get(signature)
+        if template is None:
+            template = MessageTemplate(parser, signature)
+            self.put(signature, template)
+        return template
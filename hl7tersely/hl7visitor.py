@@ -0,0 +1,104 @@
+r"""HL7 visitor. Walk a message and send each segment and each value to a visitor, without building an HL7 dictionary.
+
+HL7Parser.visit calls the methods of the visitor in the order of the message :
+    startMessage(separators, lines)  the separators of MSH-1 and MSH-2, the text of the segments
+    startSegment(name, occurrence)   PID, 1 for the first PID segment. Return False to skip the segment
+    segmentTokens(tokens)            the values of the segment, calls value for each value by default
+    value(parts, value)              parts are (field, repetition, component, subcomponent), see hl7scanner
+    endSegment()                     after the values of a segment which is not skipped
+    endMessage()                     its result is returned by HL7Parser.visit
+
+An index is 0 when its level is not split in the message. The terser of a value, without
+the segment name, is HL7Parser.fieldKey(*parts). Ex : (3, 2, 4, 0) gives 3[2]-4
+
+>>> class ObservationCodes(HL7Visitor):
+...     def startMessage(self, separators, lines):
+...         self.codes = []
+...     def startSegment(self, name, occurrence):
+...         return name == "OBX"
+...     def value(self, parts, value):
+...         if parts[0] == 3 and parts[2] in (0, 1):
+...             self.codes.append(value)
+...     def endMessage(self):
+...         return self.codes
+>>> hl7p.visit(hl7message, ObservationCodes())
+['GLUCOSE', '14996-3', '30263-8', '30264-6']
+
+HL7Parser.parse is a visit with an HL7DictBuilder, for the fast engine.
+"""
+
+from hl7tersely.hl7dict import HL7Dict
+
+__version__ = "1.3"
+__all__ = ["HL7Visitor", "HL7DictBuilder"]
+
+
+class HL7Visitor:
+    """
+    Visitor of HL7Parser.visit. The methods do nothing, a subclass overrides the ones it needs
+    """
+    def startMessage(self, separators, lines):
+        pass
+
+    def startSegment(self, name, occurrence):
+        pass
+
+    def segmentTokens(self, tokens):
+        """
+            The values of a segment, called once by segment
+            :param tokens: the tuples of hl7scanner.tokenizeSegment (field, repetition, component, subcomponent,
+                start, value). Calls value for each value by default
+        """
+        value = self.value
+        for field, occu, compo, sub, _, text in tokens:
+            value((field, occu, compo, sub), text)
+
+    def value(self, parts, value):
+        pass
+
+    def endSegment(self):
+        pass
+
+    def endMessage(self):
+        return None
+
+
+class HL7DictBuilder(HL7Visitor):
+    """
+    Build the HL7 dictionary of the visited message, the dictionary HL7Parser.parse returns
+    """
+    def __init__(self, parser):
+        self.parser = parser
+        self.hl7dict = None
+        # the MessageTemplate of the message, if the template cache of the parser is enabled
+        self.template = None
+        self.lineNumber = 0
+
+    def startMessage(self, separators, lines):
+        hl7dict = self.hl7dict = HL7Dict(self.parser.tersersep)
+        self.lineNumber = 0
+        hl7dict.separators = separators
+        cache = self.parser.templateCache
+        if cache is None:
+            hl7dict.setSegmentsMap(*self.parser.buildSegmentMap(lines))
+        else:
+            self.template = cache.template(self.parser, lines)
+            self.template.apply(hl7dict)
+        hl7dict.parser = self.parser
+        hl7dict.lines = lines
+
+    def startSegment(self, name, occurrence):
+        self.lineNumber += 1
+        self.hl7dict.currentLineNumber = self.lineNumber
+
+    def segmentTokens(self, tokens):
+        # the keys are formatted from the index strings of the parser, or read from the template,
+        # without calling value
+        if self.template is None:
+            self.hl7dict.addSegmentValues(self.parser.keyedEntries(tokens))
+        else:
+            self.hl7dict.addQualifiedValues(self.template.qualifiedValues(self.hl7dict.currentLineNumber, tokens))
+
+    def endMessage(self):
+        self.hl7dict.currentLineNumber = None
+        return self.hl7dict
@@ -18,11 +18,14 @@ def main():
 
     print("Is there a SSN Number ? : %s " % ("PID-19" in hl7dict))
 
-    # Get all the tersers for all OBX segments
-    obx_tersers = hl7dict.getSegmentKeys("OBX")
-    obx3_list = list(filter(lambda t: t.endswith("]-3-2"), obx_tersers))
-    for obx3 in obx3_list:
-        print(" - %s " % hl7dict[obx3])
+    # Get OBX-3-2 of all the OBX segments
+    for obx3, value in hl7dict.select("OBX[*]-3-2"):
+        print(" - %s " % value)
+
+    # Pseudonymize the patient and write the message back
+    hl7dict.setValue("PID-3-1", "000000000")
+    hl7dict.setValue("PID-5", "DOE^JOHN")
+    print(hl7dict.toHL7().replace("\r", "\n"))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,8 +1,27 @@
 import unittest
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import math
 import os
+import pickle
 import sys
+import tempfile
+import tracemalloc
 
+from hl7tersely.benchmark import MessageGenerator, runBenchmarks
+from hl7tersely.hl7archive import HL7ArchiveIndex
+from hl7tersely.hl7cli import convert as cliConvert, main as cliMain
+from hl7tersely.hl7dict import HL7Dict
+from hl7tersely.hl7diff import VOLATILE_FIELDS
+from hl7tersely.hl7json import dumpNDJSON, splitTerser
+from hl7tersely.hl7mllp import MLLPServer, sendMessages
 from hl7tersely.hl7parser import HL7Parser
+from hl7tersely.hl7payload import MIN_SIZE, FieldReference
+from hl7tersely.hl7stream import HL7StreamError
+from hl7tersely.hl7visitor import HL7Visitor
 
 
 def loadFile(filename):
@@ -148,5 +167,938 @@ class TerserTest(unittest.TestCase):
         self.assertEqual(hl7d["PID-3[2]-1"], "123456789", "Error Second IPP is 123456789 in PID-3[1]-1")
         self.assertEqual(hl7d["PID-3[2]-4"], "USSSA", "Error First Assigning Authority is USSSA in PID-3[1]-4")
 
+    def test_fast_engine(self):
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            for options in ({}, {"terser_separator": "."}, {"terser_separator": "_", "indexformat": "%02d"}):
+                hl7d = HL7Parser(**options).parse(msg)
+                fast = HL7Parser(engine="fast", **options).parse(msg)
+
+                self.assertEqual(fast.orderedKeys, hl7d.orderedKeys, "Error - both engines must emit the same keys")
+                self.assertEqual(fast.data, hl7d.data, "Error - both engines must emit the same values")
+                self.assertEqual(list(fast.aliasKeys.items()), list(hl7d.aliasKeys.items()),
+                                 "Error - both engines must build the same aliases")
+
+        hl7d = HL7Parser(engine="fast").parse(self.multi)
+        self.assertEqual(hl7d["MSH-1"], "|", "Error - MSH-1 is the field separator")
+        self.assertEqual(hl7d["MSH-2"], "^~\\&", "Error - MSH-2 are the encoding characters")
+        self.assertEqual(hl7d["PID-3[2]-4-2"], "1.2.250.1.213.1.4.2", "Error - subcomponent not found")
+
+        self.assertRaises(ValueError, HL7Parser, engine="unknown")
+
+
+    def test_lazy(self):
+        hl7p = HL7Parser()
+        hl7d = hl7p.parse(self.a05)
+        lazy = hl7p.parse(self.a05, lazy=True)
+
+        self.assertEqual(lazy["PID-3[1]-1"], "PATID1234", "Error First IPP is PATID1234 in PID-3[1]-1")
+        self.assertEqual(lazy.parsedLines, {3}, "Error - only the PID segment must be tokenized")
+        self.assertTrue("NK1[2]-2-1" in lazy, "Error - NK1[2]-2-1 must be in A05 message")
+        self.assertEqual(lazy.getSegmentKeys("OBX"), hl7d.getSegmentKeys("OBX"), "Error - OBX keys differ")
+        self.assertEqual(lazy.get("MSH-9"), hl7d.get("MSH-9"), "Error - partial terser must return the same list")
+        self.assertEqual(lazy.get("N"), hl7d.get("N"), "Error - partial terser must return the same list")
+
+        self.assertEqual(lazy.toJSON(), hl7d.toJSON(), "Error - toJSON must tokenize all the segments")
+        self.assertEqual(list(lazy.items()), list(hl7d.items()), "Error - lazy and eager items differ")
+        self.assertEqual(len(lazy), len(hl7d), "Error - lazy and eager lengths differ")
+
+
+    def test_prefix_index(self):
+        hl7p = HL7Parser()
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            hl7d = hl7p.parse(msg)
+            aliased_keys = [hl7d.aliasKeys[k] for k in hl7d.data]
+            for prefix in ("", "P", "PID", "PID-3", "PID-3[2]", "OBX", "OBX[2]-3", "NK1[2]-", "MSH[1]-9", "ZZZ"):
+                self.assertEqual(hl7d.keysStartingWith(prefix),
+                                 [k for k in hl7d.aliasKeys if k.startswith(prefix)],
+                                 "Error - prefix query must return the keys in the message order")
+                self.assertEqual(hl7d.getSegmentKeys(prefix),
+                                 [k for k in aliased_keys if k.startswith(prefix)],
+                                 "Error - segment keys must be returned in the message order")
+
+
+    def test_compact(self):
+        for options in ({}, {"terser_separator": "_", "indexformat": "%02d"}):
+            hl7p = HL7Parser(**options)
+            for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+                hl7d = hl7p.parse(msg)
+                compact = hl7p.parseCompact(msg)
+
+                self.assertEqual(list(compact.items()), list(hl7d.items()),
+                                 "Error - compact and HL7Dict items differ")
+                self.assertEqual(compact.toJSON(), hl7d.toJSON(), "Error - compact and HL7Dict JSON differ")
+                for terser in list(hl7d.aliasKeys) + ["PID", "PID-3", "OBX[2]", "MSH-18", "ZZZ"]:
+                    self.assertEqual(compact.get(terser), hl7d.get(terser), "Error - %s value differs" % terser)
+                    self.assertEqual(terser in compact, terser in hl7d, "Error - %s presence differs" % terser)
+                self.assertEqual(compact.getSegmentKeys("OBX"), hl7d.getSegmentKeys("OBX"),
+                                 "Error - compact and HL7Dict OBX keys differ")
+
+        compact = HL7Parser().parseCompact(self.multi)
+        self.assertEqual(compact["PID-3[2]-4-2"], "1.2.250.1.213.1.4.2", "Error - subcomponent not found")
+        self.assertEqual(len(compact), 128, "Error - the multiple IPP message contains 128 values")
+        self.assertEqual(list(compact.values()), list(HL7Parser().parse(self.multi).values()),
+                         "Error - compact and HL7Dict values differ")
+        self.assertEqual(len(compact.items()), 128, "Error - the items must be a view")
+
+        # a single index after the field : a component, or a subcomponent of a field without components
+        msg = self.lab3StatusChanged.replace("|EVERYMAN^ADAM^^JR^^^L|", "|&&x&|")
+        compact = HL7Parser().parseCompact(msg)
+        self.assertEqual((compact["PID-5-3"], compact["PID[1]-5-3"], compact["PID-3-3"]), ("x", "x", "M10"),
+                         "Error - wrong values")
+        self.assertEqual((compact.get("PID-5-1-3"), compact.get("PID-3-3-1")), (None, None),
+                         "Error - the levels of the values must be kept")
+
+        # indexes larger than 65535 : the arrays are widened
+        msg = "MSH|^~\\&|APP|FAC|||20240101||ADT^A01|1|P|2.5\rPID|1|" + "~".join(["a", "b"] * 35000) + \
+            "\rZZZ" + "|" * 70000 + "z"
+        for source in (msg, msg.encode()):
+            compact = HL7Parser().parseCompact(source)
+            self.assertEqual(compact.lines.typecode, "Q", "Error - the arrays must be widened")
+            self.assertEqual((compact["PID-2[70000]"], compact["ZZZ-70000"], compact["MSH-10"]), ("b", "z", "1"),
+                             "Error - wrong values of the widened arrays")
+        self.assertEqual(list(compact.items()), list(HL7Parser().parse(msg).items()),
+                         "Error - compact and HL7Dict items differ")
+
+
+    def test_iterparse(self):
+        hl7p = HL7Parser()
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+        expected = [hl7p.parse(msg).toJSON() for msg in messages]
+
+        archive = "\n".join(msg.strip().replace("\n", "\r") for msg in messages).encode()
+        batch = b"FHS|^~\\&|LAB\rBHS|^~\\&|LAB\r" + archive + b"\rBTS|4\rFTS|1\r"
+        mllp = b"".join(b"\x0b" + msg.strip().replace("\n", "\r").encode() + b"\x1c\r" for msg in messages)
+
+        for framing, source in (("msh", archive), ("batch", batch), ("mllp", mllp)):
+            for chunk_size in (7, 4096):
+                parsed = list(hl7p.iterParse(io.BytesIO(source), chunk_size=chunk_size))
+                self.assertEqual([hl7d.toJSON() for _, hl7d in parsed], expected,
+                                 "Error - %s framing : the messages differ" % framing)
+                for offset, hl7d in parsed:
+                    self.assertEqual(source[offset:offset + 3], b"MSH", "Error - offset must locate the message")
+
+                raw = list(hl7p.iterParse(source, framing=framing, raw=True, chunk_size=chunk_size))
+                self.assertEqual([msg for _, msg in raw], [msg.strip().replace("\n", "\r") for msg in messages],
+                                 "Error - %s framing : the raw messages differ" % framing)
+
+        # not an UTF-8 message
+        bad = archive + b"\nMSH|^~\\&|\xff"
+        self.assertRaises(HL7StreamError, list, hl7p.iterParse(bad))
+        parsed = list(hl7p.iterParse(bad, errors="yield"))
+        self.assertEqual(len(parsed), 5, "Error - the bad message must be returned")
+        self.assertTrue(isinstance(parsed[-1][1], HL7StreamError), "Error - the bad message is an error")
+        self.assertEqual(parsed[-1][1].offset, len(archive) + 1, "Error - the error must locate the bad message")
+
+
+    def test_pickle(self):
+        hl7p = HL7Parser()
+        for lazy in (False, True):
+            hl7d = pickle.loads(pickle.dumps(hl7p.parse(self.multi, lazy=lazy)))
+            expected = hl7p.parse(self.multi)
+            self.assertEqual(type(hl7d), HL7Dict, "Error - an HL7Dict must be rebuilt")
+            self.assertEqual(list(hl7d.aliasKeys.items()), list(expected.aliasKeys.items()), "Error - aliases differ")
+            self.assertEqual(hl7d.toJSON(), expected.toJSON(), "Error - values differ")
+            self.assertEqual(hl7d["PID-3[2]-4"], expected["PID-3[2]-4"], "Error - partial terser differs")
+
+        # the empty trailing components and subcomponents are not values : the segments are pickled
+        msg = self.lab3StatusChanged.strip().replace("\n", "\r").replace("|EVERYMAN^ADAM^^JR^^^L|",
+                                                                          "|&a^b&~c|x^^|y&&|^&|")
+        for engine in HL7Parser.ENGINES:
+            hl7p = HL7Parser(engine=engine)
+            for lazy in (False, True):
+                expected = hl7p.parse(msg, lazy=lazy)
+                for hl7d in (pickle.loads(pickle.dumps(expected)),
+                             next(hl7p.parseMany([msg], workers=1)) if lazy else expected):
+                    self.assertEqual(hl7d.toHL7(), msg, "Error - the message must be written back")
+                    self.assertEqual(list(hl7d.keys()), list(expected.keys()), "Error - keys differ")
+
+    def test_parse_many(self):
+        hl7p = HL7Parser(terser_separator="_", indexformat="%02d")
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05] * 5
+        expected = [hl7p.parse(msg).toJSON() for msg in messages]
+
+        parsed = list(hl7p.parseMany(messages, workers=2, chunksize=3))
+        self.assertEqual([hl7d.toJSON() for hl7d in parsed], expected, "Error - results must be in order")
+        self.assertEqual(parsed[2].get("PID[1]_03[02]_04_02"), "1.2.250.1.213.1.4.2",
+                         "Error - the parser configuration must be sent to the workers")
+
+        self.assertEqual(list(hl7p.parseMany(messages, workers=2, chunksize=3, output="json")), expected,
+                         "Error - JSON results differ")
+        subsets = list(hl7p.parseMany(messages, workers=2, ordered=False, output=["MSH_10", "PID_03_01"]))
+        self.assertEqual(sorted(s["MSH_10"] for s in subsets),
+                         sorted(["msgOP123", "msgOF105", "msgOF105", "000001"] * 5),
+                         "Error - all the messages must be parsed")
+
+
+    def test_mllp_server(self):
+        received = []
+
+        async def handler(hl7d):
+            if hl7d["MSH-10"] == "000001":
+                raise ValueError("rejected by the handler")
+            received.append(hl7d["MSH-10"])
+
+        async def exchange():
+            server = MLLPServer(handler=handler, executor_threshold=1000)
+            await server.start("127.0.0.1", 0)
+            port = server.sockets()[0].getsockname()[1]
+            messages = [msg.strip().replace("\n", "\r") for msg in (self.lab1NewOrder, self.multi, self.a05)]
+            acks = await asyncio.gather(sendMessages("127.0.0.1", port, messages),
+                                        sendMessages("127.0.0.1", port, ["PID|1||12345"]))
+            await server.close()
+            return server, acks
+
+        server, (acks, bad_acks) = asyncio.run(exchange())
+        self.assertEqual(received, ["msgOP123", "msgOF105"], "Error - the handler must get the messages in order")
+
+        hl7p = HL7Parser()
+        ack = hl7p.parse(acks[0])
+        self.assertEqual(ack["MSA-1"], "AA", "Error - the message must be accepted")
+        self.assertEqual(ack["MSA-2"], "msgOP123", "Error - MSA-2 is the control ID of the message")
+        self.assertEqual(ack["MSH-9-1"], "ACK", "Error - the ACK message type is ACK")
+        self.assertEqual(ack["MSH-9-2"], "O21", "Error - the ACK trigger event is the trigger of the message")
+        self.assertEqual(ack["MSH-3"], "OF", "Error - the receiver of the message is the sender of the ACK")
+        self.assertEqual(hl7p.parse(acks[2])["MSA-1"], "AE", "Error - the handler failure is an application error")
+        self.assertEqual(hl7p.parse(bad_acks[0])["MSA-1"], "AR", "Error - the bad message must be rejected")
+
+        stats = server.stats.snapshot()
+        self.assertEqual(stats["connections"], 2, "Error - 2 connections were opened")
+        self.assertEqual(stats["active_connections"], 0, "Error - the connections must be closed")
+        self.assertEqual(stats["messages"], 3, "Error - 3 messages were parsed")
+        self.assertEqual(stats["errors"], 2, "Error - 2 messages failed")
+
+        # the ACK is encoded with the character set of MSH-18, the large message is decoded in the executor
+        async def exchangeLatin1():
+            server = MLLPServer(executor_threshold=0)
+            await server.start("127.0.0.1", 0)
+            port = server.sockets()[0].getsockname()[1]
+            message = "MSH|^~\\&|HÔPITAL|FAC|APP|FAC|20240101||ADT^A01|1|P|2.5||||||8859/1\rPID|1||12345||Hélène"
+            acks = await sendMessages("127.0.0.1", port, [message], encoding="iso8859-1")
+            await server.close()
+            return acks
+
+        ack = hl7p.parse(asyncio.run(exchangeLatin1())[0])
+        self.assertEqual(ack["MSA-1"], "AA", "Error - the latin-1 message must be accepted")
+        self.assertEqual(ack["MSH-5"], "HÔPITAL", "Error - the ACK must be encoded in latin-1, like the message")
+        self.assertEqual(ack["MSH-18"], "8859/1", "Error - the ACK must declare its character set")
+
+        # the header fields are copied with their components, a message too large is rejected
+        async def exchangeHeader():
+            server = MLLPServer(max_message_size=1000)
+            await server.start("127.0.0.1", 0)
+            port = server.sockets()[0].getsockname()[1]
+            message = "MSH|^~\\&|APP^1.2^ISO|FAC^2.3^ISO|RAPP|RFAC|20240101||ADT^A01^ADT_A01|MSG1|P^T|2.5\rPID|1"
+            acks = await sendMessages("127.0.0.1", port, [message])
+            acks += await sendMessages("127.0.0.1", port, [message + "\rNTE|1||" + "x" * 5000])
+            await server.close()
+            return server, acks
+
+        server, (ack, large_ack) = asyncio.run(exchangeHeader())
+        ack = hl7p.parse(ack)
+        self.assertEqual([ack.get(terser) for terser in ("MSH-3", "MSH-5-1", "MSH-5-2", "MSH-6-3", "MSH-9-2",
+                                                         "MSH-11-2", "MSA-2")],
+                         ["RAPP", "APP", "1.2", "ISO", "A01", "T", "MSG1"], "Error - the header fields of the ACK")
+        large_ack = hl7p.parse(large_ack)
+        self.assertEqual(large_ack["MSA-1"], "AR", "Error - the message too large must be rejected")
+        self.assertTrue("larger than 1000 bytes" in large_ack["MSA-3"], "Error - MSA-3 must give the reason")
+        self.assertEqual(server.stats.snapshot()["errors"], 1, "Error - the message too large is an error")
+
+
+    def test_compile(self):
+        hl7p = HL7Parser()
+        tersers = ["MSH-1", "MSH-2", "MSH-9-1", "MSH-10", "PID-3[1]-1", "PID-3[2]-4-2", "PID-3", "PID[1]-03",
+                   "SPM[2]-17", "SPM-17", "OBX[*]-5", "OBX[*]-3-1", "MSH-18", "ZZZ-1"]
+        extractor = hl7p.compile(tersers)
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            hl7d = hl7p.parse(msg)
+            values = extractor(msg)
+            for terser in tersers:
+                if terser.startswith("OBX[*]"):
+                    expected = [hl7d.get(terser.replace("*", str(n)))
+                                for n in range(1, hl7d.segmentNameCount["OBX"] + 1)]
+                else:
+                    expected = hl7d.get(terser)
+                self.assertEqual(values[terser], expected, "Error - %s value differs from HL7Dict.get" % terser)
+
+        self.assertEqual(extractor.values(self.multi)[4:6], ("123456789", "1.2.250.1.213.1.4.2"),
+                         "Error - values must be returned in the order of the tersers")
+        self.assertEqual(extractor(self.multi)["OBX[*]-5"], ["75", "4200", "6000", " "], "Error - OBX values differ")
+
+        # PID-5-3 is the subcomponent 3 of a field without components, like the component 3 of PID-3
+        msg = self.lab3StatusChanged.replace("|EVERYMAN^ADAM^^JR^^^L|", "|&&x&|")
+        tersers = ["PID-5-3", "PID[1]-5-3", "PID-5-1", "PID-5-1-3", "PID-3-3", "PID-5"]
+        hl7d = hl7p.parse(msg)
+        self.assertEqual(hl7p.compile(tersers)(msg), {terser: hl7d.get(terser) for terser in tersers},
+                         "Error - the values differ from HL7Dict.get")
+        self.assertEqual(hl7p.compile(tersers).values(msg)[:2], ("x", "x"), "Error - the subcomponent must be found")
+
+
+    def test_binary(self):
+        hl7p = HL7Parser()
+        # MSH-18 declares the character set
+        header, _, segments = self.a05.strip().partition("\n")
+        msg = header + "|||8859/1\r" + segments.replace("EVERYMAN", "\u00c9VERYMAN").replace("\n", "\r")
+        expected = hl7p.parse(msg)
+        buffer = msg.encode("iso8859-1")
+
+        for source in (buffer, bytearray(buffer), memoryview(buffer)):
+            self.assertEqual(hl7p.parse(source).toJSON(), expected.toJSON(),
+                             "Error - binary message decoded with MSH-18")
+            compact = hl7p.parseCompact(source)
+            self.assertTrue(compact.text is source, "Error - the binary message must not be copied")
+            self.assertEqual(compact["PID-5-1"], "\u00c9VERYMAN", "Error - values must be decoded with MSH-18")
+            self.assertEqual(list(compact.items()), list(expected.items()), "Error - binary and text values differ")
+
+        compact = hl7p.parseCompact(buffer, encoding="cp1252")
+        self.assertEqual(compact.encoding, "cp1252", "Error - the codec given must be used")
+
+    def test_benchmark(self):
+        shape = dict(segments=30, obx=20, repetitions=3, components=4, subcomponents=3, embedded_size=4096)
+        messages = list(MessageGenerator(seed=7).messages(3, **shape))
+        self.assertEqual(messages, list(MessageGenerator(seed=7).messages(3, **shape)),
+                         "Error - the same seed must give the same messages")
+
+        hl7d = HL7Parser().parse(messages[0])
+        self.assertEqual(len(hl7d.lineMap) - 1, 30, "Error - wrong count of segments")
+        self.assertEqual(hl7d.segmentNameCount["OBX"], 21, "Error - wrong count of OBX segments")
+        self.assertTrue("PID-3[3]-4-3" in hl7d and "PID-3[4]-1" not in hl7d,
+                        "Error - wrong count of PID-3 repetitions")
+        self.assertEqual(len(hl7d["OBX[21]-5-5"]), 4096, "Error - wrong size of the embedded data")
+
+        results = runBenchmarks(["adt"], seed=7, repeat=1, scale=0.01)
+        self.assertEqual(set(results["profiles"]["adt"]["parse"]), {"split", "fast", "lazy", "compact"},
+                         "Error - all the parse modes must be measured")
+
+    def test_json(self):
+        hl7p = HL7Parser()
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            hl7d = hl7p.parse(msg)
+            k, v = hl7d.optimalRepr()
+            self.assertEqual(hl7d.toJSON(), json.dumps(dict(zip(k, v))), "Error - JSON differs from optimalRepr")
+            self.assertEqual(hl7p.parseCompact(msg).toJSON(nested=True), hl7d.toJSON(nested=True),
+                             "Error - nested JSON differs between HL7Dict and CompactHL7Dict")
+
+        nested = hl7p.parse(self.multi).nestedRepr()
+        self.assertEqual(nested["MSH"][0]["9"], {"1": "ORU", "2": "R01", "3": "ORU_R01"}, "Error - MSH-9 components")
+        self.assertEqual(nested["PID"][0]["3"][1]["4"],
+                         {"1": "ASIP-SANTE-INS-C", "2": "1.2.250.1.213.1.4.2", "3": "ISO"},
+                         "Error - PID-3[2]-4 subcomponents")
+        self.assertEqual([obx["5"] for obx in nested["OBX"]], ["75", "4200", "6000", " "], "Error - OBX occurrences")
+
+        msg = "MSH|^~\\&|APP|FAC|||20240101||ADT^A01|1|P|2.5\rPID|1|&&x&|3&4|~&y\r"
+        for hl7d in (hl7p.parse(msg), hl7p.parseCompact(msg)):
+            nested = hl7d.nestedRepr()
+            self.assertEqual(nested["PID"][0]["2"], {"1": {"3": "x"}}, "Error - PID-2 has subcomponents only")
+            self.assertEqual(nested["PID"][0]["3"], {"1": {"1": "3", "2": "4"}}, "Error - PID-3 subcomponents")
+            self.assertEqual(nested["PID"][0]["4"][1], {"1": {"2": "y"}}, "Error - PID-4[2] subcomponents")
+
+        messages = [hl7p.parse(msg) for msg in (self.lab1NewOrder, self.multi)]
+        for outf in (io.StringIO(), io.BytesIO()):
+            self.assertEqual(dumpNDJSON(messages, outf), 2, "Error - wrong count of messages")
+            lines = outf.getvalue().splitlines()
+            self.assertEqual([json.loads(line) for line in lines], [json.loads(m.toJSON()) for m in messages],
+                             "Error - NDJSON lines differ from toJSON")
+
+    def test_table(self):
+        hl7p = HL7Parser()
+        messages = [self.lab1NewOrder, self.multi, self.a05]
+        table = hl7p.table(messages, ["MSH-9-1", "PID-3[1]-1"])
+        self.assertEqual(table.toDict(), {"message": [0, 1, 2], "message_id": ["msgOP123", "msgOF105", "000001"],
+                                          "MSH-9-1": ["OML", "ORU", "ADT"],
+                                          "PID-3[1]-1": [None, "123456789", "PATID1234"]},
+                         "Error - one row per message")
+
+        table = hl7p.table(messages, ["PID-3[1]-1", "OBX[*]-3-1", ("OBX[*]-5", "d")], message_id=None)
+        self.assertEqual(table.names, ["message", "repetition", "PID-3[1]-1", "OBX[*]-3-1", "OBX[*]-5"],
+                         "Error - wrong columns")
+        self.assertEqual(len(table), 7, "Error - one row per OBX segment")
+        self.assertEqual(list(table.rows())[3], (1, 3, "123456789", "30263-8", 6000.0), "Error - wrong row")
+        self.assertEqual(table["OBX[*]-5"].typecode, "d", "Error - the column must be an array")
+        self.assertTrue(math.isnan(table["OBX[*]-5"][4]), "Error - a missing number must be NaN")
+
+        hl7d = hl7p.parse(self.multi)
+        self.assertEqual(table["OBX[*]-3-1"][1:5], [hl7d.get("OBX[%d]-3-1" % n) for n in range(1, 5)],
+                         "Error - values differ from HL7Dict.get")
+        with self.assertRaises(ValueError):
+            hl7p.table(messages, ["OBX[*]-5", "SPM[*]-1"])
+
+    def test_set_value(self):
+        hl7p = HL7Parser()
+        msg = self.multi.strip().replace("\n", "\r")
+        for lazy in (False, True):
+            self.assertEqual(hl7p.parse(msg, lazy=lazy).toHL7(), msg,
+                             "Error - unchanged message must be written as is")
+
+        hl7d = hl7p.parse(msg)
+        hl7d.setValue("PID-3[1]-1", "987654321")
+        hl7d.setValue("PID-5", "DOE^JOHN")
+        hl7d.setValue("PV1-40", "X")
+        hl7d.setValue("OBX[5]-5", "99")
+        hl7d.setValue("PID-3[2]-4-2", None)
+        text = hl7d.toHL7()
+        self.assertEqual(text.split("\r")[3:], msg.split("\r")[3:] + ["OBX|||||99"],
+                         "Error - the segments not changed must be copied")
+        self.assertEqual(hl7p.parse(text).toJSON(), hl7d.toJSON(), "Error - the dictionary differs from the message")
+        self.assertEqual((hl7d["PID-3[1]-1"], hl7d["PID-5-2"], hl7d["PV1-40"], hl7d["OBX[5]-5"]),
+                         ("987654321", "JOHN", "X", "99"), "Error - values not set")
+        self.assertEqual(hl7d.get("PID-3[2]-4"), ["PID-3[2]-4-1", "PID-3[2]-4-3"], "Error - value not cleared")
+
+        for terser, value in (("MSH-2", "^~"), ("OBX-5", "1"), ("OBX[7]-5", "1"), ("PID-5-1", "A^B")):
+            with self.assertRaises(ValueError):
+                hl7d.setValue(terser, value)
+
+        unpickled = pickle.loads(pickle.dumps(hl7d))
+        self.assertEqual(hl7p.parse(unpickled.toHL7()).toJSON(), hl7d.toJSON(),
+                         "Error - segments must be rebuilt from the values")
+
+    def test_subcomponents_without_components(self):
+        # PID-5-3 is the subcomponent 3 of a field without components, like the component 3 of PID-3
+        msg = self.lab3StatusChanged.strip().replace("\n", "\r").replace("|EVERYMAN^ADAM^^JR^^^L|", "|&&x&|")
+        parsers = [HL7Parser(), HL7Parser(engine="fast"), HL7Parser(engine="fast"), HL7Parser(engine="fast")]
+        parsers[2].enableTemplateCache()
+        parsers[3].enableSegmentCache()
+        for hl7p in parsers:
+            for lazy in (False, True):
+                for hl7d in (hl7p.parse(msg, lazy=lazy), pickle.loads(pickle.dumps(hl7p.parse(msg, lazy=lazy)))):
+                    self.assertEqual((hl7d["PID-5-3"], hl7d["PID-3-3"]), ("x", "M10"), "Error - wrong values")
+                    self.assertEqual(list(hl7d.structuredItems()), list(hl7p.parseCompact(msg).structuredItems()),
+                                     "Error - the indexes must be the indexes of the tokenizer")
+                    self.assertEqual((hl7d.locate("PID-5-3"), hl7d.locate("PID-3-3")),
+                                     (("PID", 1, 5, 0, 0, 3), ("PID", 1, 3, 0, 3, 0)), "Error - wrong indexes")
+
+                hl7d = hl7p.parse(msg, lazy=lazy)
+                hl7d.setValue("PID[1]-5-3", "z")
+                hl7d.setValue("PID-5-1", "w")
+                hl7d.setValue("PID-3-3", "M11")
+                self.assertEqual(hl7d.toHL7(), msg.replace("|&&x&|", "|w&&z&|").replace("^M10^", "^M11^"),
+                                 "Error - the subcomponents must be set")
+                self.assertEqual((hl7d["PID-5-1"], hl7d["PID-5-3"], hl7d.locate("PID-5-1")),
+                                 ("w", "z", ("PID", 1, 5, 0, 0, 1)), "Error - wrong values")
+
+    def test_stats(self):
+        hl7p = HL7Parser(engine="fast")
+        parsed = []
+        stats = hl7p.enableStats(on_message_parsed=parsed.append)
+        messages = (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05)
+        for msg in messages:
+            self.assertEqual(hl7p.parse(msg).toJSON(), HL7Parser().parse(msg).toJSON(),
+                             "Error - the instrumented parse must give the same dictionary")
+        hl7p.parse(self.multi, lazy=True)
+
+        self.assertEqual(len(parsed), 5, "Error - the callback must be called for each message")
+        self.assertEqual([m.controlId for m in parsed], ["msgOP123", "msgOF105", "msgOF105", "000001", "msgOF105"],
+                         "Error - wrong control ids")
+        self.assertEqual((parsed[2].segments, parsed[2].values, parsed[2].repetitions),
+                         (13, len(HL7Parser().parse(self.multi)), 2), "Error - wrong counts")
+        self.assertEqual(parsed[4].values, 0, "Error - a lazy parse extracts no values")
+        self.assertEqual(stats.messages, 5, "Error - wrong count of messages")
+        self.assertEqual(set(name for name, *_ in stats.slowestSegments(100)),
+                         set(stats.segmentTypes), "Error - all the segment types must be ranked")
+        self.assertTrue(stats.snapshot()["times"]["extraction"] > 0, "Error - extraction not timed")
+
+        with self.assertRaises(AssertionError):
+            hl7p.parse("PID|1")
+        self.assertEqual(stats.errors, 1, "Error - errors must be counted")
+        self.assertEqual(stats.snapshot()["size"], sum(map(len, messages)) + len(self.multi),
+                         "Error - the size is the length of the messages")
+
+        # the parse of a subclass is still called once the statistics are enabled
+        class CountingParser(HL7Parser):
+            calls = 0
+
+            def parse(self, msg, lazy=False, encoding=None):
+                self.calls += 1
+                return HL7Parser.parse(self, msg, lazy, encoding)
+
+        counting = CountingParser()
+        counting_stats = counting.enableStats()
+        counting.parse(self.multi)
+        self.assertEqual((counting.calls, counting_stats.messages), (1, 1),
+                         "Error - the parse of the subclass must be called")
+        self.assertFalse("parse" in counting.__dict__, "Error - parse must not be an attribute of the parser")
+        counting.disableStats()
+        counting.parse(self.multi)
+        self.assertEqual((counting.calls, counting_stats.messages), (2, 1), "Error - the statistics must be disabled")
+        # the callback is not sent to the worker processes
+        self.assertEqual(pickle.loads(pickle.dumps(hl7p)).stats, None, "Error - stats must not be pickled")
+
+        self.assertTrue(hl7p.disableStats() is stats, "Error - the stats must be returned")
+        self.assertEqual(hl7p.parse.__func__, HL7Parser.parse, "Error - a disabled parser must run the plain parse")
+
+    def test_visit(self):
+        class Recorder(HL7Visitor):
+            def startMessage(self, separators, lines):
+                self.events = [("message", separators, len(lines))]
+
+            def startSegment(self, name, occurrence):
+                self.events.append(("segment", name, occurrence))
+                return name != "OBX"
+
+            def value(self, parts, value):
+                self.events.append((parts, value))
+
+            def endSegment(self):
+                self.events.append("end")
+
+            def endMessage(self):
+                return self.events
+
+        hl7p = HL7Parser()
+        events = hl7p.visit(self.multi, Recorder())
+        self.assertEqual(events[0], ("message", "|^~\\&", 13), "Error - the message starts with the separators")
+        self.assertEqual(events[1:4], [("segment", "MSH", 1), ((1, 0, 0, 0), "|"), ((2, 0, 0, 0), "^~\\&")],
+                         "Error - MSH-1 and MSH-2 are the separators")
+        self.assertTrue(((3, 2, 4, 2), "1.2.250.1.213.1.4.2") in events, "Error - structured indexes expected")
+        self.assertTrue(("segment", "OBX", 4) in events, "Error - all the segments must be started")
+        self.assertEqual(events[events.index(("segment", "OBX", 1)) + 1][0], "segment",
+                         "Error - a skipped segment has no value and no end")
+
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            for options in ({}, {"terser_separator": "_", "indexformat": "%02d"}):
+                hl7d = HL7Parser(**options).parse(msg)
+                fast = HL7Parser(engine="fast", **options).parse(msg)
+                self.assertEqual(list(fast.aliasKeys.items()), list(hl7d.aliasKeys.items()),
+                                 "Error - the visit must build the same dictionary")
+                self.assertEqual(fast.toHL7(), hl7d.toHL7(), "Error - the visit must keep the lines")
+                # the values of the visit are the values of the dictionary
+                visited = []
+                recorder = Recorder()
+                recorder.startSegment = lambda name, occurrence: visited.append((name, occurrence))
+                recorder.value = lambda parts, value: visited.append(value)
+                HL7Parser(**options).visit(msg, recorder)
+                self.assertEqual([v for v in visited if isinstance(v, str)], list(hl7d.values()),
+                                 "Error - the values differ from the dictionary")
+
+    def test_segment_cache(self):
+        hl7p = HL7Parser(engine="fast")
+        cache = hl7p.enableSegmentCache(max_entries=20)
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+        for msg in messages * 2:
+            for lazy in (False, True):
+                hl7d = hl7p.parse(msg, lazy=lazy)
+                self.assertEqual(list(hl7d.aliasedItems()), list(HL7Parser().parse(msg).aliasedItems()),
+                                 "Error - the cached segments must give the same dictionary")
+
+        stats = cache.snapshot()
+        self.assertTrue(stats["hits"] > stats["misses"], "Error - the repeated segments must be found in the cache")
+        self.assertEqual(stats["entries"], 20, "Error - the cache must be bounded")
+        self.assertTrue(stats["evictions"] > 0, "Error - the least recently used segments must be evicted")
+
+        cache = hl7p.enableSegmentCache(max_bytes=200)
+        hl7p.parse(self.a05)
+        self.assertTrue(0 < cache.size <= 200, "Error - the size of the cache must be bounded")
+        self.assertEqual(pickle.loads(pickle.dumps(hl7p)).segmentCache.snapshot()["entries"], 0,
+                         "Error - the cache must not be sent to the worker processes")
+        self.assertTrue(hl7p.disableSegmentCache() is cache, "Error - the cache must be returned")
+        self.assertRaises(ValueError, HL7Parser().enableSegmentCache)
+
+    def test_select(self):
+        hl7p = HL7Parser()
+        hl7d = hl7p.parse(self.multi)
+        self.assertEqual(hl7d.select("PID-3[*]-1"),
+                         [("PID-3[1]-1", "123456789"), ("PID-3[2]-1", "0411886319605719371016")],
+                         "Error - the first component of each repetition")
+        self.assertEqual(hl7d.select("PID-3[2]-4-*"),
+                         [("PID-3[2]-4-1", "ASIP-SANTE-INS-C"), ("PID-3[2]-4-2", "1.2.250.1.213.1.4.2"),
+                          ("PID-3[2]-4-3", "ISO")],
+                         "Error - the subcomponents of PID-3[2]-4")
+        self.assertEqual(hl7d.select("OBX-5"), [], "Error - OBX is not an alias, the message has 4 OBX segments")
+        self.assertEqual(hl7d.select("MSH-9"), [(k, hl7d[k]) for k in hl7d.get("MSH-9")], "Error - a partial terser")
+
+        for msg in (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05):
+            for options in ({}, {"terser_separator": "_", "indexformat": "%02d"}):
+                hl7p = HL7Parser(**options)
+                hl7d = hl7p.parse(msg)
+                sep = hl7p.tersersep
+                for segment in hl7d.getSegmentsList():
+                    # the third component of all the repetitions of field 3, from the keys
+                    expected = [(hl7d.aliasKeys[key], hl7d.data[key]) for key in hl7d.orderedKeys
+                                if splitTerser(key, sep)[0] == segment and splitTerser(key, sep)[2:5:2] == (3, 3)]
+                    pattern = "%s[*]%s3[*]%s3" % (segment, sep, sep)
+                    self.assertEqual(hl7d.select(pattern), expected, "Error - %s differs from the keys" % pattern)
+                    self.assertEqual(hl7p.parseCompact(msg).select(pattern), expected,
+                                     "Error - compact %s differs" % pattern)
+                    self.assertEqual(hl7p.parse(msg, lazy=True).select(pattern), expected,
+                                     "Error - lazy %s differs" % pattern)
+
+        # a field with subcomponents and no components : PID-2-3 is in the first component
+        msg = "MSH|^~\\&|APP|FAC|||20240101||ADT^A01|1|P|2.5\rPID|1|&&x&|3&4\r"
+        hl7p = HL7Parser()
+        for hl7d in (hl7p.parse(msg), hl7p.parse(msg, lazy=True), hl7p.parseCompact(msg)):
+            for pattern in ("PID-2", "PID-2-*", "PID-2-1-*", "PID-2-1-3"):
+                self.assertEqual(hl7d.select(pattern), [("PID-2-3", "x")], "Error - %s of a field without components"
+                                 % pattern)
+            self.assertEqual(hl7d.select("PID-3-1-*"), [("PID-3-1", "3"), ("PID-3-2", "4")],
+                             "Error - the subcomponents of PID-3")
+            self.assertEqual(hl7d.select("PID-2-3"), [], "Error - PID-2 has no third component")
+
+        for pattern in ("PID", "PID-*", "PID-x", "PID-3-1-2-1"):
+            with self.assertRaises(ValueError):
+                hl7d.select(pattern)
+
+    def test_archive_index(self):
+        hl7p = HL7Parser()
+        messages = [msg.strip().replace("\n", "\r") for msg in
+                    (self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "archive.hl7")
+            with open(path, "wb") as outf:
+                outf.write("\n".join(messages[:3]).encode())
+
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(archive.update(), 3, "Error - 3 messages must be indexed")
+                self.assertEqual(archive[1][3:], ("200309060825", "ORU^R01^ORU_R01", "msgOF105", "12345"),
+                                 "Error - wrong header fields")
+                self.assertEqual(archive[2].patient_id, "123456789", "Error - PID-3-1 must be indexed")
+                self.assertEqual(archive.find(control_id="msgOF105"), [1, 2], "Error - wrong messages found")
+                self.assertEqual(archive.find(control_id="msgOF105", patient_id="123456789"), [2],
+                                 "Error - all the conditions must be checked")
+                self.assertEqual(archive.parse(0).toJSON(), hl7p.parse(messages[0]).toJSON(),
+                                 "Error - the message found must be parsed")
+
+            # the last message is written in 2 times
+            with open(path, "ab") as outf:
+                outf.write(b"\rNTE|1||appended\n" + messages[3][:20].encode())
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(len(archive), 3, "Error - the index must be read from the index file")
+                self.assertEqual(archive.update(), 1, "Error - only the new message must be added")
+            with open(path, "ab") as outf:
+                outf.write(messages[3][20:].encode())
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(archive.update(), 0, "Error - the last message must be scanned again")
+                self.assertEqual(archive.parseControlId("000001").toJSON(), hl7p.parse(messages[3]).toJSON(),
+                                 "Error - the completed message must be indexed")
+                self.assertEqual(archive.parse(2)["NTE-3"], "appended", "Error - the previous message grew")
+                self.assertEqual(archive.find(message_type="ADT^A05^ADT_A05", since="2007"), [3],
+                                 "Error - the ADT message is dated 2007")
+                self.assertEqual(archive.find(since="20030906", until="2007"), [0, 1, 2],
+                                 "Error - the lab messages are dated 2003")
+                self.assertEqual(list(HL7ArchiveIndex(path).entries), list(archive.entries),
+                                 "Error - the index file must hold the same entries")
+
+            # the archive is truncated : the index is built again
+            with open(path, "wb") as outf:
+                outf.write("\n".join(messages[:2] * 2 + messages[2:3]).encode())
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(archive.update(), 5, "Error - 5 messages must be indexed")
+                with open(path, "r+b") as outf:
+                    outf.truncate(len("\n".join(messages[:2]).encode()))
+                self.assertEqual(archive.update(), 2, "Error - the 2 messages left must be indexed again")
+            with open(path, "wb") as outf:
+                outf.write("\n".join(messages[:2] * 2 + messages[2:3]).encode())
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(archive.update(), 3, "Error - the messages added must be indexed")
+            with open(path, "r+b") as outf:
+                outf.truncate(len("\n".join(messages[:2]).encode()))
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(len(archive), 0, "Error - the index of the longer archive must not be used")
+                self.assertEqual(archive.update(), 2, "Error - the 2 messages left must be indexed again")
+                self.assertEqual(archive.find(control_id="msgOF105"), [1], "Error - wrong messages found")
+
+            # the archive is replaced by a longer archive : the index is built again
+            with open(path, "wb") as outf:
+                outf.write("\n".join(messages[::-1]).encode())
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(len(archive), 0, "Error - the index of another archive must not be used")
+                self.assertEqual(archive.update(), 4, "Error - all the messages must be indexed again")
+                self.assertEqual(archive.parseControlId("000001").toJSON(), hl7p.parse(messages[3]).toJSON(),
+                                 "Error - the message must be found in the new archive")
+            with HL7ArchiveIndex(path) as archive:
+                self.assertEqual(len(archive), 4, "Error - the index of the archive must be used")
+                self.assertEqual(archive.update(), 0, "Error - no message was added")
+
+    def test_template_cache(self):
+        for options in ({}, {"terser_separator": "_", "indexformat": "%02d"}):
+            hl7p = HL7Parser(engine="fast", **options)
+            cache = hl7p.enableTemplateCache(max_templates=2)
+            messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+            for msg in messages * 2 + [self.multi.replace("OBX|4|", "OBX|4||a~b^c&d|")]:
+                hl7d = hl7p.parse(msg)
+                expected = HL7Parser(**options).parse(msg)
+                self.assertEqual(list(hl7d.aliasKeys.items()), list(expected.aliasKeys.items()),
+                                 "Error - the template must give the same keys")
+                self.assertEqual(hl7d.toJSON(), expected.toJSON(), "Error - the template must give the same values")
+
+            first, second = hl7p.parse(self.multi), hl7p.parse(self.multi)
+            self.assertTrue(first.orderedKeys[10] is second.orderedKeys[10], "Error - the keys must be shared")
+            self.assertTrue(first.lineMap is second.lineMap, "Error - the segments map must be shared")
+            self.assertEqual(len(cache), 2, "Error - the cache must be bounded")
+            self.assertTrue(cache.evictions > 0 and cache.hits > 0, "Error - wrong counters")
+
+        hl7p = HL7Parser(engine="fast")
+        cache = hl7p.enableTemplateCache()
+        hl7d = hl7p.parse(self.multi)
+        hl7d.setValue("OBX[5]-5", "99")
+        self.assertEqual(hl7p.parse(self.multi).segmentNameCount["OBX"], 4,
+                         "Error - the template must not be modified")
+        self.assertTrue(hl7p.disableTemplateCache() is cache, "Error - the cache must be returned")
+        self.assertRaises(ValueError, HL7Parser().enableTemplateCache)
+
+    def test_parse_concurrent(self):
+        messages = list(MessageGenerator(seed=3).messages(40, segments=20, obx=10, repetitions=3, components=4,
+                                                          subcomponents=2))
+        messages += [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05] * 10
+        expected = [HL7Parser(indexformat="%02d").parse(msg).toJSON() for msg in messages]
+
+        # one parser shared by the threads, with its caches and its statistics
+        hl7p = HL7Parser(engine="fast", indexformat="%02d")
+        hl7p.enableTemplateCache(max_templates=4)
+        stats = hl7p.enableStats()
+        for _ in range(3):
+            parsed = list(hl7p.parseConcurrent(messages, workers=8, chunksize=2, output="json"))
+            self.assertEqual(parsed, expected, "Error - the threads must give the results of a sequential parse")
+        self.assertEqual(stats.messages, 3 * len(messages), "Error - all the messages must be counted")
+
+        hl7p = HL7Parser(engine="fast")
+        hl7p.enableSegmentCache(max_entries=16)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            parsed = list(hl7p.parseConcurrent(messages * 2, executor=executor, ordered=False, output=["MSH-10"]))
+        self.assertEqual(sorted(p["MSH-10"] for p in parsed),
+                         sorted(HL7Parser().parse(msg)["MSH-10"] for msg in messages * 2),
+                         "Error - all the messages must be parsed")
+
+        # after the parse, the keys of __setitem__ are tersers
+        hl7d = HL7Parser().parse(self.multi)
+        hl7d["PID-5-1"] = "DOE"
+        self.assertEqual((hl7d["PID-5-1"], hl7d.currentLineNumber), ("DOE", None), "Error - the value must be set")
+        self.assertTrue("PID[1]-5-1" in hl7d.data and "OBX[4]-5-1" not in hl7d.data,
+                        "Error - the value must not be stored in the last segment")
+
+
+    def test_filter(self):
+        hl7p = HL7Parser()
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+        cases = [([("MSH-9-1", "equals", "ORU")], [False, True, True, False]),
+                 ([("MSH-4", "in", ["Chemistry", "Entero-gastric"]), ("MSH-9-2", "prefix", "R")],
+                  [False, True, True, False]),
+                 ([("OBX[*]-3-1", "in", {"30263-8", "1010.1"})], [False, True, True, True]),
+                 ([("OBX[3]-3-1", "equals", "30263-8")], [False, True, True, False]),
+                 # PID-3-1 is an alias only if PID-3 does not repeat
+                 ([("PID-3[1]-1", "regex", "^12345")], [False, False, True, False]),
+                 ([("PID-3-1", "regex", "^12345")], [True, True, False, False]),
+                 ([("MSH-1", "equals", "|"), ("MSH-10", "equals", "000001")], [False, False, False, True]),
+                 ([("ZZZ-1", "equals", "")], [False, False, False, False])]
+        for predicates, expected in cases:
+            accept = hl7p.compileFilter(predicates)
+            self.assertEqual([accept(msg) for msg in messages], expected, "Error - %s : wrong filter" % predicates)
+            self.assertEqual([accept(msg.encode()) for msg in messages], expected,
+                             "Error - %s : wrong filter of binary messages" % predicates)
+
+        accept = hl7p.compileFilter([("OBX[*]-3-1", "equals", "14996-3")])
+        archive = "\n".join(msg.strip().replace("\n", "\r") for msg in messages).encode()
+        parsed = list(hl7p.iterParse(archive, accept=accept))
+        self.assertEqual([hl7d["MSH-10"] for _, hl7d in parsed], ["msgOF105", "msgOF105"],
+                         "Error - only the messages accepted must be parsed")
+        self.assertEqual(archive[parsed[1][0]:parsed[1][0] + 3], b"MSH", "Error - offset must locate the message")
+        self.assertEqual(list(hl7p.parseConcurrent(messages * 3, workers=2, chunksize=2, output=["MSH-10"],
+                                                   accept=accept)), [{"MSH-10": "msgOF105"}] * 6,
+                         "Error - only the messages accepted must be parsed")
+        self.assertEqual(list(hl7p.parseMany(messages, workers=2, output="json", accept=accept)),
+                         [hl7p.parse(msg).toJSON() for msg in messages[1:3]],
+                         "Error - the filter must be sent to the workers")
+        table = hl7p.table(messages, ["OBX[*]-3-1"], accept=accept)
+        self.assertEqual((sorted(set(table["message"])), set(table["message_id"])), ([0, 1], {"msgOF105"}),
+                         "Error - only the rows of the messages accepted must be read")
+
+        self.assertRaises(ValueError, hl7p.compileFilter, [("PID-3", "like", "1")])
+        self.assertRaises(ValueError, hl7p.compileFilter, [("PID[x]-3", "equals", "1")])
+        for operator, operand in (("in", [1, 2]), ("in", "12"), ("equals", 1), ("prefix", None)):
+            self.assertRaises(ValueError, hl7p.compileFilter, [("PID-3-1", operator, operand)])
+
+        # the segments are counted by their first characters, like HL7Dict
+        msg = "MSH|^~\\&|APP|FAC|||20240101||ADT^A01|1|P|2.5\rZPIDX|a\rZPI|b\rZP|c"
+        hl7d = hl7p.parse(msg)
+        for terser in ("ZPI[1]-1", "ZPI[2]-1", "ZPIDX-1", "ZP-1"):
+            for value in "abc":
+                accept = hl7p.compileFilter([(terser, "equals", value)])
+                self.assertEqual(accept(msg), hl7d.get(terser) == value,
+                                 "Error - %s equals %s : the filter differs from HL7Dict.get" % (terser, value))
+
+        # PID-5-3 is the subcomponent 3 of a field without components : the filters agree with HL7Dict.get
+        msg = self.lab3StatusChanged.replace("|EVERYMAN^ADAM^^JR^^^L|", "|&&x&|")
+        self.assertEqual([hl7p.parse(msg).get(terser) for terser in ("PID[1]-5-3", "PID-5-3", "PID-3-3")],
+                         ["x", "x", "M10"], "Error - wrong values")
+        cases = [([("PID[1]-5-3", "equals", "x")], True),
+                 ([("PID-5-3", "regex", "^x$")], True),
+                 ([("PID-5-3", "in", ["x", "y"]), ("PID-3-3", "prefix", "M1")], True),
+                 ([("PID-5-1", "equals", "x")], False),
+                 ([("PID-5-1-3", "equals", "x")], False)]
+        for predicates, expected in cases:
+            accept = hl7p.compileFilter(predicates)
+            self.assertEqual((accept(msg), accept(msg.encode())), (expected, expected),
+                             "Error - %s : the filter differs from HL7Dict.get" % predicates)
+
+
+    def test_large_fields(self):
+        document = bytes(range(256)) * 4096
+        lines = self.lab3StatusChanged.strip().split("\n")
+        lines.insert(8, "OBX|5|ED|PDF^Report^L||LAB^application^pdf^Base64^%s||||||F" %
+                     base64.b64encode(document).decode())
+        msg = "\r".join(lines)
+
+        for engine in HL7Parser.ENGINES:
+            hl7p = HL7Parser(engine=engine)
+            expected = hl7p.parse(msg)
+            hl7p.enableLargeFields(min_size=64 << 10)
+            for source in (msg, msg.encode(), memoryview(msg.encode())):
+                for lazy in (False, True):
+                    hl7d = hl7p.parse(source, lazy=lazy)
+                    reference = hl7d["OBX[2]-5"]
+                    self.assertTrue(isinstance(reference, FieldReference), "Error - the field must be a reference")
+                    output = io.BytesIO()
+                    self.assertEqual(reference.decodeBase64(output, chunk_size=1001), len(document),
+                                     "Error - wrong size of the document")
+                    self.assertEqual(output.getvalue(), document, "Error - the document differs")
+                    self.assertEqual(reference.component(2).text(), "application", "Error - wrong component")
+                    self.assertEqual(str(reference), expected["OBX[2]-5-1"] + "^application^pdf^Base64^" +
+                                     expected["OBX[2]-5-5"], "Error - the text of the field differs")
+                    self.assertEqual(hl7d.toHL7(), msg, "Error - the message must be written back")
+                    self.assertEqual([(k, v) for k, v in hl7d.aliasedItems() if not k.startswith("OBX[2]-5")],
+                                     [(k, v) for k, v in expected.aliasedItems() if not k.startswith("OBX[2]-5")],
+                                     "Error - the other fields must be parsed")
+
+        # the message is not copied
+        tracemalloc.start()
+        hl7d = hl7p.parse(msg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertTrue(peak < len(msg) / 4, "Error - %d bytes allocated for a message of %d" % (peak, len(msg)))
+        self.assertEqual(json.loads(hl7d.toJSON())["OBX[2]-5"], str(hl7d["OBX[2]-5"]), "Error - wrong JSON")
+        self.assertEqual(pickle.loads(pickle.dumps(hl7d))["OBX[2]-5"], str(hl7d["OBX[2]-5"]), "Error - wrong pickle")
+        hl7d.setValue("OBX[2]-5", "removed")
+        self.assertTrue("OBX|5|ED|PDF^Report^L||removed|" in hl7d.toHL7(), "Error - the field must be replaced")
+
+        # the line breaks of the payload, escaped or not, and the spaces are not data
+        encoded = base64.b64encode(document).decode()
+        wrapped = "\\X0D0A\\ ".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+        hl7d = hl7p.parse(msg.replace(encoded, wrapped))
+        for chunk_size in (1001, 4096, 77):
+            output = io.BytesIO()
+            self.assertEqual(hl7d["OBX[2]-5"].decodeBase64(output, chunk_size=chunk_size), len(document),
+                             "Error - wrong size of the wrapped document")
+            self.assertEqual(output.getvalue(), document, "Error - the wrapped document differs")
+
+        hl7p.disableLargeFields()
+        self.assertEqual(hl7p.parse(msg)["OBX[2]-5-4"], "Base64", "Error - the field must be split")
+        self.assertRaises(ValueError, hl7p.enableLargeFields, 0)
+        self.assertRaises(ValueError, hl7p.enableLargeFields, 4)
+
+    def test_large_fields_small_size(self):
+        # the header segment holds the separators, its fields are never references
+        lines = self.lab3StatusChanged.strip().split("\n")
+        lines[0] = lines[0].replace("|OF|", "|%s|" % ("OF" * MIN_SIZE), 1)
+        lines[1] = lines[1].replace("|EVERYMAN^ADAM", "|%s^ADAM" % ("EVERYMAN" * MIN_SIZE), 1)
+        msg = "\r".join(lines)
+        for engine in HL7Parser.ENGINES:
+            hl7p = HL7Parser(engine=engine)
+            expected = hl7p.parse(msg)
+            hl7p.enableLargeFields(min_size=MIN_SIZE)
+            for source in (msg, msg.encode(), memoryview(msg.encode())):
+                hl7d = hl7p.parse(source)
+                self.assertEqual(hl7d["MSH-2"], "^~\\&", "Error - the separators must be kept")
+                self.assertEqual(hl7d["MSH-3"], "OF" * MIN_SIZE, "Error - the header fields must be parsed")
+                self.assertTrue(isinstance(hl7d["PID-5"], FieldReference), "Error - the field must be a reference")
+                self.assertEqual([(k, str(v)) for k, v in hl7d.aliasedItems() if not k.startswith("PID-5")],
+                                 [(k, v) for k, v in expected.aliasedItems() if not k.startswith("PID-5")],
+                                 "Error - the other fields must be parsed")
+                self.assertEqual(hl7d.toHL7(), msg, "Error - the message must be written back")
+
+
+    def test_cli(self):
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+        hl7p = HL7Parser()
+        with tempfile.TemporaryDirectory() as directory:
+            inbox = os.path.join(directory, "inbox")
+            os.makedirs(os.path.join(inbox, "b"))
+            with open(os.path.join(inbox, "a.hl7"), "w") as outf:
+                outf.write("\n".join(msg.strip().replace("\n", "\r") for msg in messages[:3]))
+            with open(os.path.join(inbox, "b", "c.hl7"), "w") as outf:
+                outf.write(messages[3])
+            single = os.path.join(directory, "single.hl7")
+            with open(single, "w") as outf:
+                outf.write(messages[1])
+
+            output = os.path.join(directory, "messages.ndjson")
+            for workers in ("1", "2"):
+                throughput = cliConvert([inbox, single, "-o", output, "-w", workers, "--chunksize", "2", "-q"])
+                with open(output) as inf:
+                    self.assertEqual(inf.read().splitlines(),
+                                     [hl7p.parse(msg).toJSON() for msg in messages + messages[1:2]],
+                                     "Error - the messages must be converted in the order of the inputs")
+                self.assertEqual((throughput.messagesRead, throughput.messagesWritten), (5, 5),
+                                 "Error - wrong counts")
+
+            output = os.path.join(directory, "patients.csv")
+            cliMain([inbox, "-f", "csv", "-t", "MSH-10", "-t", "PID-5-1", "-t", "PID-3", "-o", output, "-q",
+                     "--where", "MSH-4", "in", "Chemistry,GOOD HEALTH HOSPITAL"])
+            with open(output) as inf:
+                self.assertEqual(inf.read().splitlines(), ["MSH-10,PID-5-1,PID-3", "msgOF105,EVERYMAN,",
+                                                           "msgOF105,EVERYMAN,", "000001,EVERYMAN,"],
+                                 "Error - wrong CSV")
+
+            output = os.path.join(directory, "messages.txt")
+            cliMain([single, "-f", "text", "-o", output, "-q", "-w", "1"])
+            with open(output) as inf:
+                self.assertEqual(inf.read(), hl7p.parse(messages[1]).toString() + "\n\n", "Error - wrong text")
+
+            # a bad message in the middle of the input is skipped and reported, the others are converted
+            bad = os.path.join(directory, "bad.hl7")
+            with open(bad, "w") as outf:
+                outf.write("\r".join([messages[0].strip().replace("\n", "\r"), "MSH", messages[3].strip()]))
+            offset = len(messages[0].strip()) + 1
+            for workers in ("1", "2"):
+                stderr = io.StringIO()
+                saved, sys.stderr = sys.stderr, stderr
+                try:
+                    status = cliMain([single, bad, "-o", output, "-w", workers, "--chunksize", "1"])
+                finally:
+                    sys.stderr = saved
+                self.assertEqual(status, 1, "Error - the exit status must be 1 if a message was skipped")
+                with open(output) as inf:
+                    self.assertEqual(inf.read().splitlines(),
+                                     [hl7p.parse(msg).toJSON() for msg in (messages[1], messages[0], messages[3])],
+                                     "Error - the valid messages must be converted")
+                report = stderr.getvalue()
+                self.assertTrue("%s : message at offset %d skipped" % (bad, offset) in report,
+                                "Error - the bad message must be reported with its offset : %s" % report)
+                self.assertTrue("(4 read, 1 errors)" in report, "Error - the summary must count the error")
+            self.assertEqual(cliMain([single, "-o", output, "-q"]), 0, "Error - the exit status must be 0")
+
+
+    def test_diff(self):
+        messages = [self.lab1NewOrder, self.lab3StatusChanged, self.multi, self.a05]
+        update = self.lab3StatusChanged.replace("EVERYMAN", "DOE").replace("msgOF105", "msgOF106")
+        update = update.replace("30264-6", "30264-7") + "\nNTE|1||corrected"
+        for hl7p in (HL7Parser(), HL7Parser(engine="fast", indexformat="%02d")):
+            for msg_a in messages + [update]:
+                for msg_b in messages + [update]:
+                    for ignore in ((), VOLATILE_FIELDS, ["OBX[*]-5", "PID-3[*]-1"]):
+                        expected = hl7p.parse(msg_a).diff(hl7p.parse(msg_b), ignore)
+                        self.assertEqual(hl7p.diff(msg_a, msg_b, ignore), expected,
+                                         "Error - the raw messages must give the differences of the dictionaries")
+                        self.assertEqual(hl7p.parse(msg_a, lazy=True).diff(hl7p.parse(msg_b, lazy=True), ignore),
+                                         expected, "Error - the lazy dictionaries must give the same differences")
+                    self.assertEqual(bool(hl7p.diff(msg_a, msg_b)), msg_a != msg_b, "Error - wrong differences")
+
+        hl7p = HL7Parser()
+        diff = hl7p.diff(self.lab3StatusChanged, update.encode(), VOLATILE_FIELDS)
+        self.assertEqual(diff.changed, {"PID[1]-5-1": ("EVERYMAN", "DOE"), "OBX[4]-3-1": ("30264-6", "30264-7")},
+                         "Error - wrong changed values")
+        self.assertEqual((diff.added, diff.removed), ({"NTE[1]-1": "1", "NTE[1]-3": "corrected"}, {}),
+                         "Error - wrong added values")
+        self.assertEqual(hl7p.diff(self.lab3StatusChanged, update).changed["MSH[1]-10"], ("msgOF105", "msgOF106"),
+                         "Error - the volatile fields must be compared by default")
+        self.assertEqual(len(hl7p.diff(update, self.lab3StatusChanged, ["MSH-10", "PID-5", "OBX[*]-3"]).removed), 2,
+                         "Error - the values of the second message are removed")
+
+        # a field with subcomponents and no components : PID-2-3 is in the first component
+        msg_a = "MSH|^~\\&|APP|FAC|||20240101||ADT^A01|1|P|2.5\rPID|1|&&x&"
+        msg_b = msg_a.replace("&&x&", "&&y&")
+        for diff in (hl7p.diff(msg_a, msg_b, ["PID-2-1"]), hl7p.parse(msg_a).diff(hl7p.parse(msg_b), ["PID-2-1"])):
+            self.assertFalse(diff, "Error - PID-2-1 ignores the subcomponents of PID-2")
+        for diff in (hl7p.diff(msg_a, msg_b, ["PID-2-3"]), hl7p.parse(msg_a).diff(hl7p.parse(msg_b), ["PID-2-3"])):
+            self.assertEqual(diff.changed, {"PID[1]-2-3": ("x", "y")}, "Error - PID-2 has no third component")
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,4 +1,8 @@
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    # no console script without setuptools : python -m hl7tersely
+    from distutils.core import setup
 
 
 LONG_DESCRIPTION = """
@@ -15,7 +19,10 @@ Released under MIT Licence.
 setup(
     name='hl7tersely',
     version='1.3',
-    packages=['hl7tersely'],
+    packages=['hl7tersely', 'hl7tersely.benchmark'],
+    entry_points={
+        'console_scripts': ['hl7tersely = hl7tersely.hl7cli:main'],
+    },
     test_suite='hl7tersely.test',
     url='http://github.com/flrt/hl7tersely',
     license='MIT',